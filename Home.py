@@ -1,10 +1,14 @@
 # Import library
 import streamlit as st
 from streamlit_extras.switch_page_button import switch_page
+from spad.startup import prewarm
 
 # Set Streamlit page configuration
 st.set_page_config(layout="wide")
 
+# Start importing heavy modules and loading the detection models in the background
+prewarm()
+
 # Customize page title
 st.markdown("<h1 style='font-family: Bahnschrift;'>Spoof Audio Detection (SpAD)</h1>", unsafe_allow_html=True)
 
@@ -1,75 +1,291 @@
 import streamlit as st
 import os
+import contextvars
+import hashlib
 import time
-import joblib
-import librosa
-import scipy.io
-import subprocess
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
 import soundfile as sf
-import plotly.express as px
-
-# Function to get and resample audio data
+from spad.models import get_model, get_model_pair, get_scaler, standardize
+from spad.cache import result_cache, result_key
+from spad.cascade import complete_features, get_cascade, screen_frames
+from spad.waveform import summarize_waveform
+from spad.extractors import get_extractor_pool
+from spad.matlab import ExtractionError, ExtractionTimeout, session_workspace
+from spad.features import load_audio
+from spad.jobs import JobCancelled, detection_jobs
+from spad.pipeline import LABELS, get_raw_forest
+from spad.service import ServiceClient, ServiceError
+from spad.resample import downmix, resample
+from spad.segments import score_segments
+from spad.startup import lazy_import, prewarm
+from spad.streaming import is_long_recording
+from spad.telemetry import count, new_request, resume_request, span, start_metrics_server
+
+# pandas is only needed for the batch results table
+pd = lazy_import("pandas")
+
+# Files scored at once in batch mode; extraction itself is bounded by the extractor pool
+BATCH_WORKERS = int(os.environ.get("SPAD_BATCH_WORKERS", 0)) or os.cpu_count() or 1
+BATCH_COLUMNS = ["file", "label", "prediction", "duration", "seconds", "error"]
+
+# Function to get audio data as 16 kHz mono float32, downmixing before resampling
 def get_sound_data(path, sr=16000):
-    data, fsr = sf.read(path)
-    data_16k = librosa.resample(data.T, orig_sr=fsr, target_sr=sr)
-    if len(data_16k.shape) > 1:
-        data_16k = np.average(data_16k, axis=0)
-    return data_16k, sr
-
-# Function to plot waveform
-def plot_waveform(audio_data, sample_rate):
-    time = np.arange(0, len(audio_data)) / sample_rate
-    fig = px.line(x=time, y=audio_data, labels={'x': 'Time (s)', 'y': 'Amplitude'})    
+    with span("decode"):
+        data, fsr = sf.read(path, dtype='float32', always_2d=True)
+    with span("resample"):
+        return resample(downmix(data), fsr, sr), sr
+
+# Function to decode samples [first, last) of the upload at the waveform's rate, for zooms finer than the pyramid
+def read_waveform_window(audio_path, sr, first, last):
+    info = sf.info(audio_path)
+    pad = int(info.samplerate) // 100  # a little context on each side for the resampling filter
+    start = max(0, int(first * info.samplerate / sr) - pad)
+    stop = int(np.ceil(last * info.samplerate / sr)) + pad
+    data, fsr = sf.read(audio_path, start=start, stop=stop, dtype='float32', always_2d=True)
+    y = resample(downmix(data), fsr, sr)
+    offset = first - int(round(start * sr / fsr))
+    return y[offset:offset + last - first]
+
+# Function to plot the min/max envelope of the selected time range, optionally with the segment spoof probability
+def plot_waveform(waveform, timeline=None, time_range=None, audio_path=None):
+    # plotly is only needed once a file is uploaded; prewarm() has usually imported it by then
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    start, end = time_range or (0, waveform["duration"])
+    read_window = None
+    if audio_path is not None:
+        read_window = lambda first, last: read_waveform_window(audio_path, waveform["sample_rate"], first, last)
+    times, amplitude = waveform["pyramid"].view(start, end, read_window=read_window)
+    fig = px.line(x=times, y=amplitude, labels={'x': 'Time (s)', 'y': 'Amplitude'})
+    fig.update_xaxes(range=[start, end])
+    if timeline is not None:
+        centers = (timeline["start"] + timeline["end"]) / 2
+        fig.add_trace(go.Scatter(x=centers, y=timeline["spoof_probability"], name="Spoof probability",
+                                 yaxis="y2", line=dict(color="red", shape="spline")))
+        fig.update_layout(yaxis2=dict(title="Spoof probability", overlaying="y", side="right", range=[0, 1]),
+                          showlegend=False)
     st.plotly_chart(fig, use_container_width=True)
 
-# Function to extract features using MATLAB script
-def extract_features(audio_path):
-    mat_path = 'features.mat'
-
-    # Run MATLAB with the script file and pass arguments
-    subprocess.run(["matlab", "-nosplash", "-nodesktop", "-r", f"feature_extraction('{audio_path}', '{mat_path}')"])
-
-    with st.spinner("Analyzing audio patterns..."):
-        # Wait until the "features.mat" file is created
-        max_wait_time = 30  # Maximum wait time in seconds
-        waited_time = 0
-
-        while not os.path.exists("features.mat") and waited_time < max_wait_time:
-            time.sleep(1)  # Wait for 1 second
-            waited_time += 1
-
-        # Check if the "features.mat" file is now available
-        if os.path.exists("features.mat"):
-            # Load the features from the MAT file
-            mat_contents = scipy.io.loadmat(mat_path)
-            hybrid_features = mat_contents['hybridFeatures']
-
-        else:
-            st.warning("Error: Unable to generate features. Please try uploading the audio file again.")
-            
-    return hybrid_features
+# Function to score overlapping segments so partially spoofed regions can be located
+def get_spoof_timeline(audio_path):
+    with st.spinner("Locating spoofed segments..."):
+        with span("segments"):
+            audio_data, sample_rate = load_audio(audio_path)
+            return score_segments(audio_data, sample_rate)
+
+# Function to screen a clip with the MFCC screen (SPAD_CASCADE=1); returns (prediction, features)
+def screen_audio(audio_path):
+    # (decision, None) when the screen answers, (None, full vector) when it escalates, (None, None) when not screened
+    cascade = get_cascade() if os.environ.get("SPAD_CASCADE") else None
+    if cascade is None or is_long_recording(audio_path):
+        return None, None
+    with span("screen"):
+        audio_data, _ = load_audio(audio_path)
+        try:
+            frames, spectrum, mfcc = screen_frames(audio_data)
+        except ValueError:
+            # Too short to frame; the full path reports it
+            return None, None
+        decision = int(cascade.screen(mfcc.mean(axis=0))[0])
+    count("screen", outcome="escalated" if decision == -1 else "answered")
+    if decision != -1:
+        return decision, None
+
+    # Escalated: finish the full vector from the screen's spectra instead of decoding again on the pool
+    with span("features", source="screen"):
+        return None, complete_features(frames, spectrum, mfcc)
+
+# Function to extract features on the shared pool of warm extractor workers; cancelling the job cancels the extraction
+def extract_features(job, audio_path):
+    pool = get_extractor_pool()
+    try:
+        with span("extraction_wait"):
+            return job.wait_for(pool.submit(audio_path), pool.cancel)
+    except ExtractionTimeout:
+        count("extraction_timeouts")
+        raise
+    except ExtractionError:
+        count("extraction_failures")
+        raise
+
+# Function to extract features and predict on the inference service (python -m spad.service)
+def predict_with_service(audio_bytes, file_extension):
+    try:
+        with span("service"):
+            result = ServiceClient(os.environ["SPAD_SERVICE_URL"]).predict_audio(audio_bytes, file_extension)
+    except ServiceError:
+        count("service_errors")
+        raise
+    return [result["features"]], result["prediction"]
 
 # Function to normalize the extracted features
-def normalize_features(features):
-    # Load StandardScaler()
-    scaler = joblib.load("Scaler")
+def normalize_features(features, scaler=None):
+    # Get the shared StandardScaler()
+    if scaler is None:
+        scaler = get_scaler()
 
     # Normalize the input features based on the training data statistics
-    normalized_features = scaler.transform(features)
+    with span("scale"):
+        normalized_features = standardize(scaler, features)
 
     return normalized_features
 
 # Function to predict class using machine learning model
-def predict_class(features):
-    # Load the trained model
-    model = joblib.load("RandomForestClassifier")
-    
+def predict_class(features, model=None):
+    # Get the shared trained model
+    if model is None:
+        model = get_model()
+
     # Make predictions
-    prediction = model.predict(features)
+    with span("predict"):
+        prediction = model.predict(features)
 
     return prediction[0]
 
+# Function to screen, extract and predict one saved upload; set_stage(stage, progress) reports progress
+def detect_audio(job, audio_path, audio_bytes, file_extension, set_stage=None):
+    set_stage = set_stage or (lambda stage, progress: job.raise_if_cancelled())
+
+    set_stage("Screening audio", 0.1)
+    prediction, features = screen_audio(audio_path)
+    if prediction is None and features is None and os.environ.get("SPAD_SERVICE_URL"):
+        # Let the inference service extract and predict
+        set_stage("Analyzing audio patterns", 0.2)
+        features, prediction = predict_with_service(audio_bytes, file_extension)
+    elif prediction is None:
+        if features is None:
+            # Extract GTCC and MFCC features
+            set_stage("Analyzing audio patterns", 0.2)
+            features = extract_features(job, audio_path)
+
+        # Predict with the compiled or compact forest (scaler built in) when it matches the served model
+        set_stage("Predicting", 0.8)
+        raw_forest = get_raw_forest()
+        if raw_forest is not None:
+            with span("predict", forest=type(raw_forest).__name__):
+                prediction = raw_forest.predict(features)[0]
+        else:
+            # Scaler and model from the same published version
+            scaler, model = get_model_pair()
+
+            # Normalize the input features based on the training data statistics
+            normalized_features = normalize_features(features, scaler)
+
+            # Predict class using the machine learning model
+            prediction = predict_class(normalized_features, model)
+
+    return features, int(prediction)
+
+# Function run as a background job: screen, extract and predict one upload, then cache the result
+def run_detection(job, audio_bytes, file_extension, cache_key, waveform, timelines):
+    # The job has its own copy of the upload, removed however the job ends
+    with session_workspace() as workdir:
+        audio_path = os.path.join(workdir, f"uploaded_audio.{file_extension}")
+        with open(audio_path, "wb") as f:
+            f.write(audio_bytes)
+        features, prediction = detect_audio(job, audio_path, audio_bytes, file_extension, job.set_stage)
+
+    # Keep a timeline the session computed while the job ran
+    job.set_stage("Saving result", 0.95)
+    result_cache.put(cache_key, {"features": features, "prediction": prediction, "waveform": waveform,
+                                 "timeline": timelines.pop(cache_key, None)})
+    return prediction
+
+# Function to score one file of a batch; only this file's bytes and samples are in memory while it runs
+def score_upload(job, uploaded_file):
+    job.raise_if_cancelled()
+    start = time.perf_counter()
+    row = dict.fromkeys(BATCH_COLUMNS)
+    row["file"] = uploaded_file.name
+    try:
+        audio_bytes = uploaded_file.getvalue()
+        cache_key = result_key(audio_bytes)
+        cached_result = result_cache.get(cache_key)
+        count("result_cache", outcome="miss" if cached_result is None else "hit")
+
+        file_extension = os.path.splitext(uploaded_file.name)[-1].replace(".", "")
+        with session_workspace() as workdir:
+            audio_path = os.path.join(workdir, f"uploaded_audio.{file_extension}")
+            with open(audio_path, "wb") as f:
+                f.write(audio_bytes)
+            row["duration"] = round(sf.info(audio_path).duration, 2)
+
+            if cached_result is None:
+                features, prediction = detect_audio(job, audio_path, audio_bytes, file_extension)
+                # No waveform is kept for batch files; the single-file view draws it when opened
+                result_cache.put(cache_key, {"features": features, "prediction": prediction, "waveform": None,
+                                             "timeline": None})
+            else:
+                prediction = int(cached_result["prediction"])
+        row.update(prediction=prediction, label=LABELS[prediction])
+    except JobCancelled:
+        raise
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["seconds"] = round(time.perf_counter() - start, 3)
+    return row
+
+# Function run as a background job: score every file of a batch on a bounded pool, reporting rows as they finish
+def run_batch(job, uploaded_files):
+    executor = ThreadPoolExecutor(max_workers=min(BATCH_WORKERS, len(uploaded_files)), thread_name_prefix="spad-batch")
+    try:
+        # Each file runs in a copy of the job's context so its spans and counts keep the request id
+        futures = [executor.submit(contextvars.copy_context().run, score_upload, job, uploaded_file)
+                   for uploaded_file in uploaded_files]
+        for done, future in enumerate(as_completed(futures), 1):
+            job.add_row(future.result())
+            job.set_stage(f"Scored {done} of {len(futures)} files", done / len(futures))
+    finally:
+        # Files not started yet are dropped when the batch is cancelled or superseded
+        executor.shutdown(wait=True, cancel_futures=True)
+    return job.rows()
+
+# Function to show batch results as a sortable table
+def show_batch_table(rows):
+    table = pd.DataFrame(rows, columns=BATCH_COLUMNS)
+    st.dataframe(table, use_container_width=True, hide_index=True)
+    return table
+
+# Function to get an id for this browser session; detection jobs are tracked per session
+def get_session_id():
+    return st.session_state.setdefault("spad_session_id", uuid.uuid4().hex)
+
+# Function to count each upload once; reruns (zooming, toggles, a finished job) carry on its request id
+def track_request(key, **fields):
+    if st.session_state.get("spad_request_key") == key:
+        resume_request(st.session_state["spad_request_id"])
+        return False
+    st.session_state["spad_request_key"] = key
+    st.session_state["spad_request_id"] = new_request(**fields)
+    return True
+
+# Function to show the detection job's progress, rerunning the page once it has finished
+@st.fragment(run_every=0.5)
+def show_progress(job):
+    job.touch()
+    if job.done:
+        st.rerun()
+    st.progress(job.progress, text=f"{job.stage}...")
+
+# Function to fill the batch table as files finish, rerunning the page once the batch is done
+@st.fragment(run_every=1.0)
+def show_batch_progress(job, num_files):
+    job.touch()
+    if job.done:
+        st.rerun()
+    rows = job.rows()
+    st.progress(len(rows) / num_files, text=f"Scored {len(rows)} of {num_files} files...")
+    show_batch_table(rows)
+
+# Import heavy modules, load the models and warm the extractor in the background so the first prediction does not wait
+prewarm()
+
+# Export stage timings and counters of every session (Prometheus text on SPAD_METRICS_PORT)
+start_metrics_server()
+
 # Customize the sidebar
 howTo = """
 1. Upload your audio file
@@ -152,79 +368,151 @@ style = """
 # Apply styles
 st.markdown(style, unsafe_allow_html=True)
 
-# Users upload audio file
+# Users upload one audio file, or many in batch mode
 audio_formats = ["wav", "mp3", "ogg"] 
-uploaded_file = st.file_uploader("Choose an audio file", type=audio_formats)
+batch_mode = st.toggle("Batch mode: score many files at once")
+if batch_mode:
+    uploaded_files = st.file_uploader("Choose audio files", type=audio_formats, accept_multiple_files=True)
+    uploaded_file = None
+else:
+    uploaded_files = []
+    uploaded_file = st.file_uploader("Choose an audio file", type=audio_formats)
+
+if uploaded_file is None and not uploaded_files:
+    # The upload was removed: stop its detection and free its resources
+    detection_jobs.cancel(get_session_id())
+
+if uploaded_files:
+    # Changing the selection supersedes the running batch; files already scored come from the result cache
+    batch_key = hashlib.sha256("|".join(f.file_id for f in uploaded_files).encode()).hexdigest()
+    track_request(batch_key, page="detection", mode="batch")
+    job = detection_jobs.submit(get_session_id(), batch_key, run_batch, list(uploaded_files))
+    if not job.done:
+        show_batch_progress(job, len(uploaded_files))
+        st.stop()
+    if job.error is not None:
+        detection_jobs.cancel(get_session_id())
+        st.warning("Error: Unable to score the batch. Please try uploading the audio files again.")
+        st.stop()
+
+    rows = job.rows()
+    failed = sum(row["error"] is not None for row in rows)
+    spoofed = sum(row["prediction"] == 0 for row in rows)
+    st.markdown(f"**{len(rows)} files scored:** {spoofed} spoof, {len(rows) - spoofed - failed} bona fide"
+                + (f", {failed} failed" if failed else ""))
+    table = show_batch_table(rows)
+    st.download_button("Download results as CSV", table.to_csv(index=False), file_name="spad_batch_results.csv",
+                       mime="text/csv")
 
 if uploaded_file is not None:
     st.audio(uploaded_file, format=f'audio/{os.path.splitext(uploaded_file.name)[-1][1:]}', start_time=0)
 
-    # Save the uploaded file temporarily
-    audio_path = "uploaded_audio" 
-    file_extension = os.path.splitext(uploaded_file.name)[-1].replace(".", "")
-    audio_path += f".{file_extension}" 
-
-    with open(audio_path, "wb") as f:
-        f.write(uploaded_file.getvalue())
-
-    # Get audio data
-    audio_data, sample_rate = get_sound_data(audio_path)
-
-    # Create tabs after audio upload
-    tab1, tab2 = st.tabs(["Waveform", "Prediction Result"])
-    
-    # Tab 1: Waveform
-    with tab1:
-        st.markdown("<h3 style='font-family: Bahnschrift;'>Waveform of Your Audio</h3>", unsafe_allow_html=True)
+    # Look up earlier results for the same audio content and model version
+    audio_bytes = uploaded_file.getvalue()
+    cache_key = result_key(audio_bytes)
+    new_upload = track_request(cache_key, page="detection", mode="single")
+    with span("cache_lookup"):
+        cached_result = result_cache.get(cache_key)
+    if new_upload:
+        count("result_cache", outcome="miss" if cached_result is None else "hit")
+
+    with session_workspace() as workdir:
+        # Save the uploaded file in this session's private workspace
+        file_extension = os.path.splitext(uploaded_file.name)[-1].replace(".", "")
+        audio_path = os.path.join(workdir, f"uploaded_audio.{file_extension}")
+
+        with open(audio_path, "wb") as f:
+            f.write(audio_bytes)
+
+        if cached_result is None or cached_result["waveform"] is None:
+            # Get audio data (batch results are cached without a waveform)
+            audio_data, sample_rate = get_sound_data(audio_path)
+            with span("waveform"):
+                waveform = summarize_waveform(audio_data, sample_rate)
+            del audio_data
+        else:
+            waveform = cached_result["waveform"]
 
-        with st.container(border=True):
-            plot_waveform(audio_data, sample_rate)
+        # Create tabs after audio upload
+        tab1, tab2 = st.tabs(["Waveform", "Prediction Result"])
         
-    # Tab 2: Prediction Result
-    with tab2:
-        # Extract features using MATLAB
-        features = extract_features(audio_path)
-
-        # Normalize the input features based on the training data statistics
-        normalized_features = normalize_features(features) 
-
-        # Predict class using the machine learning model
-        prediction = predict_class(normalized_features)
-
-        # Display the prediction
-        if prediction == 0:
-            st.markdown("<h3 style='font-family: Bahnschrift';>Spoof Detected</h3>", unsafe_allow_html=True)
-
-            col1, col2 = st.columns([1.15, 5])
-            # Image column
-            with col1:
-                st.image("https://i.imgur.com/ZhWCcT1.png", width=135)  
-
-            # Text column
-            with col2:
-                st.write("")
-                st.write("")
-                spoof = """Uh-oh! This audio file seems to be crafted by a mischievous machine.
-                Maybe a sneaky robot tried to trick us!"""
-                st.markdown(f"<p style='text-align: justify; font-size: 17px;'>{spoof}</p>", unsafe_allow_html=True)
-
-        else:
-            st.markdown("<h3 style='font-family: Bahnschrift;'>Bona Fide Voice</h3>", unsafe_allow_html=True)
-            st.balloons()
-
-            col1, col2 = st.columns([1.1, 5])
-            # Image column
-            with col1:
-                st.image("https://i.imgur.com/vRqhj7A.png", width=115) 
-
-            # Text column
-            with col2:
-                st.write("")
-                st.write("")
-                bonafide = """Yay! Congratulations! This audio file is likely the sweet sound of a genuine human voice.
-                It seems like a wonderful human serenade."""
-                st.markdown(f"<p style='text-align: justify; font-size: 17px;'>{bonafide}</p>", unsafe_allow_html=True)
-
-        # Remove the temporary audio file
-        os.remove(audio_path)
-        os.remove("features.mat")
+        # Tab 1: Waveform
+        with tab1:
+            st.markdown("<h3 style='font-family: Bahnschrift;'>Waveform of Your Audio</h3>", unsafe_allow_html=True)
+
+            # Optionally overlay the spoof probability of overlapping segments
+            # Timelines computed before the result is cached wait here for the detection job to save them
+            timelines = st.session_state.setdefault("spad_timelines", {})
+            timeline = None
+            if st.toggle("Show spoof probability over time"):
+                timeline = (cached_result or {}).get("timeline")
+                if timeline is None:
+                    timeline = timelines.get(cache_key)
+                if timeline is None:
+                    timeline = get_spoof_timeline(audio_path)
+                if cached_result is None:
+                    timelines[cache_key] = timeline
+                elif cached_result.get("timeline") is None:
+                    timelines.pop(cache_key, None)
+                    result_cache.put(cache_key, dict(cached_result, timeline=timeline))
+
+            # Zooming in fetches finer envelope levels so plot cost stays flat for long clips
+            time_range = None
+            if waveform["duration"] > 1:
+                time_range = st.slider("Zoom (s)", 0.0, float(waveform["duration"]),
+                                       (0.0, float(waveform["duration"])), step=0.01)
+
+            with st.container(border=True):
+                plot_waveform(waveform, timeline, time_range, audio_path)
+            
+        # Tab 2: Prediction Result
+        with tab2:
+            if cached_result is None:
+                # Detect in the background; a new upload cancels this job and the waveform is not held up
+                job = detection_jobs.submit(get_session_id(), cache_key, run_detection, audio_bytes, file_extension,
+                                            cache_key, waveform, timelines)
+                if not job.done:
+                    show_progress(job)
+                    st.stop()
+                if job.error is not None:
+                    # Forget the failed job so the next upload or interaction retries
+                    detection_jobs.cancel(get_session_id())
+                    st.warning("Error: Unable to generate features. Please try uploading the audio file again.")
+                    st.stop()
+                prediction = job.result
+            else:
+                prediction = cached_result["prediction"]
+
+            # Display the prediction
+            if prediction == 0:
+                st.markdown("<h3 style='font-family: Bahnschrift';>Spoof Detected</h3>", unsafe_allow_html=True)
+
+                col1, col2 = st.columns([1.15, 5])
+                # Image column
+                with col1:
+                    st.image("https://i.imgur.com/ZhWCcT1.png", width=135)  
+
+                # Text column
+                with col2:
+                    st.write("")
+                    st.write("")
+                    spoof = """Uh-oh! This audio file seems to be crafted by a mischievous machine.
+                    Maybe a sneaky robot tried to trick us!"""
+                    st.markdown(f"<p style='text-align: justify; font-size: 17px;'>{spoof}</p>", unsafe_allow_html=True)
+
+            else:
+                st.markdown("<h3 style='font-family: Bahnschrift;'>Bona Fide Voice</h3>", unsafe_allow_html=True)
+                st.balloons()
+
+                col1, col2 = st.columns([1.1, 5])
+                # Image column
+                with col1:
+                    st.image("https://i.imgur.com/vRqhj7A.png", width=115) 
+
+                # Text column
+                with col2:
+                    st.write("")
+                    st.write("")
+                    bonafide = """Yay! Congratulations! This audio file is likely the sweet sound of a genuine human voice.
+                    It seems like a wonderful human serenade."""
+                    st.markdown(f"<p style='text-align: justify; font-size: 17px;'>{bonafide}</p>", unsafe_allow_html=True)
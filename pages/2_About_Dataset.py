@@ -1,51 +1,17 @@
 # Import libraries
 import streamlit as st
-import librosa
-import numpy as np
-import pandas as pd
-import librosa.display
-import soundfile as sf
-import plotly.express as px
-import matplotlib.pyplot as plt
-from matplotlib.pyplot import specgram
-
-# Function to get audio data
-def get_sound_data(path):
-    data, sr = sf.read(path)
-    return data, sr
-
-# Function to plot waveform
-def plot_waveform(data, title, ax):
-    ax.set_title(title)
-    ax.set_xlabel('Time (s)')
-    ax.set_ylabel('Amplitude')
-    librosa.display.waveshow(data[0], sr=data[1], color='r', alpha=0.7, ax=ax)
-
-# Function to plot spectrogram
-def plot_spectrogram(data, title, ax):
-    ax.set_title(title)
-    Sxx, f, t, im = ax.specgram(data[0], Fs=data[1])
-    ax.set_xlabel('Time (s)')
-    ax.set_ylabel('Frequency (Hz)')
-    ax.figure.colorbar(im, ax=ax)
-
-# Function to plot mel spectrogram
-def plot_mel_spectrogram(data, title, ax):
-    ax.set_title(title)
-    S = librosa.feature.melspectrogram(y=data[0], sr=data[1], n_mels=128)
-    log_S = librosa.amplitude_to_db(S, ref=np.max)
-    im = librosa.display.specshow(log_S, sr=data[1], x_axis='time', y_axis='mel', ax=ax)
-    ax.set_xlabel('Time (s)')
-    ax.figure.colorbar(im, format='%+02.0f dB', ax=ax)
-
-# Function to plot chroma
-def plot_chroma(data, title, ax):
-    ax.set_title(title)
-    S = librosa.feature.chroma_cqt(y=data[0], sr=data[1])
-    im = librosa.display.specshow(S, sr=data[1], x_axis='time', y_axis='chroma', vmin=0, vmax=1, ax=ax)
-    ax.set_xlabel('Time (s)')
-    ax.figure.colorbar(im, ax=ax)
-    
+from spad.aggregates import load_index
+from spad.renders import SAMPLE_FILES, render_cache
+from spad.startup import lazy_import, prewarm
+from spad.store import load_split
+
+# pandas and plotly are imported when the class distribution section first uses them
+pd = lazy_import("pandas")
+px = lazy_import("plotly.express")
+
+# Warm the detection page in the background when this is the first page served
+prewarm()
+
 # Customize the sidebar
 st.sidebar.markdown("<h1 style='font-family: Bahnschrift;'>Table of Contents</h1>", unsafe_allow_html=True)
 st.sidebar.info("""
@@ -145,53 +111,29 @@ st.markdown("<h2 style='font-family: Bahnschrift;'>Exploratory Data Analysis</h2
 with st.container(border=True):
     st.markdown("<h3 style='font-family: Bahnschrift;'>Audio Visualization</h3>", unsafe_allow_html=True)
 
-    # File paths
-    spoof_path = 'audio_sample/CON_T_0000001.wav'
-    bona_fide_path = 'audio_sample/LA_T_1007571.wav'
-
     # Visualization selection
     visualization_option = st.selectbox(
         "Select Audio Visualization",
         ["Waveform", "Spectrogram", "Mel Spectrogram", "Chroma", "Mel Frequency Cepstral Coefficients", "Gammatone Cepstral Coefficients"]
     )
 
-    # Load audio data
-    audio_data_spoof = get_sound_data(spoof_path)
-    audio_data_bona_fide = get_sound_data(bona_fide_path)
-
-    # Plot selected visualization
-    if visualization_option == "Waveform":
-        fig, ax = plt.subplots(1, 2, figsize=(13, 5))  
-        plot_waveform(audio_data_spoof, "Spoof - Waveform", ax[0])
-        plot_waveform(audio_data_bona_fide, "Bona Fide - Waveform", ax[1])
-        st.markdown("**Waveform** representation provides a visual of the audio signal over time, showcasing the amplitude variations in the audio file.")
+    # Descriptions of the visualizations computed from the sample clips
+    rendered_visualizations = {
+        "Waveform": ("waveform", "**Waveform** representation provides a visual of the audio signal over time, showcasing the amplitude variations in the audio file."),
+        "Spectrogram": ("spectrogram", "**Spectrogram** illustrates the frequency content of the audio signal across time, revealing patterns and characteristics in the audio spectrum."),
+        "Mel Spectrogram": ("mel", "**Mel Spectrogram** highlights the distribution of energy in different frequency bands over time, offering insights into the audio's mel-frequency content."),
+        "Chroma": ("chroma", "**Chroma** representation captures the tonal content of the audio, emphasizing the presence of musical notes and harmonics throughout the recording."),
+    }
+
+    # Plot selected visualization; panels come from the render cache (spad/renders.py)
+    if visualization_option in rendered_visualizations:
+        transform, description = rendered_visualizations[visualization_option]
+        st.markdown(description)
         st.write("")
-        st.pyplot(fig)
+        columns = st.columns([1,1])
+        for column, (label, path) in zip(columns, SAMPLE_FILES.items()):
+            column.image(render_cache.image(path, transform, f"{label} - {visualization_option}"))
 
-    elif visualization_option == "Spectrogram":
-        fig, ax = plt.subplots(1, 2, figsize=(13, 5))  
-        plot_spectrogram(audio_data_spoof, "Spoof - Spectrogram", ax[0])
-        plot_spectrogram(audio_data_bona_fide, "Bona Fide - Spectrogram", ax[1])
-        st.markdown("**Spectrogram** illustrates the frequency content of the audio signal across time, revealing patterns and characteristics in the audio spectrum.")
-        st.write("")
-        st.pyplot(fig)
-        
-    elif visualization_option == "Mel Spectrogram":
-        fig, ax = plt.subplots(1, 2, figsize=(13, 5))  
-        plot_mel_spectrogram(audio_data_spoof, "Spoof - Mel Spectrogram", ax[0])
-        plot_mel_spectrogram(audio_data_bona_fide, "Bona Fide - Mel Spectrogram", ax[1])
-        st.markdown("**Mel Spectrogram** highlights the distribution of energy in different frequency bands over time, offering insights into the audio's mel-frequency content.")
-        st.write("")
-        st.pyplot(fig)
-        
-    elif visualization_option == "Chroma":
-        fig, ax = plt.subplots(1, 2, figsize=(13, 5))  
-        plot_chroma(audio_data_spoof, "Spoof - Chroma", ax[0])
-        plot_chroma(audio_data_bona_fide, "Bona Fide - Chroma", ax[1])
-        st.markdown("**Chroma** representation captures the tonal content of the audio, emphasizing the presence of musical notes and harmonics throughout the recording.")
-        st.write("")
-        st.pyplot(fig)
-        
     elif visualization_option == "Mel Frequency Cepstral Coefficients":
         st.markdown("**Mel Frequency Cepstral Coefficients** representation transforms the audio signal into a cepstral domain, capturing the mel-frequency characteristics.")
         st.write("")
@@ -240,39 +182,29 @@ with st.expander("Learn more about MFCC and GTCC"):
     st.markdown("<p style='text-align: center;'><i>MFCC and GTCC block diagram. (The MathWorks Inc., 2020).</i></p>", unsafe_allow_html=True)
 st.write("")
 
-# Load GTCC-MFCC data
-col_names = ['LogEnergy'] + [f'GTCC{i}' for i in range(13)] + ['LogEnergy_delta'] + [f'GTCC{i}_delta' for i in range(13)] + ['LogEnergy_delta-delta'] + [f'GTCC{i}_delta-delta' for i in range(13)] + [f'MFCC{i}' for i in range(13)] + [f'MFCC{i}_delta' for i in range(13)] + [f'MFCC{i}_delta-delta' for i in range(13)] + ['label']
-
-train = pd.read_csv("extracted_features/GTCC-MFCC_train.csv", header=None, names=col_names)
-val = pd.read_csv("extracted_features/GTCC-MFCC_val.csv", header=None, names=col_names)
-test = pd.read_csv("extracted_features/GTCC-MFCC_test.csv", header=None, names=col_names)
-
-# Show sample training data if toggled
+# Show sample training data if toggled (GTCC-MFCC sets are memory-mapped column stores, see spad/store.py)
 if st.toggle('Show sample raw data after feature extraction (GTCC & MFCC)'):
-    st.dataframe(train)
+    st.dataframe(load_split('train'))
 st.write("")
 
 # Plot class distribution
 with st.container(border=True):
     st.markdown("<h3 style='font-family: Bahnschrift;'>Distribution of Classes</h3>", unsafe_allow_html=True)
 
-    # Combine datasets and map labels to 'spoof' and 'bona fide'
-    data = pd.concat([train, val, test], keys=['Train', 'Validation', 'Test'], names=['Set'])
-    data = data.reset_index()
-    data['label'] = data['label'].map({0: 'Spoof (0)', 1: 'Bona fide (1)'})
+    # Class counts and durations come from the precomputed aggregate index (spad/aggregates.py)
+    dataset_index = load_index()
+    splits = {"Train": "train", "Validation": "val", "Test": "test"}
 
     # Sidebar for selecting the dataset
     selected_set = st.selectbox("Select Dataset", ["All", "Train", "Validation", "Test"])
 
-    # Filter the data based on the selected dataset
-    if selected_set == "All":
-        selected_data = data
-    else:
-        selected_data = data[data['Set'] == selected_set]
-
-    # Count the number of samples for each class
-    class_counts = selected_data['label'].value_counts().reset_index()
-    class_counts.columns = ['label', 'count']
+    # Sum the class counts of the selected splits
+    selected_splits = list(splits.values()) if selected_set == "All" else [splits[selected_set]]
+    split_counts = [dataset_index["class_counts"].get(split, {}) for split in selected_splits]
+    class_counts = pd.DataFrame({
+        'label': ['Spoof (0)', 'Bona fide (1)'],
+        'count': [sum(counts.get(name, 0) for counts in split_counts) for name in ('spoof', 'bona_fide')],
+    })
 
     # Interactive distribution plot with Plotly
     fig_class = px.bar(class_counts, x='label', y='count', color='label',
@@ -283,6 +215,14 @@ with st.container(border=True):
     # Show the Plotly figure
     st.plotly_chart(fig_class, use_container_width=True)
 
+    # Duration statistics per class across all splits
+    durations = dataset_index["durations"]
+    if durations:
+        st.caption(" · ".join(
+            f"{name.replace('_', ' ').title()}: {stats['count']:,} clips, {stats['total_hours']:.1f} h, "
+            f"median {stats['median']:.2f} s (range {stats['min']:.2f}–{stats['max']:.2f} s)"
+            for name, stats in durations.items() if name != "all"))
+
 # Intro to smote
 st.write("")
 smote = """
@@ -1,5 +1,9 @@
 # Import library
 import streamlit as st
+from spad.startup import prewarm
+
+# Warm the detection page in the background when this is the first page served
+prewarm()
 
 # Customize the sidebar
 st.sidebar.markdown("<h1 style='font-family: Bahnschrift;'>Table of Contents</h1>", unsafe_allow_html=True)
@@ -0,0 +1 @@
+"""Shared building blocks for the Spoof Audio Detection (SpAD) app."""
@@ -0,0 +1,100 @@
+"""Precomputed dataset aggregates for the About Dataset page.
+
+The page only needs per-split class counts and a handful of duration
+statistics, so they are computed once per dataset version and kept in a small
+JSON index. The version is the (mtime, size) of every source file: the feature
+set of each split and ``audioDuration.csv``. The next read after any of them
+changes rebuilds the index, and every other read is a single small file.
+"""
+import json
+import os
+
+import numpy as np
+
+from spad.store import FEATURE_SET, FEATURES_DIR, SPLITS, open_split, store_path
+
+INDEX_PATH = os.environ.get("SPAD_DATASET_INDEX", os.path.join(".cache", "dataset_index.json"))
+DURATION_FILE = "audioDuration.csv"
+CLASS_NAMES = {0: "spoof", 1: "bona_fide"}
+
+
+def _source_files(directory=FEATURES_DIR):
+    files = [os.path.join(directory, DURATION_FILE)]
+    for split in SPLITS:
+        csv_path = os.path.join(directory, f"{FEATURE_SET}_{split}.csv")
+        files += [csv_path, store_path(csv_path)]
+    return files
+
+
+# Function to stamp every source file that exists, so any change gives a new version
+def dataset_version(directory=FEATURES_DIR):
+    version = {}
+    for path in _source_files(directory):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        version[os.path.basename(path)] = [stat.st_mtime_ns, stat.st_size]
+    return version
+
+
+def _duration_stats(durations):
+    quartiles = np.percentile(durations, [25, 50, 75])
+    return {
+        "count": int(len(durations)),
+        "total_hours": float(durations.sum() / 3600),
+        "mean": float(durations.mean()),
+        "std": float(durations.std()),
+        "min": float(durations.min()),
+        "q1": float(quartiles[0]),
+        "median": float(quartiles[1]),
+        "q3": float(quartiles[2]),
+        "max": float(durations.max()),
+    }
+
+
+# Function to compute class counts per split and duration statistics per class
+def build_index(directory=FEATURES_DIR):
+    # Stores are opened first so any stale ones are rebuilt before the version is taken
+    class_counts = {}
+    for split in SPLITS:
+        try:
+            labels = open_split(split, directory=directory).column('label')
+        except FileNotFoundError:
+            continue
+        counts = np.bincount(labels, minlength=len(CLASS_NAMES))
+        class_counts[split] = {CLASS_NAMES[label]: int(counts[label]) for label in CLASS_NAMES}
+
+    durations = {}
+    duration_path = os.path.join(directory, DURATION_FILE)
+    if os.path.exists(duration_path):
+        import pandas as pd
+
+        table = pd.read_csv(duration_path)
+        for label, group in table.groupby("Label"):
+            durations[label] = _duration_stats(group["duration"].to_numpy())
+        durations["all"] = _duration_stats(table["duration"].to_numpy())
+
+    return {"version": dataset_version(directory), "class_counts": class_counts, "durations": durations}
+
+
+def _write_index(index, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+# Function to read the aggregate index, rebuilding it when the dataset has changed
+def load_index(path=INDEX_PATH, directory=FEATURES_DIR):
+    try:
+        with open(path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = None
+
+    if index is None or index.get("version") != dataset_version(directory):
+        index = build_index(directory)
+        _write_index(index, path)
+    return index
@@ -0,0 +1,158 @@
+"""Headless bulk scoring of audio files.
+
+Usage::
+
+    python -m spad.batch recordings/ --output scores.csv --workers 8
+
+Files are scored on a pool of worker processes and each result is appended
+to the output (CSV or JSONL, picked from the extension) as soon as it is
+ready. Rerunning the same command skips files already scored in the output,
+so an interrupted run picks up where it stopped; files that failed are
+removed from the output and scored again.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from spad.models import MODEL_PATH, SCALER_PATH, get_model_pair
+from spad.pipeline import STAGES, find_audio_files, get_raw_forest, score_file
+
+CSV_FIELDS = ["path", "prediction", "label", "duration", "error"] + [f"{stage}_s" for stage in STAGES]
+
+
+def _init_worker():
+    from spad.startup import warm_extraction
+
+    # Load what score_file will use: the compiled or compact forest, else the scaler and model
+    if get_raw_forest() is None and os.path.exists(SCALER_PATH) and os.path.exists(MODEL_PATH):
+        get_model_pair()
+    warm_extraction()
+
+
+def _score(path):
+    try:
+        return score_file(path)
+    except Exception as e:
+        return {"path": path, "error": f"{type(e).__name__}: {e}", "timings": {}}
+
+
+class ResultWriter:
+    """ Appends results to a CSV or JSONL file, flushing after every row """
+
+    def __init__(self, path, fmt):
+        self.fmt = fmt
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "a", newline="")
+        if fmt == "csv":
+            self.writer = csv.DictWriter(self.file, fieldnames=CSV_FIELDS, extrasaction="ignore")
+            if new_file:
+                self.writer.writeheader()
+
+    def write(self, result):
+        if self.fmt == "csv":
+            row = dict(result)
+            row.update({f"{stage}_s": f"{seconds:.6f}" for stage, seconds in result["timings"].items()})
+            self.writer.writerow(row)
+        else:
+            self.file.write(json.dumps(result) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+# Function to find the files already scored in a partially written output; failed files are dropped to be retried
+def completed_paths(path, fmt):
+    if not os.path.exists(path):
+        return set()
+
+    # Drop a last line cut short by a crash so that file is scored again
+    with open(path, "rb+") as f:
+        content = f.read()
+        if content and not content.endswith(b"\n"):
+            f.truncate(content.rfind(b"\n") + 1)
+
+    with open(path, newline="") as f:
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            fieldnames, rows = reader.fieldnames, list(reader)
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    scored = [row for row in rows if not row.get("error")]
+
+    if len(scored) < len(rows):
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w", newline="") as f:
+            if fmt == "csv":
+                writer = csv.DictWriter(f, fieldnames=fieldnames)
+                writer.writeheader()
+                writer.writerows(scored)
+            else:
+                f.writelines(json.dumps(row) + "\n" for row in scored)
+        os.replace(tmp_path, path)
+    return {row["path"] for row in scored}
+
+
+# Function to print throughput and per-stage timings
+def report(results, elapsed, out=sys.stderr):
+    scored = [r for r in results if not r.get("error")]
+    print(f"Scored {len(scored)} files ({len(results) - len(scored)} failed) in {elapsed:.1f} s "
+          f"- {len(results) / elapsed if elapsed else 0:.2f} files/sec", file=out)
+
+    for stage in STAGES:
+        total = sum(r["timings"].get(stage, 0.0) for r in scored)
+        mean_ms = 1000 * total / len(scored) if scored else 0.0
+        print(f"  {stage:<9} total {total:9.2f} s   mean {mean_ms:8.2f} ms/file", file=out)
+
+
+def run(paths, output, fmt, workers, max_pending=None):
+    done = completed_paths(output, fmt)
+    todo = [path for path in find_audio_files(paths) if path not in done]
+    if done:
+        print(f"Resuming: {len(done)} files already in {output}, {len(todo)} to go", file=sys.stderr)
+
+    max_pending = max_pending or 4 * workers
+    writer = ResultWriter(output, fmt)
+    results = []
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            pending = set()
+            todo_iter = iter(todo)
+            for path in todo_iter:
+                pending.add(pool.submit(_score, path))
+                if len(pending) < max_pending:
+                    continue
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    results.append(future.result())
+                    writer.write(results[-1])
+
+            for future in wait(pending).done:
+                results.append(future.result())
+                writer.write(results[-1])
+    finally:
+        writer.close()
+        report(results, time.perf_counter() - start)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score directories of audio files for spoofing.")
+    parser.add_argument("paths", nargs="+", help="audio files or directories (searched recursively)")
+    parser.add_argument("-o", "--output", required=True, help="results file (.csv or .jsonl)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="defaults to the output extension")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("jsonl" if args.output.endswith((".jsonl", ".json")) else "csv")
+    results = run(args.paths, args.output, fmt, args.workers)
+    return 1 if any(r.get("error") for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+"""Stage-level benchmarks of the detection pipeline.
+
+Usage::
+
+    python -m spad.bench --quick                  # samples + synthetic clips up to 60 s
+    python -m spad.bench --save-baseline          # full matrix, stored as the baseline
+    python -m spad.bench --baseline .cache/bench/baseline.json
+
+Every case is one audio file: the clips in ``audio_sample/`` plus synthetic
+speech-like clips from 1 s to 30 min at 8, 16 and 44.1 kHz, written as
+wav, mp3 and ogg. Synthetic clips are generated once and cached under
+``.cache/bench/clips``. The end-to-end path is :func:`spad.pipeline.score_file`,
+and its :class:`StageTimer` splits each run into decode, resample, features,
+scale and predict. Long files are streamed, so their decode and resample time
+is part of ``features``. The waveform the detection page draws is timed as its
+own stage (``waveform``).
+
+Each case reports latency percentiles per stage, throughput (files/s and
+audio seconds per wall second) and the peak traced memory of one extra run
+of ``score_file`` and of the waveform load. The
+results are written as JSON. When a baseline exists, every stage is compared
+with it (fastest run by default) and the run fails if any stage got slower
+than the tolerance.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+
+from spad.pipeline import StageTimer, score_file
+from spad.resample import downmix, resample
+
+BENCH_DIR = os.environ.get("SPAD_BENCH_DIR", os.path.join(".cache", "bench"))
+CLIP_DIR = os.path.join(BENCH_DIR, "clips")
+RESULTS_PATH = os.path.join(BENCH_DIR, "latest.json")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+DURATIONS = (1, 10, 60, 300, 1800)
+QUICK_DURATIONS = (1, 10, 60)
+SAMPLE_RATES = (8000, 16000, 44100)
+FORMATS = ("wav", "mp3", "ogg")
+SUBTYPES = {"wav": "PCM_16", "mp3": "MPEG_LAYER_III", "ogg": "VORBIS"}
+PERCENTILES = (50, 90, 99)
+
+# Slowdowns smaller than this many seconds are treated as noise
+NOISE_FLOOR = 0.002
+
+
+# Function to synthesize a speech-like signal: a gliding harmonic voice gated at a syllable rate, plus noise
+def synthetic_signal(start, length, sr, seed=0):
+    t = (start + np.arange(length)) / sr
+    f0 = 140 + 30 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 4 * t)) ** 2
+    noise = np.random.default_rng((seed, start)).standard_normal(length)
+    return (0.2 * envelope * voice + 0.01 * noise).astype(np.float32)
+
+
+# Function to write a synthetic clip once and reuse it from the clip cache afterwards
+def synthetic_clip(duration, sr, fmt, directory=CLIP_DIR, block_seconds=60):
+    path = os.path.join(directory, f"synthetic_{duration}s_{sr}Hz.{fmt}")
+    if os.path.exists(path):
+        return path
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    total = int(duration * sr)
+    with sf.SoundFile(tmp_path, "w", sr, 1, subtype=SUBTYPES[fmt], format=fmt.upper()) as f:
+        for start in range(0, total, block_seconds * sr):
+            f.write(synthetic_signal(start, min(block_seconds * sr, total - start), sr))
+    os.replace(tmp_path, path)
+    return path
+
+
+# Function to load audio the way the detection page does for its waveform
+def load_waveform(path, sr=16000):
+    data, fsr = sf.read(path, dtype='float32', always_2d=True)
+    return resample(downmix(data), fsr, sr)
+
+
+def summarize(seconds):
+    seconds = np.asarray(seconds)
+    summary = {f"p{q}": float(np.percentile(seconds, q)) for q in PERCENTILES}
+    summary.update(mean=float(seconds.mean()), min=float(seconds.min()), max=float(seconds.max()), runs=len(seconds))
+    return summary
+
+
+def _peak_memory(func, *args):
+    """ Returns the peak bytes allocated through Python and NumPy while func runs """
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# Function to time every stage of one file over several runs
+def bench_case(path, min_runs=3, max_runs=10, budget=30.0):
+    info = sf.info(path)
+    score_file(path)  # warm-up: model loading and filter design are not part of a stage
+
+    stages, start = {}, time.perf_counter()
+    runs = 0
+    while runs < max_runs and (runs < min_runs or time.perf_counter() - start < budget):
+        timer = StageTimer()
+        run_start = time.perf_counter()
+        score_file(path, timer)
+        timer.timings["end_to_end"] = time.perf_counter() - run_start
+
+        waveform_start = time.perf_counter()
+        load_waveform(path)
+        timer.timings["waveform"] = time.perf_counter() - waveform_start
+
+        for stage, seconds in timer.timings.items():
+            stages.setdefault(stage, []).append(seconds)
+        runs += 1
+
+    peak = {"score_file": _peak_memory(score_file, path), "waveform": _peak_memory(load_waveform, path)}
+
+    end_to_end = summarize(stages["end_to_end"])
+    return {
+        "name": os.path.basename(path),
+        "path": path,
+        "duration": info.duration,
+        "sample_rate": info.samplerate,
+        "format": os.path.splitext(path)[1].lstrip("."),
+        "stages": {stage: summarize(seconds) for stage, seconds in stages.items()},
+        "files_per_second": 1 / end_to_end["mean"],
+        "realtime_factor": info.duration / end_to_end["p50"],
+        "peak_memory_mb": {name: nbytes / 2**20 for name, nbytes in peak.items()},
+    }
+
+
+def bench_cases(durations, sample_rates, formats, include_samples=True):
+    paths = sorted(glob.glob(os.path.join("audio_sample", "*.wav"))) if include_samples else []
+    for duration in durations:
+        for sr in sample_rates:
+            for fmt in formats:
+                paths.append(synthetic_clip(duration, sr, fmt))
+    return paths
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {"commit": _git_commit(), "python": platform.python_version(), "numpy": np.__version__,
+            "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+
+
+# Function to compare one statistic of every stage with a baseline; returns the regressions
+def compare(results, baseline, tolerance=0.20, statistic="min", out=sys.stdout):
+    previous = {case["name"]: case for case in baseline["cases"]}
+    regressions = []
+    print(f"\n{'case':<34}{'stage':<12}{'baseline':>11}{'now':>11}{'change':>9}   ({statistic})", file=out)
+    for case in results["cases"]:
+        old_case = previous.get(case["name"])
+        if old_case is None:
+            continue
+        for stage, summary in case["stages"].items():
+            if stage not in old_case["stages"]:
+                continue
+            old, new = old_case["stages"][stage][statistic], summary[statistic]
+            change = new / old - 1 if old else 0.0
+            regressed = change > tolerance and new - old > NOISE_FLOOR
+            if regressed:
+                regressions.append((case["name"], stage, old, new))
+            print(f"{case['name']:<34}{stage:<12}{old * 1e3:>9.2f}ms{new * 1e3:>9.2f}ms{change:>+8.0%}"
+                  f"{'  REGRESSION' if regressed else ''}", file=out)
+    return regressions
+
+
+def report(results, out=sys.stdout):
+    print(f"{'case':<34}{'stage':<12}{'p50':>10}{'p90':>10}{'p99':>10}{'runs':>6}", file=out)
+    for case in results["cases"]:
+        for stage, summary in case["stages"].items():
+            print(f"{case['name']:<34}{stage:<12}{summary['p50'] * 1e3:>8.2f}ms{summary['p90'] * 1e3:>8.2f}ms"
+                  f"{summary['p99'] * 1e3:>8.2f}ms{summary['runs']:>6}", file=out)
+        print(f"{case['name']:<34}{'':<12}{case['files_per_second']:.2f} files/s, "
+              f"{case['realtime_factor']:.0f}x realtime, peak {case['peak_memory_mb']['score_file']:.1f}MB "
+              f"(waveform {case['peak_memory_mb']['waveform']:.1f}MB)", file=out)
+
+
+def _write_json(data, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every stage of the detection pipeline.")
+    parser.add_argument("--quick", action="store_true", help=f"synthetic clips of {QUICK_DURATIONS} s only")
+    parser.add_argument("--durations", type=int, nargs="+", help=f"synthetic clip lengths in seconds (default {DURATIONS})")
+    parser.add_argument("--rates", type=int, nargs="+", default=list(SAMPLE_RATES), help="synthetic sample rates")
+    parser.add_argument("--formats", nargs="+", default=list(FORMATS), choices=FORMATS)
+    parser.add_argument("--runs", type=int, default=10, help="most timed runs per case")
+    parser.add_argument("--budget", type=float, default=30.0, help="seconds per case after the first 3 runs")
+    parser.add_argument("-o", "--output", default=RESULTS_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="compare with this result file when it exists")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.20, help="allowed slowdown of a stage")
+    parser.add_argument("--statistic", default="min", choices=["min", "mean"] + [f"p{q}" for q in PERCENTILES],
+                        help="what to compare; the minimum is the least disturbed by other load")
+    args = parser.parse_args(argv)
+
+    durations = args.durations or (QUICK_DURATIONS if args.quick else DURATIONS)
+    cases = []
+    for path in bench_cases(durations, args.rates, args.formats):
+        cases.append(bench_case(path, max_runs=args.runs, budget=args.budget))
+        print(f"{path}: {cases[-1]['stages']['end_to_end']['p50'] * 1e3:.1f}ms median", file=sys.stderr)
+
+    results = {"environment": environment(), "cases": cases,
+               "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+    report(results)
+    _write_json(results, args.output)
+    print(f"\nResults written to {args.output}")
+
+    status = 0
+    if args.save_baseline:
+        _write_json(results, args.baseline)
+        print(f"Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.statistic)
+        print(f"\n{len(regressions)} stage(s) slower than the baseline by more than {args.tolerance:.0%}")
+        status = 1 if regressions else 0
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""Content-addressed cache of detection results.
+
+Results are keyed by the SHA-256 of the uploaded bytes together with the
+feature and model versions, so the same clip uploaded by different analysts
+(or seen again on a Streamlit rerun) is decoded, extracted and predicted only
+once. Entries live in an in-memory LRU bounded by the bytes of the arrays
+they hold, in front of a size-bounded disk store that survives restarts.
+"""
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from spad.features import FEATURE_VERSION
+from spad.models import CASCADE_PATH, MODEL_PATH, SCALER_PATH
+
+CACHE_DIR = os.environ.get("SPAD_CACHE_DIR", os.path.join(".cache", "results"))
+MAX_MEMORY_BYTES = 256 * 1024 * 1024
+MAX_DISK_BYTES = 256 * 1024 * 1024
+# Bump whenever the layout of cached entries changes
+RESULT_FORMAT = 2
+
+
+# Function to describe the model artifacts on disk without loading them
+def model_version(paths=(SCALER_PATH, MODEL_PATH)):
+    parts = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            parts.append(f"{stat.st_mtime_ns}-{stat.st_size}")
+        except FileNotFoundError:
+            parts.append("missing")
+    return "/".join(parts)
+
+
+# Function to estimate the memory held by a cache entry from its arrays, pyramids and byte strings
+def entry_nbytes(value):
+    if isinstance(value, dict):
+        return sum(entry_nbytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(entry_nbytes(item) for item in value)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    nbytes = getattr(value, "nbytes", None)
+    if nbytes is not None:
+        return int(nbytes() if callable(nbytes) else nbytes)
+    return sys.getsizeof(value)
+
+
+def result_key(audio_bytes):
+    paths = [SCALER_PATH, MODEL_PATH]
+    if os.environ.get("SPAD_CASCADE"):
+        # The screen answers some uploads, so the cascade and its band shape the result too
+        paths.append(CASCADE_PATH)
+    digest = hashlib.sha256()
+    digest.update(f"{RESULT_FORMAT}|{FEATURE_VERSION}|{model_version(paths)}|".encode())
+    digest.update(audio_bytes)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """ Two-level LRU cache (memory, then disk) with hit/miss counters """
+
+    def __init__(self, directory=CACHE_DIR, max_memory_bytes=MAX_MEMORY_BYTES, max_disk_bytes=MAX_DISK_BYTES):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()  # key -> (entry, nbytes)
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _remember(self, key, entry):
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[1]
+        nbytes = entry_nbytes(entry)
+        self._memory[key] = (entry, nbytes)
+        self._memory_bytes += nbytes
+        # An entry larger than the whole budget is only kept on disk
+        while self._memory_bytes > self.max_memory_bytes and self._memory:
+            self._memory_bytes -= self._memory.popitem(last=False)[1][1]
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return self._memory[key][0]
+
+        import joblib
+
+        path = self._path(key)
+        try:
+            entry = joblib.load(path)
+            os.utime(path)
+        except (OSError, EOFError, ValueError):
+            with self._lock:
+                self.counters["misses"] += 1
+            return None
+
+        with self._lock:
+            self.counters["disk_hits"] += 1
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._remember(key, entry)
+            self.counters["stores"] += 1
+
+        import joblib
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        joblib.dump(entry, tmp_path)
+        os.replace(tmp_path, path)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            with self._lock:
+                self.counters["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
+
+
+result_cache = ResultCache()
@@ -0,0 +1,306 @@
+"""Two-stage cascade: a cheap MFCC screening model ahead of the full forest.
+
+Usage::
+
+    python -m spad.cascade tune --target-loss 0.005   # fit on train, tune the band on val, publish model/Cascade
+    python -m spad.cascade report                     # escalation and latency on test (or val)
+
+The screening model is a logistic regression on the 13 frame-mean MFCCs
+(the ``MFCC0..12`` columns of the feature sets), with sigmoid calibration, so
+its output is a usable probability that a clip is bona fide. Clips whose
+probability falls inside the uncertainty band ``(low, high)`` escalate to the
+full GTCC + MFCC forest. Every other clip is answered by the screen alone:
+spoof below the band, bona fide above it. The fitted scalers, regressions
+and calibrators are folded into a few NumPy arrays before publishing, because
+calling the sklearn objects would cost more than the forest the screen saves.
+
+On an uploaded clip, the screen only needs the mel filter bank applied to the
+frame spectra. When a clip escalates, the same spectra also feed the
+gammatone bank, so the full vector costs no second decode or FFT.
+
+``tune`` picks the narrowest band (fewest escalations) whose cascade accuracy
+on ``GTCC-MFCC_val`` stays within ``--target-loss`` of the full forest alone.
+``report`` prints the escalation fraction, both accuracies, and the mean
+latency the cascade gives on the clips in ``audio_sample/``.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+import soundfile as sf
+
+from spad.features import (FEATURE_NAMES, SAMPLE_RATE, WINDOW_LENGTH, _REALMIN, analysis_window,
+                           cepstral_coefficients, frame_signal, gammatone_filter_bank, mel_filter_bank,
+                           pool_features, resample_audio)
+from spad.forest import _source_versions
+from spad.models import CASCADE_PATH, registry
+
+SCREEN_COLUMNS = [f'MFCC{i}' for i in range(13)]
+BONA_FIDE = 1
+TARGET_LOSS = 0.005
+# Candidate band edges tried per side while tuning
+BAND_CANDIDATES = 400
+
+
+class Cascade:
+    """ Calibrated linear screen folded into NumPy arrays, its uncertainty band and tuning figures """
+
+    def __init__(self, weights, intercepts, slopes, offsets, low, high, columns=SCREEN_COLUMNS, tuning=None,
+                 source=None):
+        self.weights = weights          # (folds, columns), the feature scaling folded in
+        self.intercepts = intercepts    # (folds,)
+        self.slopes = slopes            # (folds,) sigmoid calibration of each fold's decision value
+        self.offsets = offsets          # (folds,)
+        self.low = low
+        self.high = high
+        self.columns = list(columns)
+        self.tuning = tuning or {}
+        self.source = source
+
+    def bona_fide_probability(self, screen_features):
+        decision = np.atleast_2d(screen_features) @ self.weights.T + self.intercepts
+        # Same as CalibratedClassifierCV.predict_proba: the mean of the per-fold calibrated probabilities
+        return (1 / (1 + np.exp(self.slopes * decision + self.offsets))).mean(axis=1)
+
+    def screen(self, screen_features):
+        """ Returns 0/1 per row where the screen is confident, -1 where the row escalates """
+        p = self.bona_fide_probability(screen_features)
+        return np.where(p <= self.low, 0, np.where(p >= self.high, 1, -1))
+
+
+# Function to compute the frame spectra once and the screening features from them
+def screen_frames(y, sr=SAMPLE_RATE):
+    frames = frame_signal(np.asarray(y, dtype=np.float64))
+    if not len(frames):
+        raise ValueError(f"Audio is shorter than one {WINDOW_LENGTH}-sample analysis frame.")
+    spectrum = np.abs(np.fft.rfft(frames * analysis_window(), n=WINDOW_LENGTH))
+    mfcc = cepstral_coefficients(spectrum, mel_filter_bank(sr))
+    return frames, spectrum, mfcc
+
+
+# Function to finish the full 1 x 81 hybrid vector from the screen's intermediate results
+def complete_features(frames, spectrum, mfcc, sr=SAMPLE_RATE):
+    log_energy = np.log(np.maximum(np.einsum('ij,ij->i', frames, frames), _REALMIN))
+    gtcc = cepstral_coefficients(spectrum, gammatone_filter_bank(sr))
+    return pool_features(np.column_stack([log_energy, gtcc]), mfcc)
+
+
+# Function to score one file with the cascade; returns the prediction and whether it escalated
+def score_with_cascade(path, cascade, timer=None):
+    from spad.pipeline import StageTimer, predict_raw_features, score_file
+    from spad.streaming import is_long_recording
+
+    timer = timer or StageTimer()
+    if is_long_recording(path):
+        # Long recordings are streamed block by block; they always take the full path
+        return score_file(path, timer)["prediction"], True
+    with timer.stage("decode"):
+        data, fsr = sf.read(path, always_2d=True)
+    with timer.stage("resample"):
+        y = resample_audio(data[:, 0], fsr, SAMPLE_RATE)
+    with timer.stage("screen"):
+        frames, spectrum, mfcc = screen_frames(y)
+        decision = int(cascade.screen(mfcc.mean(axis=0))[0])
+    if decision != -1:
+        return decision, False
+
+    with timer.stage("features"):
+        features = complete_features(frames, spectrum, mfcc)
+    with timer.stage("predict"):
+        return int(predict_raw_features(features)[0]), True
+
+
+# Function to fit the calibrated screening model on the training split
+def fit_screen(X, y, random_state=42):
+    from sklearn.calibration import CalibratedClassifierCV
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    linear = make_pipeline(StandardScaler(), LogisticRegression(max_iter=1000, random_state=random_state))
+    return CalibratedClassifierCV(linear, method="sigmoid", cv=5).fit(X, y)
+
+
+# Function to fold each fold's scaler, regression and calibrator into plain arrays
+def fold_screen(model):
+    # Calling the fitted sklearn objects costs milliseconds per clip; the folded form costs microseconds
+    if list(model.classes_) != [0, BONA_FIDE]:
+        raise ValueError(f"Expected classes [0, {BONA_FIDE}], got {list(model.classes_)}.")
+    weights, intercepts, slopes, offsets = [], [], [], []
+    for calibrated in model.calibrated_classifiers_:
+        scaler, linear = calibrated.estimator[0], calibrated.estimator[-1]
+        coef = linear.coef_[0] / scaler.scale_
+        weights.append(coef)
+        intercepts.append(linear.intercept_[0] - coef @ scaler.mean_)
+        slopes.append(calibrated.calibrators[0].a_)
+        offsets.append(calibrated.calibrators[0].b_)
+    return np.array(weights), np.array(intercepts), np.array(slopes), np.array(offsets)
+
+
+def cascade_outcome(p, low, high, labels, full_predictions):
+    """ Returns (accuracy, escalation fraction) of the cascade on labelled rows """
+    screened = np.where(p <= low, 0, np.where(p >= high, 1, -1))
+    escalated = screened == -1
+    predictions = np.where(escalated, full_predictions, screened)
+    return float(np.mean(predictions == labels)), float(np.mean(escalated))
+
+
+# Function to find the band with the fewest escalations whose accuracy loss stays within target_loss
+def tune_band(p, labels, full_predictions, target_loss=TARGET_LOSS, candidates=BAND_CANDIDATES):
+    order = np.argsort(p, kind="stable")
+    p, labels, full_correct = p[order], labels[order], (full_predictions == labels)[order]
+    n = len(p)
+
+    # Clips [0, i) are called spoof, [j, n) bona fide, [i, j) escalate; cuts only between distinct values
+    cuts = np.unique(np.concatenate([[0, n], np.flatnonzero(np.diff(p)) + 1]))
+    if len(cuts) > candidates:
+        cuts = np.unique(cuts[np.linspace(0, len(cuts) - 1, candidates).round().astype(int)])
+    spoof_right = np.concatenate([[0], np.cumsum(labels != BONA_FIDE)])
+    bona_right = np.concatenate([[0], np.cumsum(labels == BONA_FIDE)])
+    full_right = np.concatenate([[0], np.cumsum(full_correct)])
+
+    i, j = cuts[:, None], cuts[None, :]
+    correct = spoof_right[i] + (bona_right[n] - bona_right[j]) + (full_right[j] - full_right[i])
+    accuracy = np.where(i <= j, correct / n, -np.inf)
+    escalation = (j - i) / n
+
+    full_accuracy = full_right[n] / n
+    allowed = accuracy >= full_accuracy - target_loss
+    # Fewest escalations first, then the most accurate of those
+    score = np.where(allowed, -escalation + 1e-9 * accuracy, -np.inf)
+    a, b = np.unravel_index(np.argmax(score), score.shape)
+    i, j = cuts[a], cuts[b]
+
+    low = -np.inf if i == 0 else (p[i - 1] + p[i]) / 2 if i < n else np.inf
+    high = np.inf if j == n else (p[j - 1] + p[j]) / 2 if j > 0 else -np.inf
+    return float(low), float(high)
+
+
+def _split_arrays(split):
+    from spad.store import open_split
+
+    store = open_split(split)
+    labels = store.column('label').astype(int)
+    return store.matrix(SCREEN_COLUMNS), store.matrix(FEATURE_NAMES), labels
+
+
+# Function to fit the screen on train, tune its band on val and publish model/Cascade
+def tune(target_loss=TARGET_LOSS, path=CASCADE_PATH, out=sys.stdout):
+    from spad.models import publish_artifact
+    from spad.pipeline import predict_raw_features
+
+    X_train, _, y_train = _split_arrays("train")
+    model = fit_screen(X_train, y_train)
+    cascade = Cascade(*fold_screen(model), low=-np.inf, high=np.inf, source=_source_versions())
+
+    X_val, full_val, y_val = _split_arrays("val")
+    p = cascade.bona_fide_probability(X_val)
+    if not np.allclose(p, model.predict_proba(X_val)[:, 1], rtol=0, atol=1e-6):
+        raise AssertionError("The folded screen does not reproduce the calibrated model.")
+    full_predictions = np.asarray(predict_raw_features(full_val))
+    low, high = tune_band(p, y_val, full_predictions, target_loss)
+
+    accuracy, escalation = cascade_outcome(p, low, high, y_val, full_predictions)
+    full_accuracy = float(np.mean(full_predictions == y_val))
+    tuning = {"split": "val", "target_loss": target_loss, "accuracy": accuracy, "full_accuracy": full_accuracy,
+              "escalation": escalation, "screen_accuracy": float(np.mean((p >= 0.5) == (y_val == BONA_FIDE)))}
+    cascade.low, cascade.high, cascade.tuning = low, high, tuning
+    publish_artifact(cascade, path)
+    print(f"Band ({low:.4f}, {high:.4f}) on val: {escalation:.1%} of clips escalate, "
+          f"accuracy {accuracy:.4f} vs {full_accuracy:.4f} for the full forest alone "
+          f"(target loss {target_loss})", file=out)
+    return cascade
+
+
+# Function to get the published cascade, or None when it is missing or was tuned for other artifacts
+def get_cascade(path=CASCADE_PATH):
+    if not os.path.exists(path):
+        return None
+    cascade = registry.get(path)
+    try:
+        current = _source_versions()
+    except FileNotFoundError:
+        return None
+    return cascade if [list(v) for v in cascade.source or []] == [list(v) for v in current] else None
+
+
+def _mean_time(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+# Function to report escalation, accuracy and mean latency of the cascade against the full pipeline
+def report(cascade, split=None, clips=None, repeat=20, out=sys.stdout):
+    from spad.pipeline import predict_raw_features, score_file
+
+    for split in ([split] if split else ["test", "val"]):
+        try:
+            X_screen, X_full, labels = _split_arrays(split)
+            break
+        except FileNotFoundError:
+            continue
+    else:
+        raise FileNotFoundError("No GTCC-MFCC test or val split to report on.")
+
+    p = cascade.bona_fide_probability(X_screen)
+    full_predictions = np.asarray(predict_raw_features(X_full))
+    accuracy, escalation = cascade_outcome(p, cascade.low, cascade.high, labels, full_predictions)
+    full_accuracy = float(np.mean(full_predictions == labels))
+    print(f"{split}: {len(labels)} clips, band ({cascade.low:.4f}, {cascade.high:.4f})", file=out)
+    print(f"  escalated to the full forest: {escalation:.1%}", file=out)
+    print(f"  accuracy: cascade {accuracy:.4f}, full forest {full_accuracy:.4f} "
+          f"(loss {full_accuracy - accuracy:+.4f})", file=out)
+
+    # Latency: screen cost on every clip, plus the rest of the full path on escalated ones
+    clips = clips or sorted(glob.glob(os.path.join("audio_sample", "*.wav")))
+    if not clips:
+        return
+    escalate = cascade.low, cascade.high
+    cascade.low, cascade.high = np.inf, -np.inf  # never escalate: time the screen alone
+    try:
+        screen_time = np.mean([_mean_time(lambda: score_with_cascade(c, cascade), repeat) for c in clips])
+    finally:
+        cascade.low, cascade.high = escalate
+    cascade.low, cascade.high = -np.inf, np.inf  # always escalate: screen + completion
+    try:
+        escalated_time = np.mean([_mean_time(lambda: score_with_cascade(c, cascade), repeat) for c in clips])
+    finally:
+        cascade.low, cascade.high = escalate
+    full_time = np.mean([_mean_time(lambda: score_file(c), repeat) for c in clips])
+    mean_time = (1 - escalation) * screen_time + escalation * escalated_time
+    print(f"  latency on {len(clips)} sample clips: screen only {screen_time * 1e3:.2f} ms, "
+          f"escalated {escalated_time * 1e3:.2f} ms, full pipeline {full_time * 1e3:.2f} ms", file=out)
+    print(f"  mean cascade latency at {escalation:.1%} escalation: {mean_time * 1e3:.2f} ms "
+          f"({full_time / mean_time:.2f}x vs full)", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune and evaluate the MFCC screening cascade.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    tune_parser = commands.add_parser("tune", help="fit the screen, tune its band on val and publish it")
+    tune_parser.add_argument("--target-loss", type=float, default=TARGET_LOSS,
+                             help="largest accuracy drop allowed against the full forest on val")
+    report_parser = commands.add_parser("report", help="escalation fraction, accuracy and mean latency")
+    report_parser.add_argument("--split", choices=["train", "val", "test"])
+    args = parser.parse_args(argv)
+
+    if args.command == "tune":
+        cascade = tune(args.target_loss)
+        report(cascade, "val")
+    else:
+        cascade = get_cascade()
+        if cascade is None:
+            parser.error("No cascade tuned for the current model; run `python -m spad.cascade tune` first.")
+        report(cascade, args.split)
+    return 0
+
+
+if __name__ == "__main__":
+    # Run from the package module so the pickled class is spad.cascade.Cascade, not __main__'s
+    from spad.cascade import main as package_main
+    sys.exit(package_main())
@@ -0,0 +1,322 @@
+"""Compact on-disk format for the served RandomForestClassifier and its Scaler.
+
+Usage::
+
+    python -m spad.compact                 # write model/CompactForest
+    python -m spad.compact --prune --check # drop uniform subtrees, prove equality, compare with the pickle
+
+The sklearn pickle stores every node as a 64-byte struct plus a float64 value
+row. Here each tree is kept in depth-first order, so a node's left child is
+always the next node and only the right child is stored, as a tree-local
+offset in the smallest unsigned type that fits. Feature indices are one byte.
+Thresholds are float32: trees compare the float32 scaled feature with a
+float64 threshold, and rounding the threshold down to the nearest float32
+gives the same decision for every float32 input. Leaves hold an index into a
+table of the distinct class-probability rows. Pure leaves all share the
+``[1, 0]`` and ``[0, 1]`` rows, i.e. they collapse to a class bit.
+
+With ``--prune``, a subtree whose leaves all hold the same probability row is
+replaced by one leaf. Any path through it ends on that row, so the prediction
+does not change. Subtrees whose leaves only agree on the majority class are
+kept, because merging them would change the averaged probabilities.
+
+The scaler's mean and scale are stored alongside, and predictions are
+computed from raw feature vectors exactly as ``model.predict(scaler.transform(X))``
+does.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from spad.forest import BATCH_ROWS, _best_time, _evaluation_rows, _source_versions
+from spad.models import COMPACT_PATH, MODEL_PATH, SCALER_PATH, registry
+
+
+def _smallest_uint(max_value):
+    return np.min_scalar_type(int(max_value))
+
+
+# Function to round float64 thresholds down to the float32 that splits float32 inputs the same way
+def float32_thresholds(threshold):
+    rounded = np.asarray(threshold, dtype=np.float64).astype(np.float32)
+    too_big = rounded.astype(np.float64) > threshold
+    rounded[too_big] = np.nextafter(rounded[too_big], np.float32(-np.inf))
+    return rounded
+
+
+def _preorder(children_left, children_right):
+    """ Returns the node ids of one tree in depth-first (left before right) order """
+    inner = np.flatnonzero(children_left != -1)
+    if np.all(children_left[inner] == inner + 1):
+        return np.arange(len(children_left))
+    order, stack = [], [0]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        if children_left[node] != -1:
+            stack += [children_right[node], children_left[node]]
+    return np.array(order)
+
+
+# Function to mark the nodes whose whole subtree ends on a single leaf value
+def uniform_subtrees(children_left, children_right, leaf_value):
+    """ Returns the value index under each uniform subtree and -1 for every other node """
+    is_leaf = children_left == -1
+    depth = np.zeros(len(children_left), dtype=np.intp)
+    level = np.array([0])
+    while len(level):
+        level = level[~is_leaf[level]]
+        children = np.concatenate([children_left[level], children_right[level]])
+        depth[children] = depth[np.concatenate([level, level])] + 1
+        level = children
+
+    uniform = np.where(is_leaf, leaf_value, -1)
+    for d in range(depth.max() - 1, -1, -1):
+        nodes = np.flatnonzero((depth == d) & ~is_leaf)
+        left, right = uniform[children_left[nodes]], uniform[children_right[nodes]]
+        uniform[nodes] = np.where((left == right) & (left != -1), left, -1)
+    return uniform
+
+
+# Function to find the nodes still reachable once the given nodes are turned into leaves
+def reachable(children_left, children_right, is_leaf):
+    keep = np.zeros(len(children_left), dtype=bool)
+    level = np.array([0])
+    while len(level):
+        keep[level] = True
+        level = level[~is_leaf[level]]
+        level = np.concatenate([children_left[level], children_right[level]])
+    return keep
+
+
+class CompactForest:
+    """ A scaler and random forest in compact node arrays, predicting from raw features """
+
+    def __init__(self, mean, scale, feature, threshold, right, roots, values, classes, source=None):
+        self.mean = mean                # scaler mean_ and scale_, float64
+        self.scale = scale
+        self.feature = feature          # split feature per node; n_features marks a leaf
+        self.threshold = threshold      # float32 threshold per node (0 at leaves)
+        self.right = right              # tree-local right child, or value row index at leaves
+        self.roots = roots              # first node of every tree
+        self.values = values            # distinct leaf class-probability rows
+        self.classes_ = classes
+        self.source = source            # file versions of the model and scaler this was built from
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    @property
+    def n_features(self):
+        return len(self.mean)
+
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.mean, self.scale, self.feature, self.threshold,
+                                              self.right, self.roots, self.values))
+
+    def transform(self, X):
+        """ StandardScaler.transform followed by the float32 cast the trees apply """
+        return ((np.asarray(X, dtype=np.float64) - self.mean) / self.scale).astype(np.float32)
+
+    def apply(self, X):
+        """ Returns the leaf node reached in every tree, shape (rows, trees) """
+        values = np.ascontiguousarray(self.transform(X)).ravel()
+        n_rows, n_trees = len(values) // self.n_features, len(self.roots)
+
+        row_start = np.repeat(np.arange(n_rows) * self.n_features, n_trees)
+        tree_root = np.tile(self.roots.astype(np.intp), n_rows)
+        leaves = tree_root.copy()
+        active = np.flatnonzero(self.feature[leaves] != self.n_features)
+        node = leaves[active]
+        while len(active):
+            go_right = values[row_start[active] + self.feature[node]] > self.threshold[node]
+            node = np.where(go_right, tree_root[active] + self.right[node], node + 1)
+            leaves[active] = node
+            inner = self.feature[node] != self.n_features
+            active, node = active[inner], node[inner]
+        return leaves.reshape(n_rows, n_trees)
+
+    def predict_proba(self, X):
+        X = np.atleast_2d(X)
+        proba = np.empty((len(X), len(self.classes_)))
+        for start in range(0, len(X), BATCH_ROWS):
+            rows = self.values[self.right[self.apply(X[start:start + BATCH_ROWS])]]
+            # Sum tree by tree, in sklearn's order, so ties and rounding match
+            total = np.zeros((len(rows), len(self.classes_)))
+            for tree in range(rows.shape[1]):
+                total += rows[:, tree]
+            proba[start:start + BATCH_ROWS] = total / len(self.roots)
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+
+# Function to pack a fitted RandomForestClassifier and StandardScaler into a CompactForest
+def compact_forest(model, scaler, prune=False, source=None):
+    if model.n_outputs_ != 1:
+        raise ValueError("Only single-output forests can be compacted.")
+    n_features = model.n_features_in_
+
+    # Leaf probability rows, computed as DecisionTreeClassifier.predict_proba does
+    trees = [estimator.tree_ for estimator in model.estimators_]
+    leaf_rows = []
+    for tree in trees:
+        value = tree.value[:, 0, :]
+        leaf_rows.append(value / value.sum(axis=1, keepdims=True))
+    values, inverse = np.unique(np.concatenate(leaf_rows), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+
+    features, thresholds, rights, roots = [], [], [], []
+    offset = start = 0
+    for tree in trees:
+        n = tree.node_count
+        left, right = tree.children_left, tree.children_right
+        leaf_value = np.where(left == -1, inverse[start:start + n], -1)
+        start += n
+
+        is_leaf = left == -1
+        if prune:
+            uniform = uniform_subtrees(left, right, leaf_value)
+            leaf_value = np.where(uniform != -1, uniform, leaf_value)
+            is_leaf = uniform != -1
+
+        order = _preorder(left, right)
+        order = order[reachable(left, right, is_leaf)[order]]
+        position = np.full(n, -1)
+        position[order] = np.arange(len(order))
+        leaf = is_leaf[order]
+        features.append(np.where(leaf, n_features, tree.feature[order]))
+        thresholds.append(np.where(leaf, 0.0, tree.threshold[order]))
+        rights.append(np.where(leaf, leaf_value[order], position[right[order]]))
+        roots.append(offset)
+        offset += len(order)
+
+    right = np.concatenate(rights)
+    return CompactForest(
+        mean=np.asarray(scaler.mean_, dtype=np.float64),
+        scale=np.asarray(scaler.scale_, dtype=np.float64),
+        feature=np.concatenate(features).astype(_smallest_uint(n_features)),
+        threshold=float32_thresholds(np.concatenate(thresholds)),
+        right=right.astype(_smallest_uint(right.max())),
+        roots=np.array(roots, dtype=_smallest_uint(offset)),
+        values=values,
+        classes=np.asarray(model.classes_),
+        source=source,
+    )
+
+
+# Function to compact the served model and scaler and publish the result next to them
+def export_compact(path=COMPACT_PATH, prune=False):
+    from spad.models import get_model_pair, publish_artifact
+
+    scaler, model = get_model_pair()
+    compact = compact_forest(model, scaler, prune=prune, source=_source_versions())
+    publish_artifact(compact, path)
+    return compact
+
+
+# Function to get the compact forest, or None when it is missing or was built from other artifacts
+def get_compact_forest(path=COMPACT_PATH):
+    if not os.path.exists(path):
+        return None
+    compact = registry.get(path)
+    try:
+        current = _source_versions()
+    except FileNotFoundError:
+        return None
+    return compact if [list(v) for v in compact.source or []] == [list(v) for v in current] else None
+
+
+_LOAD_PROBE = """
+import os, sys, time
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+import numpy as np
+base = rss()
+start = time.perf_counter()
+import joblib
+objects = [joblib.load(path, mmap_mode="r") for path in sys.argv[1:]]
+loaded = time.perf_counter() - start
+after_load = rss()
+if len(objects) == 2:
+    import warnings
+    warnings.simplefilter("ignore")
+    row = np.asarray(objects[0].mean_, dtype=np.float64)[None, :]
+    objects[1].predict(objects[0].transform(row))
+else:
+    objects[0].predict(np.asarray(objects[0].mean)[None, :])
+print(loaded, after_load - base, rss() - base)
+"""
+
+
+def _load_probe(paths):
+    """ Loads artifacts in a fresh interpreter; returns (seconds incl. imports, RSS after load, RSS after a prediction) """
+    output = subprocess.run([sys.executable, "-c", _LOAD_PROBE, *paths], capture_output=True, text=True, check=True,
+                            cwd=os.getcwd(), env=dict(os.environ, PYTHONPATH=os.getcwd()))
+    seconds, rss_loaded, rss_predicted = output.stdout.split()
+    return float(seconds), int(rss_loaded), int(rss_predicted)
+
+
+# Function to compare the compact artifact with the pickles on disk, in memory and at load time
+def report(path=COMPACT_PATH):
+    pickle_paths = [SCALER_PATH, MODEL_PATH]
+    rows = [("pickle (Scaler + RandomForestClassifier)", sum(os.path.getsize(p) for p in pickle_paths),
+             _load_probe(pickle_paths)),
+            (f"compact ({os.path.basename(path)})", os.path.getsize(path), _load_probe([path]))]
+    print(f"{'artifact':<42}{'on disk':>12}{'load':>10}{'RSS loaded':>13}{'RSS 1st predict':>17}")
+    for name, size, (seconds, rss_loaded, rss_predicted) in rows:
+        print(f"{name:<42}{size / 2**20:>10.2f}MB{seconds * 1e3:>8.0f}ms"
+              f"{rss_loaded / 2**20:>11.1f}MB{rss_predicted / 2**20:>15.1f}MB")
+
+
+# Function to prove the compact forest predicts exactly what the pickled model and scaler do
+def check(compact, repeat=20):
+    from spad.models import get_model_pair, standardize
+
+    scaler, model = get_model_pair()
+    X, name = _evaluation_rows(scaler)
+    X = np.asarray(X, dtype=np.float64)
+
+    expected = model.predict_proba(standardize(scaler, X))
+    actual = compact.predict_proba(X)
+    mismatches = int(np.sum(model.classes_.take(np.argmax(expected, axis=1)) != compact.predict(X)))
+    identical = np.array_equal(expected, actual)
+    print(f"{name}: {len(X)} rows, {mismatches} prediction mismatches, "
+          f"probabilities {'bit-identical' if identical else 'DIFFER'}")
+
+    row = X[:1]
+    sklearn_row = _best_time(lambda: model.predict(standardize(scaler, row)), repeat)
+    compact_row = _best_time(lambda: compact.predict(row), repeat)
+    print(f"single row: sklearn {sklearn_row * 1e6:9.0f} us   compact {compact_row * 1e6:7.0f} us")
+    return mismatches == 0 and identical
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write the served random forest and scaler in a compact format.")
+    parser.add_argument("--prune", action="store_true", help="replace subtrees whose leaves all agree by one leaf")
+    parser.add_argument("--check", action="store_true", help="prove identical predictions and report size, load time and RSS")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    compact = export_compact(prune=args.prune)
+    print(f"{COMPACT_PATH}: {compact.n_estimators} trees, {len(compact.feature)} nodes, "
+          f"{len(compact.values)} distinct leaf rows, {compact.nbytes() / 2**20:.2f}MB of arrays "
+          f"({time.perf_counter() - start:.1f}s)")
+    if args.check:
+        ok = check(compact)
+        report()
+        return 0 if ok else 1
+    return 0
+
+
+if __name__ == "__main__":
+    # Run from the package module so the pickled class is spad.compact.CompactForest, not __main__'s
+    from spad.compact import main as package_main
+    sys.exit(package_main())
@@ -0,0 +1,353 @@
+"""Pluggable feature-extractor backends served by a pool of long-lived workers.
+
+Backends:
+
+- ``native``: the NumPy port in :mod:`spad.features`
+- ``matlab``: ``feature_extraction.m`` through a MATLAB engine kept open in
+  each worker (or ``matlab -batch`` when the engine API is not installed)
+- ``stub``: deterministic vectors without touching the audio, for tests
+
+Each worker process builds its backend once and then takes jobs from a shared
+queue, so interpreter and MATLAB start-up are paid per worker rather than per
+file. The pool enforces a per-job timeout that grows with the length of the
+recording, restarts workers that crash or time out, and refuses new work once ``max_pending`` jobs are in flight.
+Cancelled jobs are skipped when still queued; a running one is stopped by
+replacing its worker, together with any MATLAB process it started.
+"""
+import atexit
+import hashlib
+import itertools
+import multiprocessing
+import os
+import queue
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from spad.features import NUM_FEATURES
+from spad.matlab import MAX_WAIT_TIME, MAT_NAME, ExtractionError, ExtractionTimeout, extract_features_matlab
+from spad.streaming import extract_features_bounded
+
+# Extra seconds allowed per second of audio on top of job_timeout (native extraction needs about 0.004)
+TIMEOUT_PER_AUDIO_SECOND = 0.05
+
+
+class PoolSaturated(RuntimeError):
+    pass
+
+
+class WorkerCrashed(ExtractionError):
+    pass
+
+
+class ExtractorBackend:
+    """ Base class: start() runs once in the worker before it takes jobs, extract() once per job
+
+    A job's timeout starts when a worker picks it up, so the time spent in
+    start() (warm-up, MATLAB engine start) never counts against the first job.
+    """
+
+    name = None
+
+    def start(self):
+        pass
+
+    def extract(self, audio_path):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class NativeBackend(ExtractorBackend):
+    name = "native"
+
+    def start(self):
+        # Build the filter banks and resampling kernels before the first job
+        from spad.startup import warm_extraction
+        warm_extraction()
+
+    def extract(self, audio_path):
+        return extract_features_bounded(audio_path)
+
+
+class MatlabBackend(ExtractorBackend):
+    name = "matlab"
+
+    def __init__(self, matlab="matlab"):
+        self.matlab = matlab
+        self.engine = None
+        self.workdir = None
+
+    def start(self):
+        self.workdir = tempfile.mkdtemp(prefix="spad-matlab-")
+        try:
+            import matlab.engine
+        except ImportError:
+            return
+        self.engine = matlab.engine.start_matlab()
+        self.engine.addpath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.engine.cd(self.workdir)
+
+    def extract(self, audio_path):
+        if self.engine is None:
+            return extract_features_matlab(audio_path, self.workdir, timeout=None, matlab=self.matlab)
+
+        import scipy.io
+
+        mat_path = os.path.join(self.workdir, MAT_NAME)
+        self.engine.feature_extraction(os.path.abspath(audio_path), MAT_NAME, nargout=0)
+        features = scipy.io.loadmat(mat_path)['hybridFeatures']
+        os.remove(mat_path)
+        return features
+
+    def close(self):
+        if self.engine is not None:
+            self.engine.quit()
+        if self.workdir is not None:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class StubBackend(ExtractorBackend):
+    name = "stub"
+
+    def __init__(self, delay=0.0, start_delay=0.0):
+        self.delay = delay
+        self.start_delay = start_delay
+
+    def start(self):
+        if self.start_delay:
+            time.sleep(self.start_delay)
+
+    def extract(self, audio_path):
+        if self.delay:
+            time.sleep(self.delay)
+        seed = int.from_bytes(hashlib.sha256(os.fsencode(audio_path)).digest()[:8], "little")
+        return np.random.default_rng(seed).normal(size=(1, NUM_FEATURES))
+
+
+BACKENDS = {backend.name: backend for backend in (NativeBackend, MatlabBackend, StubBackend)}
+
+
+def create_backend(name, **kwargs):
+    try:
+        return BACKENDS[name](**kwargs)
+    except KeyError:
+        raise ValueError(f"Unknown extractor backend {name!r}; choose from {sorted(BACKENDS)}") from None
+
+
+# Number of shared slots recording cancelled job ids (slot = job id modulo this)
+CANCEL_SLOTS = 1024
+
+
+# Function run by each worker process: build the backend once, then serve jobs until told to stop
+def _worker_main(worker_id, backend_name, backend_kwargs, jobs, results, cancelled):
+    if hasattr(os, "setpgid"):
+        # Own process group, so replacing the worker also stops the MATLAB processes it started
+        os.setpgid(0, 0)
+    backend = create_backend(backend_name, **backend_kwargs)
+    backend.start()
+    results.put(("ready", worker_id, None, None))
+    try:
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            job_id, audio_path = job
+            if cancelled[job_id % CANCEL_SLOTS] == job_id:
+                continue
+            results.put(("started", worker_id, job_id, None))
+            try:
+                results.put(("done", worker_id, job_id, backend.extract(audio_path)))
+            except Exception as e:
+                results.put(("failed", worker_id, job_id, f"{type(e).__name__}: {e}"))
+    finally:
+        backend.close()
+
+
+class ExtractorPool:
+    """ A fixed number of warm extractor processes fed from one job queue """
+
+    def __init__(self, backend="native", size=None, job_timeout=MAX_WAIT_TIME, max_pending=None,
+                 timeout_per_audio_second=TIMEOUT_PER_AUDIO_SECOND, **backend_kwargs):
+        create_backend(backend, **backend_kwargs)  # fail fast on a bad name or arguments
+        self.backend = backend
+        self.backend_kwargs = backend_kwargs
+        self.size = size or os.cpu_count() or 1
+        self.job_timeout = job_timeout
+        self.timeout_per_audio_second = timeout_per_audio_second
+        self.max_pending = max_pending or 4 * self.size
+
+        self._context = multiprocessing.get_context("spawn")
+        self._jobs = self._context.Queue()
+        self._results = self._context.Queue()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._cancelled = self._context.Array('q', [-1] * CANCEL_SLOTS, lock=False)
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._futures = {}
+        self._timeouts = {}  # job_id -> seconds allowed once it starts
+        self._running = {}  # worker_id -> (job_id, start time)
+        self._workers = {}
+        self._closed = False
+        self.restarts = 0
+        self.cancellations = 0
+
+        for worker_id in range(self.size):
+            self._start_worker(worker_id)
+
+        self._collector = threading.Thread(target=self._collect, name="spad-extractor-results", daemon=True)
+        self._collector.start()
+        self._monitor = threading.Thread(target=self._watch, name="spad-extractor-monitor", daemon=True)
+        self._monitor.start()
+
+    def _start_worker(self, worker_id):
+        process = self._context.Process(
+            target=_worker_main, name=f"spad-extractor-{worker_id}",
+            args=(worker_id, self.backend, self.backend_kwargs, self._jobs, self._results, self._cancelled),
+            daemon=True)
+        process.start()
+        self._workers[worker_id] = process
+
+    def _finish(self, job_id, result=None, error=None, cancelled=False):
+        future = self._futures.pop(job_id, None)
+        self._timeouts.pop(job_id, None)
+        if future is None:
+            return
+        self._slots.release()
+        if cancelled:
+            future.cancel()
+        elif error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _collect(self):
+        while not self._closed:
+            try:
+                kind, worker_id, job_id, payload = self._results.get(timeout=0.5)
+            except (queue.Empty, OSError, EOFError):
+                continue
+            with self._lock:
+                if kind == "started":
+                    self._running[worker_id] = (job_id, time.monotonic())
+                elif kind in ("done", "failed"):
+                    if self._running.get(worker_id, (None,))[0] == job_id:
+                        del self._running[worker_id]
+                    error = ExtractionError(payload) if kind == "failed" else None
+                    self._finish(job_id, result=payload, error=error)
+
+    def _replace_worker(self, worker_id, error):
+        process = self._workers[worker_id]
+        if process.is_alive():
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except (AttributeError, OSError):
+                process.kill()
+        process.join()
+        running = self._running.pop(worker_id, None)
+        if running is not None:
+            self._finish(running[0], error=error)
+        self.restarts += 1
+        if not self._closed:
+            self._start_worker(worker_id)
+
+    def _watch(self):
+        while not self._closed:
+            time.sleep(0.2)
+            now = time.monotonic()
+            with self._lock:
+                for worker_id, process in list(self._workers.items()):
+                    running = self._running.get(worker_id)
+                    limit = self._timeouts.get(running[0]) if running is not None else None
+                    if not process.is_alive():
+                        self._replace_worker(worker_id, WorkerCrashed(
+                            f"extractor worker exited with code {process.exitcode}"))
+                    elif limit is not None and now - running[1] > limit:
+                        self._replace_worker(worker_id, ExtractionTimeout(
+                            f"feature extraction did not finish within {limit:.1f} s"))
+
+    def timeout_for(self, audio_path):
+        """ Returns the seconds one file may take: job_timeout plus an allowance per second of audio """
+        if self.job_timeout is None:
+            return None
+        import soundfile as sf
+
+        try:
+            duration = sf.info(audio_path).duration
+        except Exception:
+            # Unreadable headers fail in the worker with a proper error
+            duration = 0.0
+        return self.job_timeout + self.timeout_per_audio_second * duration
+
+    def submit(self, audio_path, block=True, timeout=None):
+        """ Queues one file and returns a Future of its 1 x 81 features; raises PoolSaturated when full """
+        if self._closed:
+            raise RuntimeError("extractor pool is closed")
+        if not self._slots.acquire(blocking=block, timeout=timeout if block else None):
+            raise PoolSaturated(f"{self.max_pending} extraction jobs already pending")
+
+        future = Future()
+        limit = self.timeout_for(audio_path)
+        with self._lock:
+            job_id = next(self._job_ids)
+            self._futures[job_id] = future
+            self._timeouts[job_id] = limit
+        self._jobs.put((job_id, audio_path))
+        return future
+
+    def extract(self, audio_path):
+        return self.submit(audio_path).result()
+
+    def cancel(self, future):
+        """ Cancels a queued or running job; returns False when it already finished """
+        with self._lock:
+            job_id = next((job_id for job_id, pending in self._futures.items() if pending is future), None)
+            if job_id is None:
+                return False
+            self._cancelled[job_id % CANCEL_SLOTS] = job_id
+            self._finish(job_id, cancelled=True)
+            self.cancellations += 1
+            worker_id = next((worker_id for worker_id, (running_id, _) in self._running.items()
+                              if running_id == job_id), None)
+            if worker_id is not None:
+                self._replace_worker(worker_id, None)
+            return True
+
+    def pending(self):
+        with self._lock:
+            return len(self._futures)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._workers:
+            self._jobs.put(None)
+        for process in self._workers.values():
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+        with self._lock:
+            for job_id in list(self._futures):
+                self._finish(job_id, error=ExtractionError("extractor pool closed"))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Function to get the process-wide pool configured by SPAD_EXTRACTOR and SPAD_EXTRACTOR_WORKERS
+def get_extractor_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            size = int(os.environ.get("SPAD_EXTRACTOR_WORKERS", 0)) or None
+            _pool = ExtractorPool(os.environ.get("SPAD_EXTRACTOR", "native"), size=size)
+            atexit.register(_pool.close)
+        return _pool
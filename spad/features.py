@@ -0,0 +1,265 @@
+"""Native NumPy implementation of the hybrid GTCC + MFCC feature vector.
+
+Mirrors ``feature_extraction.m``: the audio is resampled to 16 kHz, cut into
+30 ms Hamming frames with a 20 ms overlap, and summarised by the frame means
+of the coefficients, their deltas and their delta-deltas. The layout of the
+81 values matches the columns of ``GTCC-MFCC_*.csv`` so the existing
+``Scaler`` and ``RandomForestClassifier`` artifacts can be reused as is.
+
+Run ``python -m spad.features --check`` to compare against MATLAB reference
+vectors for the clips in ``audio_sample/``.
+"""
+import argparse
+import glob
+import os
+import sys
+from functools import lru_cache
+
+import numpy as np
+import soundfile as sf
+from numpy.lib.stride_tricks import sliding_window_view
+
+from spad.resample import resample
+
+# Bump whenever a change below alters the extracted values
+FEATURE_VERSION = "gtcc-mfcc-1"
+
+# Parameters used by feature_extraction.m and model/FeatureExtraction.m
+SAMPLE_RATE = 16000
+WINDOW_LENGTH = round(SAMPLE_RATE * 0.03)   # 30 ms Hamming window
+OVERLAP_LENGTH = round(SAMPLE_RATE * 0.02)  # 20 ms overlap
+HOP_LENGTH = WINDOW_LENGTH - OVERLAP_LENGTH
+NUM_COEFFS = 13
+NUM_BANDS = 32
+DELTA_WINDOW_LENGTH = 9
+GAMMATONE_MIN_FREQ = 50
+
+# Column names of the extracted feature sets (without the label)
+FEATURE_NAMES = (['LogEnergy'] + [f'GTCC{i}' for i in range(13)]
+                 + ['LogEnergy_delta'] + [f'GTCC{i}_delta' for i in range(13)]
+                 + ['LogEnergy_delta-delta'] + [f'GTCC{i}_delta-delta' for i in range(13)]
+                 + [f'MFCC{i}' for i in range(13)]
+                 + [f'MFCC{i}_delta' for i in range(13)]
+                 + [f'MFCC{i}_delta-delta' for i in range(13)])
+NUM_FEATURES = len(FEATURE_NAMES)
+
+REFERENCE_PATH = os.path.join("audio_sample", "reference_features.csv")
+# Native vectors for audio_sample/, pinned so the tests catch any change in the extractor's output
+PINNED_PATH = os.path.join("tests", "data", "native_features.csv")
+
+_REALMIN = np.finfo(np.float64).tiny
+
+
+# Function to convert between Hz and the mel / ERB-rate scales (MATLAB hz2mel, hz2erb)
+def hz_to_mel(hz):
+    return 2595 * np.log10(1 + np.asarray(hz, dtype=np.float64) / 700)
+
+
+def mel_to_hz(mel):
+    return 700 * (10 ** (np.asarray(mel, dtype=np.float64) / 2595) - 1)
+
+
+def hz_to_erb(hz):
+    return 21.366 * np.log10(1 + 0.00437 * np.asarray(hz, dtype=np.float64))
+
+
+def erb_to_hz(erb):
+    return (10 ** (np.asarray(erb, dtype=np.float64) / 21.366) - 1) / 0.00437
+
+
+@lru_cache(maxsize=None)
+def mel_filter_bank(sr=SAMPLE_RATE, n_fft=WINDOW_LENGTH, num_bands=NUM_BANDS):
+    """ Triangular mel filters over [0, sr/2], normalised by bandwidth """
+    freqs = np.linspace(0, sr / 2, n_fft // 2 + 1)
+    edges = mel_to_hz(np.linspace(hz_to_mel(0), hz_to_mel(sr / 2), num_bands + 2))
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+
+    rising = (freqs - lower) / (center - lower)
+    falling = (upper - freqs) / (upper - center)
+    bank = np.maximum(0, np.minimum(rising, falling))
+    bank *= 2 / (upper - lower)
+    bank.setflags(write=False)
+    return bank
+
+
+@lru_cache(maxsize=None)
+def gammatone_filter_bank(sr=SAMPLE_RATE, n_fft=WINDOW_LENGTH, min_freq=GAMMATONE_MIN_FREQ):
+    """ Fourth-order gammatone magnitude responses on the ERB scale, normalised by bandwidth """
+    freqs = np.linspace(0, sr / 2, n_fft // 2 + 1)
+    num_bands = int(np.ceil(hz_to_erb(sr / 2) - hz_to_erb(min_freq)))
+    centers = erb_to_hz(np.linspace(hz_to_erb(min_freq), hz_to_erb(sr / 2), num_bands))[:, None]
+
+    erb = 24.7 * (4.37 * centers / 1000 + 1)
+    bank = (1 + ((freqs - centers) / (1.019 * erb)) ** 2) ** -2
+    bank /= erb
+    bank.setflags(write=False)
+    return bank
+
+
+@lru_cache(maxsize=None)
+def dct_matrix(num_coeffs=NUM_COEFFS, num_bands=NUM_BANDS):
+    """ Orthonormal DCT-II matrix of shape (num_coeffs, num_bands) """
+    n = np.arange(num_bands)
+    k = np.arange(num_coeffs)[:, None]
+    matrix = np.sqrt(2 / num_bands) * np.cos(np.pi * k * (2 * n + 1) / (2 * num_bands))
+    matrix[0] /= np.sqrt(2)
+    matrix.setflags(write=False)
+    return matrix
+
+
+@lru_cache(maxsize=None)
+def analysis_window(window_length=WINDOW_LENGTH):
+    window = np.hamming(window_length)
+    window.setflags(write=False)
+    return window
+
+
+# Function to cut a signal into overlapping frames without copying it
+def frame_signal(y, window_length=WINDOW_LENGTH, hop_length=HOP_LENGTH):
+    if len(y) < window_length:
+        return np.empty((0, window_length), dtype=y.dtype)
+    return sliding_window_view(y, window_length)[::hop_length]
+
+
+# Function to compute cepstral coefficients from a magnitude spectrum (frames x bins)
+def cepstral_coefficients(spectrum, filter_bank, num_coeffs=NUM_COEFFS):
+    band_energy = spectrum @ filter_bank.T
+    np.maximum(band_energy, _REALMIN, out=band_energy)
+    return np.log10(band_energy) @ dct_matrix(num_coeffs, filter_bank.shape[0]).T
+
+
+# Function to compute deltas the way MATLAB audioDelta does (causal filter, zero initial state)
+def audio_delta(x, window_length=DELTA_WINDOW_LENGTH, zi=None):
+    from scipy.signal import lfilter  # deferred: scipy.signal alone takes about a second to import
+
+    m = window_length // 2
+    b = np.arange(m, -m - 1, -1) / np.sum(np.arange(1, m + 1) ** 2)
+    if zi is None:
+        return lfilter(b, 1, x, axis=0)
+    return lfilter(b, 1, x, axis=0, zi=zi)
+
+
+# Function to compute per-frame GTCC (log energy prepended) and MFCC of a 16 kHz signal
+def frame_features(y, sr=SAMPLE_RATE):
+    frames = frame_signal(np.asarray(y, dtype=np.float64))
+    if not len(frames):
+        raise ValueError(f"Audio is shorter than one {WINDOW_LENGTH}-sample analysis frame.")
+    return features_of_frames(frames, sr)
+
+
+def features_of_frames(frames, sr=SAMPLE_RATE):
+    log_energy = np.log(np.maximum(np.einsum('ij,ij->i', frames, frames), _REALMIN))
+    spectrum = np.abs(np.fft.rfft(frames * analysis_window(), n=WINDOW_LENGTH))
+
+    gtcc = cepstral_coefficients(spectrum, gammatone_filter_bank(sr))
+    mfcc = cepstral_coefficients(spectrum, mel_filter_bank(sr))
+    return np.column_stack([log_energy, gtcc]), mfcc
+
+
+# Function to mean-pool coefficients, deltas and delta-deltas into the hybrid vector
+def pool_features(gtcc, mfcc):
+    pooled = []
+    for coeffs in (gtcc, mfcc):
+        delta = audio_delta(coeffs)
+        delta_delta = audio_delta(delta)
+        pooled += [coeffs.mean(axis=0), delta.mean(axis=0), delta_delta.mean(axis=0)]
+
+    # Same order as feature_extraction.m: [GT, dGT, ddGT, MF, dMF, ddMF]
+    return np.concatenate(pooled)[None, :]
+
+
+def extract_hybrid_features(y, sr=SAMPLE_RATE):
+    """ Returns the 1 x 81 hybrid feature row for a mono 16 kHz signal """
+    if sr != SAMPLE_RATE:
+        raise ValueError(f"Expected {SAMPLE_RATE} Hz audio, got {sr} Hz.")
+    gtcc, mfcc = frame_features(y, sr)
+    return pool_features(gtcc, mfcc)
+
+
+# Function to resample one channel with a polyphase filter, like MATLAB resample
+def resample_audio(y, orig_sr, sr=SAMPLE_RATE):
+    if orig_sr == sr:
+        return y
+    return resample(y, orig_sr, sr, dtype=np.float64)
+
+
+# Function to read an audio file the way feature_extraction.m does (first channel, 16 kHz)
+def load_audio(path, sr=SAMPLE_RATE):
+    data, fsr = sf.read(path, always_2d=True)
+    return resample_audio(data[:, 0], fsr, sr), sr
+
+
+def extract_features_from_file(path):
+    y, sr = load_audio(path)
+    return extract_hybrid_features(y, sr)
+
+
+# Function to produce reference vectors by running feature_extraction.m (needs MATLAB)
+def write_reference(paths, reference_path=REFERENCE_PATH):
+    from spad.matlab import extract_features_matlab, session_workspace
+
+    rows = []
+    for path in paths:
+        with session_workspace() as workdir:
+            features = extract_features_matlab(path, workdir, timeout=None)
+        rows.append([os.path.basename(path)] + [repr(float(v)) for v in features.ravel()])
+
+    with open(reference_path, "w") as f:
+        for row in rows:
+            f.write(",".join(row) + "\n")
+
+
+# Function to pin the native extractor's current vectors for the tests
+def write_pinned(paths, pinned_path=PINNED_PATH):
+    with open(pinned_path, "w") as f:
+        for path in paths:
+            features = extract_features_from_file(path)
+            f.write(",".join([os.path.basename(path)] + [repr(float(v)) for v in features.ravel()]) + "\n")
+
+
+# Function to compare the native extractor against the MATLAB reference vectors
+def check_parity(reference_path=REFERENCE_PATH, rtol=1e-3, atol=1e-4):
+    audio_dir = os.path.dirname(reference_path)
+    failures = 0
+    with open(reference_path) as f:
+        for line in f:
+            name, *values = line.strip().split(",")
+            expected = np.array(values, dtype=np.float64)
+            actual = extract_features_from_file(os.path.join(audio_dir, name)).ravel()
+            close = np.isclose(actual, expected, rtol=rtol, atol=atol)
+            worst = np.max(np.abs(actual - expected))
+            print(f"{name}: {close.sum()}/{NUM_FEATURES} within tolerance, max abs diff {worst:.2e}")
+            failures += int(not close.all())
+    return failures == 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Native GTCC + MFCC feature extraction.")
+    parser.add_argument("files", nargs="*", help="audio files to extract (defaults to audio_sample/*.wav)")
+    parser.add_argument("--check", action="store_true", help="compare against the MATLAB reference vectors")
+    parser.add_argument("--write-reference", action="store_true", help="regenerate the reference vectors with MATLAB")
+    parser.add_argument("--reference", default=REFERENCE_PATH)
+    parser.add_argument("--write-pinned", action="store_true",
+                        help=f"pin the native vectors in {PINNED_PATH} after an intended change")
+    args = parser.parse_args(argv)
+
+    files = args.files or sorted(glob.glob(os.path.join("audio_sample", "*.wav")))
+    if args.write_reference:
+        write_reference(files, args.reference)
+    if args.write_pinned:
+        write_pinned(files)
+        return 0
+    if args.check:
+        if not os.path.exists(args.reference):
+            parser.error(f"{args.reference} not found; generate it with --write-reference on a MATLAB host.")
+        return 0 if check_parity(args.reference) else 1
+    if not args.write_reference:
+        np.set_printoptions(precision=4, suppress=True, linewidth=120)
+        for path in files:
+            print(path)
+            print(extract_features_from_file(path).ravel())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+"""Flattened-array inference for the served RandomForestClassifier.
+
+Usage::
+
+    python -m spad.forest            # compile model/RandomForestClassifier into model/CompiledForest
+    python -m spad.forest --check    # compare with model.predict and time both
+
+The fitted trees are concatenated into contiguous node arrays (feature,
+threshold, children, leaf class probabilities). The ``Scaler`` is folded into
+the thresholds, so raw feature vectors go straight in. Each threshold is
+replaced by the largest float64 raw value that sklearn would send left: trees
+compare ``float32((x - mean) / scale) <= threshold``, which is monotone in
+``x``, so a bisection finds the exact raw cut-off and the folded comparison
+makes the same decision for every finite input. Traversal advances every
+(row, tree) pair one level per step with a few vectorised gathers, dropping
+pairs that have reached their leaf, and probabilities are averaged in tree order as sklearn does. Predictions match
+``model.predict(scaler.transform(X))`` exactly.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from spad.models import COMPILED_PATH, MODEL_PATH, SCALER_PATH, _file_version, registry
+
+# Rows traversed together; keeps the (rows x trees) working set in cache
+BATCH_ROWS = 2048
+
+
+def _ordered_keys(x):
+    """ Maps float64 values to uint64 keys with the same ordering """
+    bits = np.asarray(x, dtype=np.float64).view(np.int64)
+    return (bits ^ ((bits >> 63) & np.int64(0x7FFFFFFFFFFFFFFF))).view(np.uint64) ^ np.uint64(1 << 63)
+
+
+def _from_keys(keys):
+    bits = (keys ^ np.uint64(1 << 63)).view(np.int64)
+    return (bits ^ ((bits >> 63) & np.int64(0x7FFFFFFFFFFFFFFF))).view(np.float64)
+
+
+# Function to fold a scaler into tree thresholds without changing a single decision
+def fold_thresholds(threshold, mean, scale):
+    """ Returns the largest raw x with float32((x - mean) / scale) <= threshold, elementwise """
+    def goes_left(x):
+        with np.errstate(over="ignore"):
+            return ((x - mean) / scale).astype(np.float32) <= threshold
+
+    biggest = np.finfo(np.float64).max
+    lo = np.full(threshold.shape, _ordered_keys(-biggest))
+    hi = np.full(threshold.shape, _ordered_keys(biggest))
+    always_left = goes_left(np.full(threshold.shape, biggest))
+    never_left = ~goes_left(np.full(threshold.shape, -biggest))
+
+    # Invariant: goes_left(lo) and not goes_left(hi)
+    for _ in range(64):
+        mid = lo + (hi - lo) // np.uint64(2)
+        left = goes_left(_from_keys(mid))
+        lo = np.where(left, mid, lo)
+        hi = np.where(left, hi, mid)
+    folded = _from_keys(lo)
+    folded[always_left] = np.inf
+    folded[never_left] = -np.inf
+    return folded
+
+
+class CompiledForest:
+    """ A random forest as flat node arrays over raw (unscaled) features """
+
+    def __init__(self, feature, threshold, children, leaf_proba, roots, max_depth, classes, source=None):
+        self.feature = feature          # split feature per node (0 at leaves)
+        self.threshold = threshold      # folded raw threshold per node (+inf at leaves)
+        self.children = children        # (nodes, 2): left/right child; leaves point at themselves
+        self.leaf_proba = leaf_proba    # (nodes, classes) class probabilities, zero for inner nodes
+        self.roots = roots
+        self.max_depth = max_depth
+        self.classes_ = classes
+        self.source = source            # file versions of the model and scaler this was compiled from
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    def apply(self, X):
+        """ Returns the leaf node reached in every tree, shape (rows, trees) """
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        values = X.ravel()
+        children = self.children.ravel()
+        is_leaf = self.children[:, 0] == np.arange(len(self.children))
+
+        # One entry per (row, tree); entries drop out as soon as they reach a leaf
+        row_start = np.repeat(np.arange(len(X)) * X.shape[1], len(self.roots))
+        leaves = np.tile(self.roots.astype(np.intp), len(X))
+        active = np.flatnonzero(~is_leaf[leaves])
+        node = leaves[active]
+        while len(active):
+            go_right = values[row_start[active] + self.feature[node]] > self.threshold[node]
+            node = children[2 * node + go_right]
+            leaves[active] = node
+            inner = ~is_leaf[node]
+            active, node = active[inner], node[inner]
+        return leaves.reshape(len(X), len(self.roots))
+
+    def predict_proba(self, X):
+        X = np.atleast_2d(X)
+        proba = np.empty((len(X), len(self.classes_)))
+        for start in range(0, len(X), BATCH_ROWS):
+            leaves = self.apply(X[start:start + BATCH_ROWS])
+            # Sum tree by tree, in sklearn's order, so ties and rounding match
+            total = np.zeros((len(leaves), len(self.classes_)))
+            for tree in range(leaves.shape[1]):
+                total += self.leaf_proba[leaves[:, tree]]
+            proba[start:start + BATCH_ROWS] = total / len(self.roots)
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+
+# Function to flatten a fitted RandomForestClassifier (and optionally its scaler) into a CompiledForest
+def compile_forest(model, scaler=None, source=None):
+    if model.n_outputs_ != 1:
+        raise ValueError("Only single-output forests can be compiled.")
+    n_features = model.n_features_in_
+    mean = np.zeros(n_features) if scaler is None else np.asarray(scaler.mean_, dtype=np.float64)
+    scale = np.ones(n_features) if scaler is None else np.asarray(scaler.scale_, dtype=np.float64)
+
+    features, thresholds, children, probas, roots = [], [], [], [], []
+    offset = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n = tree.node_count
+        is_leaf = tree.children_left == -1
+        own = np.arange(n)
+
+        feature = np.where(is_leaf, 0, tree.feature)
+        threshold = fold_thresholds(tree.threshold, mean[feature], scale[feature])
+        threshold[is_leaf] = np.inf
+        child = np.column_stack([np.where(is_leaf, own, tree.children_left),
+                                 np.where(is_leaf, own, tree.children_right)]) + offset
+
+        value = tree.value[:, 0, :]
+        proba = value / value.sum(axis=1, keepdims=True)
+        proba[~is_leaf] = 0.0
+
+        features.append(feature)
+        thresholds.append(threshold)
+        children.append(child)
+        probas.append(proba)
+        roots.append(offset)
+        offset += n
+
+    return CompiledForest(
+        feature=np.concatenate(features).astype(np.int32),
+        threshold=np.concatenate(thresholds),
+        children=np.ascontiguousarray(np.concatenate(children).astype(np.int32)),
+        leaf_proba=np.ascontiguousarray(np.concatenate(probas)),
+        roots=np.array(roots, dtype=np.int32),
+        max_depth=max(estimator.tree_.max_depth for estimator in model.estimators_),
+        classes=np.asarray(model.classes_),
+        source=source,
+    )
+
+
+def _source_versions():
+    return [_file_version(MODEL_PATH), _file_version(SCALER_PATH)]
+
+
+# Function to compile the served model and scaler and publish the result next to them
+def export_compiled(path=COMPILED_PATH):
+    from spad.models import get_model_pair, publish_artifact
+
+    scaler, model = get_model_pair()
+    compiled = compile_forest(model, scaler, source=_source_versions())
+    publish_artifact(compiled, path)
+    return compiled
+
+
+# Function to get the compiled forest, or None when it is missing or was built from other artifacts
+def get_compiled_forest(path=COMPILED_PATH):
+    if not os.path.exists(path):
+        return None
+    compiled = registry.get(path)
+    try:
+        current = _source_versions()
+    except FileNotFoundError:
+        return None
+    return compiled if [list(v) for v in compiled.source or []] == [list(v) for v in current] else None
+
+
+def _evaluation_rows(scaler, n_rows=20000, seed=0):
+    from spad.store import open_split
+    try:
+        return open_split("test").matrix(), "GTCC-MFCC_test"
+    except FileNotFoundError:
+        rng = np.random.default_rng(seed)
+        return scaler.mean_ + scaler.scale_ * rng.standard_normal((n_rows, len(scaler.mean_))), "synthetic rows"
+
+
+def _best_time(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# Function to check that compiled and sklearn predictions agree and compare their latency
+def check(compiled=None, repeat=20):
+    from spad.models import get_model_pair, standardize
+
+    scaler, model = get_model_pair()
+    compiled = compiled or compile_forest(model, scaler)
+    X, name = _evaluation_rows(scaler)
+    X = np.asarray(X, dtype=np.float64)
+
+    expected = model.predict(standardize(scaler, X))
+    actual = compiled.predict(X)
+    mismatches = int(np.sum(expected != actual))
+    print(f"{name}: {len(X)} rows, {mismatches} prediction mismatches")
+
+    row = X[:1]
+    sklearn_row = _best_time(lambda: model.predict(standardize(scaler, row)), repeat)
+    compiled_row = _best_time(lambda: compiled.predict(row), repeat)
+    sklearn_batch = _best_time(lambda: model.predict(standardize(scaler, X)), 3)
+    compiled_batch = _best_time(lambda: compiled.predict(X), 3)
+    print(f"single row: sklearn {sklearn_row * 1e6:9.0f} us   compiled {compiled_row * 1e6:7.0f} us   "
+          f"({sklearn_row / compiled_row:.0f}x)")
+    print(f"{len(X)} rows: sklearn {sklearn_batch * 1e3:9.1f} ms   compiled {compiled_batch * 1e3:7.1f} ms   "
+          f"({sklearn_batch / compiled_batch:.1f}x, {len(X) / compiled_batch:,.0f} rows/s)")
+    return mismatches == 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile the served random forest into flat node arrays.")
+    parser.add_argument("--check", action="store_true", help="compare with model.predict and time both")
+    args = parser.parse_args(argv)
+
+    compiled = export_compiled()
+    print(f"{COMPILED_PATH}: {compiled.n_estimators} trees, {len(compiled.feature)} nodes, depth {compiled.max_depth}")
+    if args.check:
+        return 0 if check(compiled) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    # Run from the package module so the pickled class is spad.forest.CompiledForest, not __main__'s
+    from spad.forest import main as package_main
+    sys.exit(package_main())
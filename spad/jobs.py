@@ -0,0 +1,205 @@
+"""Background detection jobs tied to a Streamlit session.
+
+The detection page submits extraction and prediction as a :class:`DetectionJob`
+that runs on its own thread, so the script run can draw the waveform and
+return at once. The page then polls the job's stage and progress. Each
+session has at most one job in :data:`detection_jobs`:
+
+- submitting a different upload cancels the session's previous job
+  (superseded);
+- a job whose session stops polling for ``ABANDON_AFTER`` seconds is
+  cancelled by a reaper thread (abandoned: the tab was closed or the page
+  left). Finished jobs are dropped after the same delay.
+
+Cancelling sets a flag the job checks between stages and cancels every
+extraction it is waiting on (see :meth:`spad.extractors.ExtractorPool.cancel`).
+Jobs that score many files report each file as a row as soon as it is done.
+A job also owns the temporary workspace its audio is written to, so the
+workspace is removed however the job ends.
+"""
+import contextvars
+import itertools
+import threading
+import time
+
+from spad.telemetry import count
+
+# Seconds without a poll after which a running job is cancelled and a finished one dropped
+ABANDON_AFTER = 30.0
+REAP_INTERVAL = 5.0
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class DetectionJob:
+    """ One background run of the detection pipeline with its stage, progress and outcome """
+
+    _ids = itertools.count()
+
+    def __init__(self, session_id, key):
+        self.id = next(self._ids)
+        self.session_id = session_id
+        self.key = key
+        self.stage = "queued"
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created = self.last_seen = time.monotonic()
+        self.finished = None
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._pending = {}  # id(future) -> callable cancelling it
+        self._rows = []
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def status(self):
+        if not self.done:
+            return "cancelling" if self.cancelled else "running"
+        if self.cancelled:
+            return "cancelled"
+        return "failed" if self.error is not None else "done"
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled(self.key)
+
+    def set_stage(self, stage, progress):
+        """ Moves the job to its next stage; raises JobCancelled when it was cancelled """
+        self.raise_if_cancelled()
+        self.stage, self.progress = stage, progress
+
+    def add_row(self, row):
+        with self._lock:
+            self._rows.append(row)
+
+    def rows(self):
+        """ Returns a copy of the rows reported so far """
+        with self._lock:
+            return list(self._rows)
+
+    def wait_for(self, future, cancel):
+        """ Waits for a future the job depends on; cancel(future) is called if the job is cancelled """
+        with self._lock:
+            if self.cancelled:
+                cancel(future)
+                raise JobCancelled(self.key)
+            self._pending[id(future)] = lambda: cancel(future)
+        try:
+            return future.result()
+        except Exception:
+            if self.cancelled:
+                raise JobCancelled(self.key) from None
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(id(future), None)
+
+    def cancel(self):
+        with self._lock:
+            if self.done or self.cancelled:
+                return False
+            self._cancelled.set()
+            for cancel_pending in self._pending.values():
+                cancel_pending()
+        return True
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def _run(self, func, args):
+        try:
+            self.result = func(self, *args)
+            self.stage, self.progress = "done", 1.0
+        except JobCancelled:
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = time.monotonic()
+            self._done.set()
+            count("detection_jobs", outcome=self.status)
+
+
+class JobManager:
+    """ At most one detection job per session; superseded and abandoned jobs are cancelled """
+
+    def __init__(self, abandon_after=ABANDON_AFTER, reap_interval=REAP_INTERVAL):
+        self.abandon_after = abandon_after
+        self.reap_interval = reap_interval
+        self._jobs = {}  # session id -> DetectionJob
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    def submit(self, session_id, key, func, *args):
+        """ Returns the session's job for key, starting func(job, *args) on a new thread if needed """
+        with self._lock:
+            job = self._jobs.get(session_id)
+            if job is not None and job.key == key and not job.cancelled:
+                job.touch()
+                return job
+            if job is not None:
+                job.cancel()
+            job = DetectionJob(session_id, key)
+            self._jobs[session_id] = job
+            self._start_reaper()
+
+        # Run in a copy of the caller's context so spans keep the request id
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(job._run, func, args), name=f"spad-job-{job.id}",
+                         daemon=True).start()
+        return job
+
+    def get(self, session_id):
+        with self._lock:
+            job = self._jobs.get(session_id)
+        if job is not None:
+            job.touch()
+        return job
+
+    def cancel(self, session_id):
+        with self._lock:
+            job = self._jobs.pop(session_id, None)
+        return job is not None and job.cancel()
+
+    def active(self):
+        with self._lock:
+            return sum(not job.done for job in self._jobs.values())
+
+    def reap(self, now=None):
+        """ Cancels running jobs nobody polled recently and forgets old finished ones """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for session_id, job in list(self._jobs.items()):
+                if now - job.last_seen <= self.abandon_after:
+                    continue
+                if not job.done:
+                    job.cancel()
+                    count("detection_jobs_abandoned")
+                del self._jobs[session_id]
+
+    def _start_reaper(self):
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_forever, name="spad-job-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_forever(self):
+        while True:
+            time.sleep(self.reap_interval)
+            self.reap()
+
+
+detection_jobs = JobManager()
@@ -0,0 +1,56 @@
+"""Feature extraction through ``feature_extraction.m``.
+
+Each call gets its own working directory, so concurrent sessions never share
+``features.mat``. MATLAB runs in ``-batch`` mode and exits when the script
+finishes; completion is signalled by the process exit rather than by polling
+for the output file.
+"""
+import os
+import subprocess
+import tempfile
+from contextlib import contextmanager
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAX_WAIT_TIME = 30  # Maximum wait time in seconds
+MAT_NAME = "features.mat"
+
+
+class ExtractionError(RuntimeError):
+    pass
+
+
+class ExtractionTimeout(ExtractionError):
+    pass
+
+
+# Function to give one session/request a private directory that is always removed afterwards
+@contextmanager
+def session_workspace(prefix="spad-"):
+    with tempfile.TemporaryDirectory(prefix=prefix) as workdir:
+        yield workdir
+
+
+def _matlab_string(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def matlab_command(audio_path, mat_name=MAT_NAME):
+    return (f"addpath({_matlab_string(REPO_DIR)}); "
+            f"feature_extraction({_matlab_string(os.path.abspath(audio_path))}, {_matlab_string(mat_name)})")
+
+
+# Function to run feature_extraction.m in workdir and return the 1 x 81 hybrid features
+def extract_features_matlab(audio_path, workdir, timeout=MAX_WAIT_TIME, matlab="matlab"):
+    try:
+        completed = subprocess.run([matlab, "-batch", matlab_command(audio_path)], cwd=workdir,
+                                   capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired as e:
+        raise ExtractionTimeout(f"MATLAB did not finish within {timeout} s") from e
+
+    mat_path = os.path.join(workdir, MAT_NAME)
+    if completed.returncode != 0 or not os.path.exists(mat_path):
+        raise ExtractionError(completed.stderr.strip() or f"MATLAB exited with status {completed.returncode}")
+
+    import scipy.io
+
+    return scipy.io.loadmat(mat_path)['hybridFeatures']
@@ -0,0 +1,179 @@
+"""Process-wide registry for the ``Scaler`` and ``RandomForestClassifier`` artifacts.
+
+Each artifact is unpickled once per process and shared by every Streamlit
+session. Large NumPy arrays are memory-mapped (``joblib.load(mmap_mode='r')``)
+so forked workers share the same pages. When the file on disk changes, the
+next lookup loads the new version and swaps it in atomically; callers holding
+the previous object keep using it until they are done.
+
+The model's thresholds only make sense with the scaler it was fitted with, so
+the two are looked up as a pair: every published pair carries the same
+``spad_version`` attribute, and while only one of the two files has been
+replaced the registry keeps serving the last matching pair.
+"""
+import os
+import threading
+import time
+
+from spad.telemetry import span
+
+MODEL_DIR = os.environ.get("SPAD_MODEL_DIR", "model")
+SCALER_PATH = os.path.join(MODEL_DIR, "Scaler")
+MODEL_PATH = os.path.join(MODEL_DIR, "RandomForestClassifier")
+# Flat-array version of the forest with the scaler folded in (see spad/forest.py)
+COMPILED_PATH = os.path.join(MODEL_DIR, "CompiledForest")
+# Compact version of the forest and scaler (see spad/compact.py)
+COMPACT_PATH = os.path.join(MODEL_DIR, "CompactForest")
+# MFCC screening model that answers confident clips before the forest (see spad/cascade.py)
+CASCADE_PATH = os.path.join(MODEL_DIR, "Cascade")
+
+# Minimum number of seconds between two checks of an artifact's file
+CHECK_INTERVAL = 2.0
+# Attribute that ties a model to the scaler it was published with (missing on the original pair)
+PAIR_TAG = "spad_version"
+# How often, and how many seconds apart, a process with no matching pair yet rereads the files
+PAIR_RETRIES = 20
+PAIR_RETRY_WAIT = 0.05
+
+
+class LoadedArtifact:
+    """ An unpickled artifact together with the file version it came from """
+
+    def __init__(self, obj, path, version):
+        self.obj = obj
+        self.path = path
+        self.version = version
+        self.loaded_at = time.time()
+
+
+def _file_version(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+class ModelRegistry:
+    """ Loads artifacts lazily, once per process, and reloads them when their file changes """
+
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._artifacts = {}
+        self._last_checked = {}
+        self._locks = {}
+        self._pairs = {}
+        self._registry_lock = threading.Lock()
+
+    def _lock_for(self, path):
+        with self._registry_lock:
+            return self._locks.setdefault(path, threading.Lock())
+
+    def _load(self, path):
+        import joblib
+
+        version = _file_version(path)
+        with span("model_load", artifact=os.path.basename(path)):
+            obj = joblib.load(path, mmap_mode='r')
+        return LoadedArtifact(obj, path, version)
+
+    def get_artifact(self, path):
+        current = self._artifacts.get(path)
+        now = time.monotonic()
+        if current is not None and now - self._last_checked.get(path, 0) < self.check_interval:
+            return current
+
+        with self._lock_for(path):
+            # Another thread may have refreshed the artifact while we waited
+            current = self._artifacts.get(path)
+            self._last_checked[path] = now
+            if current is not None and current.version == _file_version(path):
+                return current
+
+            loaded = self._load(path)
+            self._artifacts[path] = loaded
+            return loaded
+
+    def get(self, path):
+        return self.get_artifact(path).obj
+
+    def get_pair(self, first, second):
+        """ Returns the objects of two artifacts published together, never one new and one old """
+        key = (first, second)
+        for _ in range(PAIR_RETRIES):
+            pair = self.get_artifact(first), self.get_artifact(second)
+            if getattr(pair[0].obj, PAIR_TAG, None) == getattr(pair[1].obj, PAIR_TAG, None):
+                self._pairs[key] = pair
+                return pair[0].obj, pair[1].obj
+            if key in self._pairs:
+                # Halfway through a publish: keep the previous pair until the other file follows
+                return self._pairs[key][0].obj, self._pairs[key][1].obj
+            time.sleep(PAIR_RETRY_WAIT)
+            self._last_checked.pop(first, None)
+            self._last_checked.pop(second, None)
+        raise RuntimeError(f"{first} and {second} were not published together; publish them as one version.")
+
+    def version(self, path):
+        artifact = self._artifacts.get(path)
+        return None if artifact is None else artifact.version
+
+    def warm(self, paths):
+        """ Loads every artifact that exists; missing files are left for the first lookup to report """
+        for path in paths:
+            if os.path.exists(path):
+                self.get_artifact(path)
+
+    def clear(self):
+        with self._registry_lock:
+            self._artifacts.clear()
+            self._last_checked.clear()
+            self._pairs.clear()
+
+
+registry = ModelRegistry()
+_warm_thread = None
+
+
+# Function to get the served scaler and model from the same published version
+def get_model_pair():
+    return registry.get_pair(SCALER_PATH, MODEL_PATH)
+
+
+def get_scaler():
+    return get_model_pair()[0]
+
+
+# Function to standardize raw feature rows exactly like scaler.transform(X)
+def standardize(scaler, X):
+    # The Scaler was fitted on a DataFrame, so sklearn warns on every plain array; the arithmetic is the same
+    import numpy as np
+
+    X = np.array(X)
+    if X.dtype not in (np.float32, np.float64):
+        X = X.astype(np.float64)
+    if scaler.with_mean:
+        X -= scaler.mean_
+    if scaler.with_std:
+        X /= scaler.scale_
+    return X
+
+
+def get_model():
+    return get_model_pair()[1]
+
+
+# Function to write an artifact so that readers only ever see a complete file
+def publish_artifact(obj, path):
+    import joblib
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    joblib.dump(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+# Function to load the models in the background once per process so the first request is warm
+def warm_models():
+    global _warm_thread
+    with registry._registry_lock:
+        if _warm_thread is None:
+            _warm_thread = threading.Thread(target=registry.warm, args=([SCALER_PATH, MODEL_PATH, COMPILED_PATH, COMPACT_PATH, CASCADE_PATH],),
+                                            name="spad-warm-models", daemon=True)
+            _warm_thread.start()
+    return _warm_thread
@@ -0,0 +1,115 @@
+"""The decode -> resample -> feature -> scale -> predict path shared by every entry point."""
+import os
+import time
+
+import soundfile as sf
+
+from spad.features import SAMPLE_RATE, extract_hybrid_features, resample_audio
+from spad.compact import get_compact_forest
+from spad.forest import get_compiled_forest
+from spad.models import get_model, get_model_pair, get_scaler, standardize
+from spad.streaming import is_long_recording, stream_features_from_file
+
+LABELS = {0: "spoof", 1: "bona fide"}
+STAGES = ("decode", "resample", "features", "scale", "predict")
+
+
+class StageTimer:
+    """ Accumulates wall-clock seconds per pipeline stage """
+
+    def __init__(self):
+        self.timings = {}
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+
+class _Stage:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        self.timer.timings[self.name] = self.timer.timings.get(self.name, 0.0) + elapsed
+        return False
+
+
+def normalize_features(features):
+    return standardize(get_scaler(), features)
+
+
+def predict_features(normalized_features):
+    return get_model().predict(normalized_features)
+
+
+# Function to get a forest that predicts from raw features and matches the served artifacts, or None
+def get_raw_forest():
+    return get_compiled_forest() or get_compact_forest()
+
+
+# Function to predict the classes of raw (unscaled) feature rows with the served artifacts
+def predict_raw_features(features):
+    raw_forest = get_raw_forest()
+    if raw_forest is not None:
+        return raw_forest.predict(features)
+    scaler, model = get_model_pair()
+    return model.predict(standardize(scaler, features))
+
+
+# Function to run the whole detection pipeline on one audio file
+def score_file(path, timer=None):
+    timer = timer or StageTimer()
+
+    if is_long_recording(path):
+        # Decoding and resampling happen block by block inside the streaming extractor
+        with timer.stage("features"):
+            features = stream_features_from_file(path)
+        duration = sf.info(path).duration
+    else:
+        with timer.stage("decode"):
+            data, fsr = sf.read(path, always_2d=True)
+        with timer.stage("resample"):
+            y = resample_audio(data[:, 0], fsr, SAMPLE_RATE)
+        with timer.stage("features"):
+            features = extract_hybrid_features(y, SAMPLE_RATE)
+        duration = len(data) / fsr
+        del data, y
+
+    raw_forest = get_raw_forest()
+    if raw_forest is not None:
+        # The compiled and compact forests apply the scaler themselves
+        with timer.stage("predict"):
+            prediction = int(raw_forest.predict(features)[0])
+    else:
+        scaler, model = get_model_pair()
+        with timer.stage("scale"):
+            normalized_features = standardize(scaler, features)
+        with timer.stage("predict"):
+            prediction = int(model.predict(normalized_features)[0])
+
+    return {
+        "path": path,
+        "prediction": prediction,
+        "label": LABELS[prediction],
+        "duration": duration,
+        "timings": dict(timer.timings),
+    }
+
+
+# Function to list the audio files below the given files and directories
+def find_audio_files(paths, extensions=("wav", "mp3", "ogg", "flac")):
+    suffixes = tuple(f".{ext}" for ext in extensions)
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(suffixes):
+                        yield os.path.join(root, name)
+        else:
+            yield path
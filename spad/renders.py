@@ -0,0 +1,187 @@
+"""Disk-backed cache of the About Dataset visualizations.
+
+Every panel (waveform, spectrogram, mel spectrogram, chroma) is computed from
+one audio file, so it is cached under the SHA-256 of the file's bytes, the
+transform name and its parameters. Each entry holds both the computed matrix
+and the rendered PNG, and lives in a :class:`spad.cache.ResultCache` (memory
+LRU in front of a size-bounded disk store). Switching visualizations then
+only reads a cached image.
+
+Pre-warm the cache at deploy time with ``python -m spad.renders``.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from functools import lru_cache
+
+import numpy as np
+import soundfile as sf
+
+from spad.cache import ResultCache
+
+RENDER_DIR = os.environ.get("SPAD_RENDER_DIR", os.path.join(".cache", "renders"))
+MAX_MEMORY_BYTES = 64 * 1024 * 1024
+MAX_DISK_BYTES = 128 * 1024 * 1024
+# Bump whenever a transform or the drawing code changes
+RENDER_VERSION = 1
+
+# The two clips compared on the About Dataset page
+SAMPLE_FILES = {
+    "Spoof": "audio_sample/CON_T_0000001.wav",
+    "Bona Fide": "audio_sample/LA_T_1007571.wav",
+}
+
+TRANSFORMS = {
+    "waveform": {"name": "Waveform", "params": {}},
+    "spectrogram": {"name": "Spectrogram", "params": {"nfft": 256, "noverlap": 128}},
+    "mel": {"name": "Mel Spectrogram", "params": {"n_mels": 128}},
+    "chroma": {"name": "Chroma", "params": {}},
+}
+FIGURE_SIZE = (6.5, 5)
+DPI = 100
+
+
+@lru_cache(maxsize=64)
+def _file_digest(path, version):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Function to hash a file's bytes, rehashing only when its mtime or size changes
+def file_digest(path):
+    stat = os.stat(path)
+    return _file_digest(path, (stat.st_mtime_ns, stat.st_size))
+
+
+def render_key(digest, transform, params, title):
+    description = {"version": RENDER_VERSION, "transform": transform, "params": params, "title": title,
+                   "figure": [FIGURE_SIZE, DPI]}
+    return hashlib.sha256(f"{digest}|{json.dumps(description, sort_keys=True)}".encode()).hexdigest()
+
+
+# Function to get audio data
+def get_sound_data(path):
+    data, sr = sf.read(path)
+    if data.ndim > 1:
+        data = data.mean(axis=1)
+    return data, sr
+
+
+# Function to compute the matrix a transform plots
+def compute_matrix(transform, y, sr, params):
+    import librosa
+
+    if transform == "waveform":
+        return y.astype(np.float32)
+    if transform == "spectrogram":
+        from matplotlib import mlab
+        Sxx, freqs, times = mlab.specgram(y, NFFT=params["nfft"], Fs=sr, noverlap=params["noverlap"])
+        return {"Sxx": Sxx, "freqs": freqs, "times": times}
+    if transform == "mel":
+        S = librosa.feature.melspectrogram(y=y, sr=sr, n_mels=params["n_mels"])
+        return librosa.amplitude_to_db(S, ref=np.max)
+    if transform == "chroma":
+        return librosa.feature.chroma_cqt(y=y, sr=sr)
+    raise ValueError(f"Unknown transform {transform!r}; expected one of {', '.join(TRANSFORMS)}.")
+
+
+# Function to draw a computed matrix the way the About Dataset page always has
+def draw_matrix(transform, matrix, sr, params, title, ax):
+    import librosa.display
+
+    ax.set_title(title)
+    ax.set_xlabel('Time (s)')
+    if transform == "waveform":
+        ax.set_ylabel('Amplitude')
+        librosa.display.waveshow(matrix, sr=sr, color='r', alpha=0.7, ax=ax)
+    elif transform == "spectrogram":
+        # Same image Axes.specgram draws from these arrays
+        pad = (params["nfft"] - params["noverlap"]) / sr / 2
+        times, freqs = matrix["times"], matrix["freqs"]
+        extent = times[0] - pad, times[-1] + pad, freqs[0], freqs[-1]
+        im = ax.imshow(np.flipud(10. * np.log10(matrix["Sxx"])), extent=extent, aspect='auto')
+        ax.set_ylabel('Frequency (Hz)')
+        ax.figure.colorbar(im, ax=ax)
+    elif transform == "mel":
+        im = librosa.display.specshow(matrix, sr=sr, x_axis='time', y_axis='mel', ax=ax)
+        ax.set_xlabel('Time (s)')
+        ax.figure.colorbar(im, format='%+02.0f dB', ax=ax)
+    elif transform == "chroma":
+        im = librosa.display.specshow(matrix, sr=sr, x_axis='time', y_axis='chroma', vmin=0, vmax=1, ax=ax)
+        ax.set_xlabel('Time (s)')
+        ax.figure.colorbar(im, ax=ax)
+
+
+def render_png(transform, matrix, sr, params, title):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=FIGURE_SIZE)
+    try:
+        draw_matrix(transform, matrix, sr, params, title, ax)
+        fig.tight_layout()
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png", dpi=DPI)
+    finally:
+        plt.close(fig)
+    return buffer.getvalue()
+
+
+class RenderCache:
+    """ Computes, renders and caches visualization panels of audio files """
+
+    def __init__(self, directory=RENDER_DIR, max_memory_bytes=MAX_MEMORY_BYTES, max_disk_bytes=MAX_DISK_BYTES):
+        self.entries = ResultCache(directory, max_memory_bytes, max_disk_bytes)
+
+    def get(self, path, transform, title, params=None):
+        """ Returns {"matrix", "image", "sample_rate"} for one panel, computing it on a miss """
+        params = dict(TRANSFORMS[transform]["params"], **(params or {}))
+        key = render_key(file_digest(path), transform, params, title)
+        entry = self.entries.get(key)
+        if entry is None:
+            y, sr = get_sound_data(path)
+            matrix = compute_matrix(transform, y, sr, params)
+            entry = {"matrix": matrix, "image": render_png(transform, matrix, sr, params, title),
+                     "sample_rate": sr}
+            self.entries.put(key, entry)
+        return entry
+
+    def image(self, path, transform, title, params=None):
+        return self.get(path, transform, title, params)["image"]
+
+    def stats(self):
+        return self.entries.stats()
+
+
+render_cache = RenderCache()
+
+
+# Function to render every transform of the page's sample clips ahead of the first visitor
+def prewarm(samples=SAMPLE_FILES, transforms=TRANSFORMS, cache=render_cache):
+    for label, path in samples.items():
+        for transform in transforms:
+            start = time.perf_counter()
+            cache.get(path, transform, f"{label} - {TRANSFORMS[transform]['name']}")
+            yield path, transform, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-render the About Dataset visualizations into the render cache.")
+    parser.parse_args(argv)
+
+    for path, transform, elapsed in prewarm():
+        print(f"{path} {transform}: {elapsed * 1000:.0f}ms")
+    print(render_cache.stats())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""Parallel hyperparameter search with successive halving and a trial cache.
+
+Usage::
+
+    python -m spad.search rf --workers 8
+    python -m spad.search xgb --workers 8 --smote
+
+or, from the notebook, with the arrays it already holds::
+
+    from spad.search import grid, search
+    best_params, best_score = search(RandomForestClassifier, grid(n_estimators=[100, 200], max_depth=[None, 10]),
+                                     X_train, y_train, X_val, y_val, workers=8)
+
+Every configuration of the grid starts on a small random subset of the
+training rows. After each rung only the best ``1/eta`` of the configurations
+go on to the next rung, which has ``eta`` times more rows. The last rung uses
+the full training set, so the reported score is the same full-fit validation
+macro F1 the notebook loops compute. Trials run on a pool of worker
+processes. Each finished trial is appended to a JSONL cache keyed by the data,
+estimator, parameters and subset size, so a rerun or an interrupted search
+only fits what is missing.
+"""
+import argparse
+import hashlib
+import importlib
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+
+import numpy as np
+from sklearn.metrics import f1_score
+
+CACHE_DIR = os.environ.get("SPAD_SEARCH_CACHE", os.path.join(".cache", "search"))
+ETA = 3
+MIN_SAMPLES = 2000
+RANDOM_STATE = 42
+
+# The grids and fixed arguments of the notebook's search loops
+MODELS = {
+    "xgb": ("xgboost.XGBClassifier", {"objective": "binary:logistic", "seed": 42}, {
+        "n_estimators": [100, 200, 300, 400, 600, 800, 1000], "max_depth": [None, 3, 6, 9, 12, 15],
+        "min_child_weight": [1, 3, 5], "gamma": [0.1, 0.5, 1], "subsample": [0.8], "colsample_bytree": [0.8]}),
+    "rf": ("sklearn.ensemble.RandomForestClassifier", {"random_state": 42}, {
+        "n_estimators": [100, 200, 300, 400, 600, 800, 1000], "max_depth": [None, 10, 20, 30],
+        "min_samples_split": [2, 5, 10], "min_samples_leaf": [1, 2, 4]}),
+    "svc": ("sklearn.svm.SVC", {}, {
+        "kernel": ['poly', 'rbf'], "C": [0.01, 0.1, 1, 10, 100], "gamma": ['scale', 'auto']}),
+    "knn": ("sklearn.neighbors.KNeighborsClassifier", {}, {
+        "n_neighbors": list(range(2, 20)), "weights": ['uniform', 'distance'], "p": [1, 2]}),
+}
+
+
+# Function to list every combination of the given values, in itertools.product order
+def grid(**values):
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in product(*values.values())]
+
+
+def _plain(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _estimator_name(estimator):
+    return f"{estimator.__module__}.{estimator.__qualname__}"
+
+
+def data_fingerprint(*arrays):
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype}{array.shape}".encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def trial_key(estimator, fixed, params, n_samples):
+    description = {"estimator": _estimator_name(estimator), "fixed": {k: _plain(v) for k, v in fixed.items()},
+                   "params": {k: _plain(v) for k, v in params.items()}, "n_samples": n_samples}
+    return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class TrialCache:
+    """ Append-only JSONL record of finished trials for one dataset """
+
+    def __init__(self, path):
+        self.path = path
+        self.scores = {}
+        if os.path.exists(path):
+            with open(path, "rb+") as f:
+                content = f.read()
+                # Drop a last line cut short by a crash
+                if content and not content.endswith(b"\n"):
+                    f.truncate(content.rfind(b"\n") + 1)
+            with open(path) as f:
+                for line in f:
+                    trial = json.loads(line)
+                    self.scores[trial["key"]] = trial["score"]
+
+    def add(self, trial):
+        self.scores[trial["key"]] = trial["score"]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(trial, default=str) + "\n")
+
+
+_DATA = {}
+
+
+def _init_worker(X_train, y_train, X_val, y_val, order):
+    _DATA.update(X_train=X_train, y_train=y_train, X_val=X_val, y_val=y_val, order=order)
+
+
+# Function to fit one configuration on the first n_samples rows of the shuffled training set
+def _run_trial(estimator, fixed, params, n_samples):
+    rows = _DATA["order"][:n_samples]
+    start = time.perf_counter()
+    model = estimator(**fixed, **params)
+    model.fit(_DATA["X_train"][rows], _DATA["y_train"][rows])
+    y_val_pred = model.predict(_DATA["X_val"])
+    score = f1_score(_DATA["y_val"], y_val_pred, average='macro')
+    return float(score), time.perf_counter() - start
+
+
+# Function to pick the number of training rows of every rung
+def rung_sizes(num_configs, num_rows, eta=ETA, min_samples=MIN_SAMPLES):
+    rungs = 0
+    while eta > 1 and eta ** (rungs + 1) <= num_configs:
+        rungs += 1
+    sizes = [num_rows // eta ** (rungs - r) for r in range(rungs + 1)]
+    sizes = [size for size in sizes if size >= min_samples or size == num_rows]
+    return sizes or [num_rows]
+
+
+def search(estimator, configs, X_train, y_train, X_val, y_val, fixed=None, workers=None, eta=ETA,
+           min_samples=MIN_SAMPLES, cache_dir=CACHE_DIR, random_state=RANDOM_STATE, out=sys.stdout):
+    """ Returns (best_params, best_score) by validation macro F1 after successive halving """
+    fixed = fixed or {}
+    X_train, y_train = np.asarray(X_train), np.asarray(y_train)
+    X_val, y_val = np.asarray(X_val), np.asarray(y_val)
+    order = np.random.default_rng(random_state).permutation(len(X_train))
+    sizes = rung_sizes(len(configs), len(X_train), eta, min_samples)
+    fingerprint = data_fingerprint(X_train, y_train, X_val, y_val, order)
+    cache = TrialCache(os.path.join(cache_dir, f"{fingerprint}.jsonl"))
+
+    survivors = list(enumerate(configs))
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(X_train, y_train, X_val, y_val, order)) as pool:
+        for rung, n_samples in enumerate(sizes):
+            keys = {i: trial_key(estimator, fixed, params, n_samples) for i, params in survivors}
+            todo = [(i, params) for i, params in survivors if keys[i] not in cache.scores]
+            print(f"Rung {rung + 1}/{len(sizes)}: {len(survivors)} configurations on {n_samples} samples "
+                  f"({len(survivors) - len(todo)} cached)", file=out)
+
+            futures = {pool.submit(_run_trial, estimator, fixed, params, n_samples): (i, params)
+                       for i, params in todo}
+            for done, future in enumerate(as_completed(futures), 1):
+                i, params = futures[future]
+                score, seconds = future.result()
+                cache.add({"key": keys[i], "estimator": _estimator_name(estimator),
+                           "params": {k: _plain(v) for k, v in params.items()},
+                           "n_samples": n_samples, "score": score, "seconds": seconds})
+                print(f"Progress: {done}/{len(todo)}  {params}  score: {score}", file=out)
+
+            # Best first; ties keep grid order
+            ranked = sorted(survivors, key=lambda item: (-cache.scores[keys[item[0]]], item[0]))
+            if rung < len(sizes) - 1:
+                survivors = ranked[:max(1, math.ceil(len(ranked) / eta))]
+            else:
+                survivors = ranked
+
+    best_index, best_params = survivors[0]
+    best_score = cache.scores[trial_key(estimator, fixed, best_params, sizes[-1])]
+
+    # Display the best parameters found
+    print("Best parameters:", {k: _plain(v) for k, v in best_params.items()}, file=out)
+    print("Best score on Validation Set:", best_score, file=out)
+    return best_params, best_score
+
+
+def _import(path):
+    module, name = path.rsplit(".", 1)
+    return getattr(importlib.import_module(module), name)
+
+
+# Function to prepare the notebook's training data: stored splits, StandardScaler, optional SMOTE
+def load_training_data(smote=False):
+    from sklearn.preprocessing import StandardScaler
+    from spad.features import FEATURE_NAMES
+    from spad.store import open_split
+
+    train, val = open_split("train"), open_split("val")
+    X_train = train.matrix(FEATURE_NAMES)
+    scaler = StandardScaler().fit(X_train)
+    X_train, y_train = scaler.transform(X_train), train.column('label').astype(int)
+    X_val, y_val = scaler.transform(val.matrix(FEATURE_NAMES)), val.column('label').astype(int)
+    if smote:
+        from imblearn.over_sampling import SMOTE
+        X_train, y_train = SMOTE(random_state=42, sampling_strategy='minority').fit_resample(X_train, y_train)
+    return X_train, y_train, X_val, y_val
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Successive-halving hyperparameter search over the notebook's grids.")
+    parser.add_argument("model", choices=sorted(MODELS))
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--eta", type=int, default=ETA, help="keep 1/eta of the configurations per rung (1 = full grid)")
+    parser.add_argument("--min-samples", type=int, default=MIN_SAMPLES, help="smallest training subset")
+    parser.add_argument("--smote", action="store_true", help="oversample the minority class like the notebook")
+    args = parser.parse_args(argv)
+
+    estimator_path, fixed, values = MODELS[args.model]
+    data = load_training_data(args.smote)
+    search(_import(estimator_path), grid(**values), *data, fixed=fixed, workers=args.workers,
+           eta=args.eta, min_samples=args.min_samples)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
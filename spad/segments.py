@@ -0,0 +1,66 @@
+"""Segment-level scoring for partially spoofed audio.
+
+Per-frame GTCC and MFCC are computed once for the whole clip. The pooled
+vector of every overlapping window is then derived from prefix sums over
+frames, including the deltas and delta-deltas: both are causal FIR filters
+with zero initial state, so the sum of a window's (re-started) deltas is a
+weighted difference of the same prefix sums. Each window vector is exactly
+what :func:`spad.features.extract_hybrid_features` returns for that window's
+samples, at the cost of one full-file extraction plus a few array lookups.
+"""
+import numpy as np
+
+from spad.features import DELTA_WINDOW_LENGTH, HOP_LENGTH, SAMPLE_RATE, WINDOW_LENGTH, frame_features
+from spad.models import get_model_pair, standardize
+
+WINDOW_SECONDS = 2.0
+HOP_SECONDS = 0.5
+SPOOF_CLASS = 0
+
+
+def _delta_taps(window_length=DELTA_WINDOW_LENGTH):
+    m = window_length // 2
+    return np.arange(m, -m - 1, -1) / np.sum(np.arange(1, m + 1) ** 2)
+
+
+# Function to sum a causal FIR filter's zero-state output over windows [starts, ends) using prefix sums
+def _filtered_window_sums(prefix, starts, ends, taps):
+    sums = np.zeros((len(starts), prefix.shape[1]))
+    base = prefix[starts]
+    for j, tap in enumerate(taps):
+        sums += tap * (prefix[np.maximum(ends - j, starts)] - base)
+    return sums
+
+
+# Function to pool every window of frames [start, start + window_frames) into a hybrid vector
+def window_features(gtcc, mfcc, window_frames, hop_frames):
+    num_frames = len(gtcc)
+    window_frames = min(window_frames, num_frames)
+    starts = np.arange(0, num_frames - window_frames + 1, hop_frames)
+    ends = starts + window_frames
+
+    delta = _delta_taps()
+    delta_delta = np.convolve(delta, delta)
+    pooled = []
+    for coeffs in (gtcc, mfcc):
+        prefix = np.vstack([np.zeros((1, coeffs.shape[1])), np.cumsum(coeffs, axis=0)])
+        for taps in ([1.0], delta, delta_delta):
+            pooled.append(_filtered_window_sums(prefix, starts, ends, taps))
+    return starts, np.hstack(pooled) / window_frames
+
+
+# Function to score overlapping windows of a mono 16 kHz signal
+def score_segments(y, sr=SAMPLE_RATE, window_seconds=WINDOW_SECONDS, hop_seconds=HOP_SECONDS):
+    """ Returns window start/end times (s) and the spoof probability of each window """
+    gtcc, mfcc = frame_features(y, sr)
+    window_frames = max(1, int(round((window_seconds * sr - WINDOW_LENGTH) / HOP_LENGTH)) + 1)
+    hop_frames = max(1, int(round(hop_seconds * sr / HOP_LENGTH)))
+    starts, features = window_features(gtcc, mfcc, window_frames, hop_frames)
+
+    scaler, model = get_model_pair()
+    probabilities = model.predict_proba(standardize(scaler, features))
+    spoof_probability = probabilities[:, list(model.classes_).index(SPOOF_CLASS)]
+
+    start_times = starts * HOP_LENGTH / sr
+    end_times = ((starts + min(window_frames, len(gtcc)) - 1) * HOP_LENGTH + WINDOW_LENGTH) / sr
+    return {"start": start_times, "end": end_times, "spoof_probability": spoof_probability}
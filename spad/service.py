@@ -0,0 +1,344 @@
+"""Local HTTP inference service with dynamic micro-batching.
+
+Usage::
+
+    python -m spad.service --port 8765 --workers 4 --max-batch 64 --max-wait-ms 5
+
+Endpoints:
+
+- ``POST /predict/audio?format=wav``: the raw audio bytes as the body.
+  Returns ``{"prediction", "label", "features"}``.
+- ``POST /predict/features``: ``{"features": [[81 values], ...]}`` of raw,
+  unscaled hybrid features. Returns ``{"predictions", "labels"}``.
+- ``GET /health``: model and batching statistics.
+- ``GET /metrics``: stage latencies and counters in Prometheus text format
+  (see :mod:`spad.telemetry`).
+
+The server is a small asyncio HTTP/1.1 loop with keep-alive and no
+dependencies beyond the standard library. Uploaded audio is written to a
+private temporary file and handed to the shared :class:`ExtractorPool` of warm
+worker processes, which decodes it and extracts the features. Feature rows
+from all concurrent requests go into one queue. The batcher takes whatever
+arrived within ``max_wait`` of the first row, up to ``max_batch`` rows, and
+scales and predicts them with a single call. That call is
+:func:`spad.pipeline.predict_raw_features`, the same scaler and forest the
+detection page uses.
+
+The detection page becomes a client of the service when ``SPAD_SERVICE_URL``
+is set (see :class:`ServiceClient`).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from spad.extractors import ExtractorPool, PoolSaturated
+from spad.features import NUM_FEATURES
+from spad.matlab import ExtractionError, ExtractionTimeout, session_workspace
+from spad.pipeline import LABELS
+from spad.telemetry import CONTENT_TYPE, configure_logging, count, metrics, new_request, span
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_BATCH = 64
+MAX_WAIT = 0.005
+MAX_BODY_BYTES = 64 * 1024 * 1024
+AUDIO_FORMATS = ("wav", "mp3", "ogg", "flac")
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           422: "Unprocessable Entity", 500: "Internal Server Error", 503: "Service Unavailable",
+           504: "Gateway Timeout"}
+
+
+class ServiceError(RuntimeError):
+    pass
+
+
+class _HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class MicroBatcher:
+    """ Coalesces rows from concurrent callers into one predict call per batch """
+
+    def __init__(self, predict, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        self.predict = predict
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.rows = 0
+        self._queue = None
+        self._task = None
+        # Prediction runs off the event loop, one batch at a time
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="spad-batcher")
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, rows):
+        """ Returns the predictions for the given (n x features) rows """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((np.atleast_2d(rows), future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        size = len(batch[0][0])
+        deadline = loop.time() + self.max_wait
+        while size < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            batch = [(rows, future) for rows, future in batch if not future.cancelled()]
+            if not batch:
+                continue
+            X = np.concatenate([rows for rows, _ in batch])
+            try:
+                with span("predict_batch", rows=len(X), requests=len(batch)):
+                    predictions = await loop.run_in_executor(self._executor, self.predict, X)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.rows += len(X)
+            start = 0
+            for rows, future in batch:
+                if not future.done():
+                    future.set_result(predictions[start:start + len(rows)])
+                start += len(rows)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        return {"batches": self.batches, "rows": self.rows,
+                "mean_batch_size": self.rows / self.batches if self.batches else 0.0}
+
+
+def _predict(X):
+    from spad.pipeline import predict_raw_features
+    return np.asarray(predict_raw_features(X))
+
+
+class InferenceService:
+    """ Routes HTTP requests to the extractor pool and the micro-batcher """
+
+    def __init__(self, pool, batcher):
+        self.pool = pool
+        self.batcher = batcher
+        self.started_at = time.time()
+        self.requests = 0
+
+    def _save_and_submit(self, audio_path, body):
+        with open(audio_path, "wb") as f:
+            f.write(body)
+        return self.pool.submit(audio_path, block=False)
+
+    async def predict_audio(self, body, query):
+        audio_format = query.get("format", ["wav"])[0].lower().lstrip(".")
+        if audio_format not in AUDIO_FORMATS:
+            raise _HTTPError(400, f"format must be one of {', '.join(AUDIO_FORMATS)}")
+        if not body:
+            raise _HTTPError(400, "the request body must hold the audio bytes")
+
+        with session_workspace(prefix="spad-service-") as workdir:
+            audio_path = os.path.join(workdir, f"uploaded_audio.{audio_format}")
+            try:
+                # The file write and the header read behind the job's timeout block; keep them off the event loop
+                future = await asyncio.get_running_loop().run_in_executor(
+                    None, self._save_and_submit, audio_path, body)
+            except PoolSaturated as e:
+                raise _HTTPError(503, str(e)) from None
+            try:
+                with span("extraction_wait"):
+                    features = await asyncio.wrap_future(future)
+            except ExtractionTimeout as e:
+                # The audio may be fine; the server ran out of time
+                count("extraction_timeouts")
+                raise _HTTPError(504, f"feature extraction timed out: {e}") from None
+            except ExtractionError as e:
+                count("extraction_failures")
+                raise _HTTPError(422, f"unable to extract features: {e}") from None
+
+        prediction = int((await self.batcher.submit(features))[0])
+        return {"prediction": prediction, "label": LABELS[prediction],
+                "features": np.asarray(features, dtype=float).ravel().tolist()}
+
+    async def predict_features(self, body):
+        try:
+            rows = np.atleast_2d(np.asarray(json.loads(body)["features"], dtype=np.float64))
+        except (ValueError, KeyError, TypeError):
+            raise _HTTPError(400, 'expected a JSON body {"features": [[...], ...]}') from None
+        if rows.ndim != 2 or rows.shape[1] != NUM_FEATURES or not np.isfinite(rows).all():
+            raise _HTTPError(400, f"each feature row must hold {NUM_FEATURES} finite values")
+
+        predictions = [int(p) for p in await self.batcher.submit(rows)]
+        return {"predictions": predictions, "labels": [LABELS[p] for p in predictions]}
+
+    def health(self):
+        from spad.models import MODEL_PATH, SCALER_PATH, registry
+        return {"status": "ok", "uptime_s": time.time() - self.started_at, "requests": self.requests,
+                "pending_extractions": self.pool.pending(), "batching": self.batcher.stats(),
+                "model_version": registry.version(MODEL_PATH), "scaler_version": registry.version(SCALER_PATH)}
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        routes = {"/predict/audio": "POST", "/predict/features": "POST", "/health": "GET", "/metrics": "GET"}
+        if url.path not in routes:
+            raise _HTTPError(404, f"no route {url.path}")
+        if method != routes[url.path]:
+            raise _HTTPError(405, f"{url.path} expects {routes[url.path]}")
+
+        if url.path == "/metrics":
+            return metrics.render()
+        self.requests += 1
+        new_request(route=url.path)
+        if url.path == "/predict/audio":
+            return await self.predict_audio(body, parse_qs(url.query))
+        if url.path == "/predict/features":
+            return await self.predict_features(body)
+        return self.health()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                try:
+                    if length > MAX_BODY_BYTES:
+                        keep_alive = False
+                        raise _HTTPError(413, f"request bodies are limited to {MAX_BODY_BYTES} bytes")
+                    body = await reader.readexactly(length)
+                    status, payload = 200, await self.dispatch(method, target, body)
+                except _HTTPError as e:
+                    status, payload = e.status, {"error": str(e)}
+                    if status >= 500:
+                        count("service_errors", status=status)
+                except Exception as e:
+                    status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+                    count("service_errors", status=status)
+
+                if isinstance(payload, str):
+                    content, content_type = payload.encode(), CONTENT_TYPE
+                else:
+                    content, content_type = json.dumps(payload).encode(), "application/json"
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: {content_type}\r\n"
+                             f"Content-Length: {len(content)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + content)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, max_batch=MAX_BATCH, max_wait=MAX_WAIT,
+                backend=None, ready=None):
+    from spad.models import warm_models
+    configure_logging()
+    warm_models()
+
+    pool = ExtractorPool(backend or os.environ.get("SPAD_EXTRACTOR", "native"), size=workers)
+    batcher = MicroBatcher(_predict, max_batch, max_wait)
+    batcher.start()
+    service = InferenceService(pool, batcher)
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    print(f"Serving SpAD on http://{host}:{port} ({pool.size} extractor workers, "
+          f"batches of up to {max_batch} rows within {max_wait * 1000:g} ms)", file=sys.stderr)
+    if ready is not None:
+        ready.set()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batcher.close()
+        pool.close()
+
+
+class ServiceClient:
+    """ Minimal client of the inference service, used by the detection page """
+
+    def __init__(self, base_url, timeout=60):
+        import requests
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _post(self, path, **kwargs):
+        import requests
+        try:
+            response = self.session.post(f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            raise ServiceError(f"inference service unreachable: {e}") from e
+        payload = response.json() if response.content else {}
+        if response.status_code != 200:
+            raise ServiceError(payload.get("error", f"inference service returned {response.status_code}"))
+        return payload
+
+    def predict_audio(self, audio_bytes, audio_format="wav"):
+        return self._post("/predict/audio", params={"format": audio_format}, data=audio_bytes)
+
+    def predict_features(self, features):
+        return self._post("/predict/features", json={"features": np.atleast_2d(features).tolist()})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve SpAD predictions over HTTP with micro-batching.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("-j", "--workers", type=int, help="extractor worker processes (default: one per core)")
+    parser.add_argument("--backend", help="feature extractor backend (default: SPAD_EXTRACTOR or native)")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="most feature rows per prediction batch")
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT * 1000,
+                        help="how long the first row of a batch waits for others")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.max_batch, args.max_wait_ms / 1000, args.backend))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""Cold-start helpers: deferred heavy imports, background pre-warming and an import profile.
+
+The pages import only what they need to draw, so a first hit on a static
+page does not wait for SciPy, pandas, plotly or the models. Heavy modules
+are imported inside the functions that use them, or bound at page level
+with :func:`lazy_import`, a stand-in that imports the module on first
+attribute access. Imports go through the regular import lock, so a page that
+needs a module the prewarm thread is importing waits for that import.
+
+The first script run in a server process calls :func:`prewarm`. It starts
+one background thread, which imports the heavy modules, loads the model
+artifacts and runs one dummy extraction to build the filter banks and
+resampling kernels. It then starts the extractor pool and pushes one short
+clip through it; each worker runs the same dummy extraction in
+``NativeBackend.start()`` before it takes jobs. The first upload then finds
+everything warm. Each step
+is timed as a ``prewarm_*`` span (see :mod:`spad.telemetry`).
+
+Profile the cold import cost of every page (each in a fresh interpreter,
+through ``python -X importtime``)::
+
+    python -m spad.startup                    # all pages, top 10 modules each
+    python -m spad.startup Home.py --top 25
+
+Results are written to ``.cache/startup/imports.json``, and each run prints
+its change against the previous one.
+"""
+import importlib
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+import types
+
+# Every page imports this module, so the profiler's own imports (argparse, ast, glob,
+# subprocess) are deferred to the functions that use them
+
+# Imported by the prewarm thread, in this order; missing optional ones are skipped
+HEAVY_MODULES = ("numpy", "soundfile", "scipy.signal", "scipy.io", "joblib", "sklearn.ensemble", "pandas",
+                 "plotly.express", "plotly.graph_objects")
+
+PROFILE_PATH = os.path.join(".cache", "startup", "imports.json")
+
+_prewarm_thread = None
+_prewarm_lock = threading.Lock()
+
+
+class _LazyModule(types.ModuleType):
+    """ Stand-in for a module, imported on first attribute access """
+
+    def __getattr__(self, attribute):
+        # importlib.util.LazyLoader is not thread-safe before Python 3.12; import_module
+        # takes the per-module import lock, so this waits for an import under way on another thread
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attribute)
+
+
+# Function to bind a module whose import runs on first attribute access
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    return _LazyModule(name)
+
+
+# Function to run one dummy extraction so filter banks, deltas and resampling kernels are built
+def warm_extraction(sample_rates=(44100, 48000)):
+    import numpy as np
+
+    from spad.features import SAMPLE_RATE, extract_hybrid_features, resample_audio
+
+    noise = np.random.default_rng(0).standard_normal(SAMPLE_RATE) * 0.01
+    extract_hybrid_features(noise)
+    for sr in sample_rates:
+        resample_audio(noise[:sr // 10], sr)
+
+
+# Function to start the shared extractor pool and wait for one short clip to come back from it
+def warm_extractor_pool():
+    import tempfile
+
+    import numpy as np
+    import soundfile as sf
+
+    from spad.extractors import get_extractor_pool
+    from spad.features import SAMPLE_RATE
+
+    with tempfile.TemporaryDirectory(prefix="spad-warm-") as workdir:
+        audio_path = os.path.join(workdir, "warm.wav")
+        sf.write(audio_path, np.random.default_rng(0).standard_normal(SAMPLE_RATE) * 0.01, SAMPLE_RATE)
+        get_extractor_pool().extract(audio_path)
+
+
+def _prewarm(modules):
+    from spad.models import warm_models
+    from spad.telemetry import span
+
+    for name in modules:
+        with span("prewarm_import", module=name):
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                pass
+    with span("prewarm_models"):
+        warm_models().join()
+    with span("prewarm_extraction"):
+        warm_extraction()
+    if not os.environ.get("SPAD_SERVICE_URL"):
+        # Uploads are extracted on the pool unless the inference service takes them
+        with span("prewarm_extractor_pool"):
+            warm_extractor_pool()
+
+
+# Function to import heavy modules, load the models and warm the extractor in the background, once per process
+def prewarm(modules=HEAVY_MODULES):
+    global _prewarm_thread
+    with _prewarm_lock:
+        if _prewarm_thread is None:
+            _prewarm_thread = threading.Thread(target=_prewarm, args=(modules,), name="spad-prewarm", daemon=True)
+            _prewarm_thread.start()
+    return _prewarm_thread
+
+
+def page_imports(path):
+    """ Returns the source of every module-level import statement of a page """
+    import ast
+
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    return [ast.get_source_segment(source, node) for node in ast.parse(source).body
+            if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+PROBE_MARKER = "spad-probe-start"
+_PROBE = """
+import json, sys, time
+print(sys.argv[2], file=sys.stderr, flush=True)
+missing, start = [], time.perf_counter()
+for statement in json.loads(sys.argv[1]):
+    try:
+        exec(statement, {})
+    except ImportError as e:
+        missing.append(e.name or statement)
+print(json.dumps({"seconds": time.perf_counter() - start, "missing": missing}))
+"""
+
+
+def parse_importtime(stderr):
+    """ Returns [(module, self seconds, cumulative seconds, depth)] from ``-X importtime`` output """
+    # Interpreter start-up and the probe's own imports come before the marker
+    rows = []
+    for line in stderr.split(PROBE_MARKER, 1)[-1].splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6, depth))
+    return rows
+
+
+# Function to import a page's modules in a fresh interpreter and record where the time goes
+def profile_page(path, top=10):
+    import subprocess
+
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", _PROBE, json.dumps(page_imports(path)),
+                                PROBE_MARKER],
+                               capture_output=True, text=True, check=True)
+    probe = json.loads(completed.stdout.strip().splitlines()[-1])
+    rows = parse_importtime(completed.stderr)
+    # Top-level packages (depth 0) account for the whole import; deeper rows are their dependencies
+    heaviest = sorted((row for row in rows if row[3] == 0), key=lambda row: -row[2])[:top]
+    return {
+        "page": path,
+        "seconds": probe["seconds"],
+        "modules": len(rows),
+        "missing": probe["missing"],
+        "heaviest": [{"module": name, "cumulative": cumulative, "self": self_seconds}
+                     for name, self_seconds, cumulative, _ in heaviest],
+    }
+
+
+def report(results, previous=None, out=sys.stdout):
+    before = {page["page"]: page for page in (previous or {}).get("pages", [])}
+    for page in results["pages"]:
+        old = before.get(page["page"])
+        change = f" ({(page['seconds'] - old['seconds']) * 1e3:+.0f} ms)" if old else ""
+        print(f"{page['page']}: {page['seconds'] * 1e3:.0f} ms cold import, {page['modules']} modules{change}",
+              file=out)
+        if page["missing"]:
+            print(f"  not installed: {', '.join(page['missing'])}", file=out)
+        for module in page["heaviest"]:
+            print(f"  {module['cumulative'] * 1e3:>8.1f} ms  {module['module']}", file=out)
+
+
+def main(argv=None):
+    import argparse
+    import glob
+
+    pages = ["Home.py"] + sorted(glob.glob(os.path.join("pages", "*.py")))
+    parser = argparse.ArgumentParser(description="Profile the cold import time of each app page.")
+    parser.add_argument("pages", nargs="*", default=pages, help="page scripts (default: Home.py and pages/*.py)")
+    parser.add_argument("--top", type=int, default=10, help="heaviest top-level imports to list per page")
+    parser.add_argument("-o", "--output", default=PROFILE_PATH)
+    args = parser.parse_args(argv)
+
+    previous = None
+    if os.path.exists(args.output):
+        with open(args.output) as f:
+            previous = json.load(f)
+    results = {"time": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "python": sys.version.split()[0],
+               "pages": [profile_page(page, args.top) for page in args.pages]}
+    report(results, previous)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    tmp_path = f"{args.output}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(results, f, indent=1)
+    os.replace(tmp_path, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
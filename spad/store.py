@@ -0,0 +1,215 @@
+"""Memory-mapped columnar store for the extracted feature sets.
+
+``GTCC-MFCC_{train,val,test}.csv`` are converted once into ``.spadcol``
+files: a small JSON schema header followed by one contiguous, 64-byte aligned
+column per feature (float32) and for the label (int8). Opening a store only
+reads the header; each column is a zero-copy view of a shared read-only
+memory map. Columns that are never touched are never read from disk, and
+every process that opens the same file shares the same page-cache pages.
+
+Convert the CSVs with ``python -m spad.store`` (stale stores are also
+rebuilt automatically when a CSV is newer than its store).
+"""
+import argparse
+import glob
+import json
+import os
+import struct
+import sys
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from spad.features import FEATURE_NAMES
+
+FEATURES_DIR = "extracted_features"
+FEATURE_SET = "GTCC-MFCC"
+SPLITS = ("train", "val", "test")
+COLUMN_NAMES = FEATURE_NAMES + ['label']
+
+MAGIC = b"SPADCOL\x01"
+ALIGNMENT = 64
+EXTENSION = ".spadcol"
+
+
+class FeatureStore:
+    """ Read-only, memory-mapped view of one columnar feature file """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a SpAD column store.")
+            (length,) = struct.unpack("<I", f.read(4))
+            self.header = json.loads(f.read(length))
+        self._data_start = _data_start(length)
+        self.num_rows = self.header["num_rows"]
+        self._schema = {column["name"]: column for column in self.header["columns"]}
+        self._mmap = np.memmap(path, dtype=np.uint8, mode="r") if self.num_rows else None
+
+    @property
+    def columns(self):
+        return [column["name"] for column in self.header["columns"]]
+
+    def column(self, name):
+        try:
+            column = self._schema[name]
+        except KeyError:
+            raise KeyError(f"{self.path} has no column {name!r}.") from None
+        dtype = np.dtype(column["dtype"])
+        if self._mmap is None:
+            return np.zeros(0, dtype=dtype)
+        start = self._data_start + column["offset"]
+        return self._mmap[start:start + self.num_rows * dtype.itemsize].view(dtype)
+
+    def to_frame(self, columns=None):
+        """ Returns a DataFrame over the requested columns without copying them """
+        import pandas as pd
+
+        columns = self.columns if columns is None else list(columns)
+        return pd.DataFrame({name: self.column(name) for name in columns}, copy=False)
+
+    def matrix(self, columns=FEATURE_NAMES):
+        """ Returns the requested columns stacked into a float32 (rows x columns) array """
+        return np.column_stack([self.column(name) for name in columns])
+
+
+# Column offsets in the header are relative to the first aligned byte after it
+def _data_start(header_length):
+    return -(-(len(MAGIC) + 4 + header_length) // ALIGNMENT) * ALIGNMENT
+
+
+# Function to write named 1-D arrays as a column store, replacing the target atomically
+def write_store(path, columns, source=None):
+    names = list(columns)
+    num_rows = len(columns[names[0]]) if names else 0
+    schema = []
+    offset = 0
+    for name in names:
+        array = np.ascontiguousarray(columns[name])
+        if len(array) != num_rows:
+            raise ValueError(f"Column {name!r} has {len(array)} rows, expected {num_rows}.")
+        schema.append({"name": name, "dtype": array.dtype.str, "offset": offset})
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+    header = {"version": 1, "num_rows": num_rows, "columns": schema, "source": source}
+    encoded = json.dumps(header).encode()
+    data_start = _data_start(len(encoded))
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(encoded)) + encoded)
+        for name, column in zip(names, schema):
+            f.seek(data_start + column["offset"])
+            f.write(np.ascontiguousarray(columns[name]).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+
+def store_path(csv_path):
+    return os.path.splitext(csv_path)[0] + EXTENSION
+
+
+def _source_stamp(csv_path):
+    stat = os.stat(csv_path)
+    return {"path": os.path.basename(csv_path), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+# Function to convert a header-less feature CSV (features then label) into a column store
+def convert_csv(csv_path, path=None, names=None):
+    import pandas as pd
+
+    path = path or store_path(csv_path)
+    frame = pd.read_csv(csv_path, header=None, dtype=np.float32)
+    if names is None:
+        names = COLUMN_NAMES if frame.shape[1] == len(COLUMN_NAMES) else \
+            [f"feature{i}" for i in range(frame.shape[1] - 1)] + ['label']
+    columns = {name: frame.iloc[:, i].to_numpy() for i, name in enumerate(names)}
+    columns['label'] = columns['label'].astype(np.int8)
+    write_store(path, columns, source=_source_stamp(csv_path))
+    return path
+
+
+# Function to append labelled feature rows to a split: to its CSV first, then to its column store
+def append_rows(split, features, labels, feature_set=FEATURE_SET, directory=FEATURES_DIR):
+    csv_path = os.path.join(directory, f"{feature_set}_{split}.csv")
+    store = open_split(split, feature_set, directory)
+    names = [name for name in store.columns if name != 'label']
+    features = np.asarray(features, dtype=np.float64).reshape(len(labels), len(names))
+
+    # The CSV stays the source of truth: if the store write below is interrupted, the store is stale and rebuilt
+    if os.path.exists(csv_path):
+        with open(csv_path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+            f.write("".join(",".join(f"{value:.15g}" for value in row) + f",{int(label)}\n"
+                            for row, label in zip(features, labels)).encode())
+
+    columns = {name: np.concatenate([store.column(name), features[:, i].astype(store.column(name).dtype)])
+               for i, name in enumerate(names)}
+    columns['label'] = np.concatenate([store.column('label'), np.asarray(labels, dtype=np.int8)])
+    source = _source_stamp(csv_path) if os.path.exists(csv_path) else store.header.get("source")
+    write_store(store.path, columns, source=source)
+    return open_split(split, feature_set, directory)
+
+
+def is_stale(path, csv_path):
+    if not os.path.exists(path):
+        return True
+    if not os.path.exists(csv_path):
+        return False
+    source = FeatureStore(path).header.get("source") or {}
+    stamp = _source_stamp(csv_path)
+    return (source.get("mtime_ns"), source.get("size")) != (stamp["mtime_ns"], stamp["size"])
+
+
+@lru_cache(maxsize=16)
+def _open_store(path, version):
+    return FeatureStore(path)
+
+
+# Function to open one split of a feature set, converting its CSV first if needed
+def open_split(split, feature_set=FEATURE_SET, directory=FEATURES_DIR):
+    csv_path = os.path.join(directory, f"{feature_set}_{split}.csv")
+    path = store_path(csv_path)
+    if is_stale(path, csv_path):
+        if not os.path.exists(csv_path):
+            raise FileNotFoundError(f"Neither {path} nor {csv_path} exists.")
+        convert_csv(csv_path, path)
+    stat = os.stat(path)
+    return _open_store(path, (stat.st_mtime_ns, stat.st_size, stat.st_ino))
+
+
+def load_split(split, columns=None, feature_set=FEATURE_SET, directory=FEATURES_DIR):
+    return open_split(split, feature_set, directory).to_frame(columns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert extracted feature CSVs into memory-mapped column stores.")
+    parser.add_argument("files", nargs="*", help=f"CSV files (defaults to {FEATURES_DIR}/*_<split>.csv)")
+    args = parser.parse_args(argv)
+
+    files = args.files or sorted(path for split in SPLITS
+                                 for path in glob.glob(os.path.join(FEATURES_DIR, f"*_{split}.csv")))
+    if not files:
+        parser.error(f"No feature CSVs found in {FEATURES_DIR}/.")
+    for csv_path in files:
+        start = time.perf_counter()
+        path = convert_csv(csv_path)
+        converted = time.perf_counter() - start
+
+        start = time.perf_counter()
+        store = FeatureStore(path)
+        labels = np.bincount(store.column('label'), minlength=2)
+        opened = time.perf_counter() - start
+        print(f"{path}: {store.num_rows} rows x {len(store.columns)} columns, "
+              f"labels {labels.tolist()} (converted in {converted:.2f}s, opened + counted in {opened * 1000:.1f}ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
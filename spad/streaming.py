@@ -0,0 +1,132 @@
+"""Bounded-memory feature extraction for long recordings.
+
+The hybrid vector is a mean over frames of the coefficients, their deltas and
+their delta-deltas, so it can be accumulated block by block. Audio is read
+through ``soundfile.blocks``, resampled by a polyphase filter that carries its
+input history between blocks, framed with the leftover samples of the
+previous block, and the delta filters carry their state across block
+boundaries. Peak memory depends on the block size, not on the duration, and
+the result equals :func:`spad.features.extract_features_from_file` up to
+floating-point rounding.
+"""
+import numpy as np
+import soundfile as sf
+
+from spad.features import (DELTA_WINDOW_LENGTH, HOP_LENGTH, SAMPLE_RATE, WINDOW_LENGTH, audio_delta,
+                           extract_features_from_file, features_of_frames, frame_signal)
+from spad.resample import polyphase_kernel
+
+BLOCK_SIZE = 1 << 16
+
+# Files longer than this are streamed instead of being loaded whole
+STREAMING_THRESHOLD_SECONDS = 120
+
+
+class StreamingResampler:
+    """ Block-wise equivalent of ``scipy.signal.resample_poly(x, up, down)`` """
+
+    def __init__(self, orig_sr, sr=SAMPLE_RATE):
+        self.buffer = np.zeros(0)
+        self.buffer_start = 0   # absolute index of buffer[0], always a multiple of down
+        self.n_in = 0
+        self.next_output = 0    # next absolute upfirdn output index to emit
+        if int(orig_sr) == int(sr):
+            self.up = self.down = 1
+            return
+        self.up, self.down, self.h, self.n_pre_remove = polyphase_kernel(int(orig_sr), int(sr))
+
+    def _emit(self, last_output):
+        from scipy.signal import upfirdn
+
+        first = max(self.next_output, self.n_pre_remove)
+        if last_output <= first:
+            self.next_output = max(self.next_output, last_output)
+            return np.zeros(0)
+
+        offset = self.buffer_start * self.up // self.down
+        y = upfirdn(self.h, self.buffer, self.up, self.down)[first - offset:last_output - offset]
+        self.next_output = last_output
+
+        # Keep only the input history that later outputs can still reach
+        oldest_needed = max(0, -(-(last_output * self.down - len(self.h) + 1) // self.up))
+        keep_from = oldest_needed - oldest_needed % self.down
+        if keep_from > self.buffer_start:
+            self.buffer = self.buffer[keep_from - self.buffer_start:]
+            self.buffer_start = keep_from
+        return y
+
+    def process(self, block):
+        if self.up == self.down == 1:
+            self.n_in += len(block)
+            return block
+        self.buffer = np.concatenate([self.buffer, block])
+        self.n_in += len(block)
+        # Outputs whose inputs have all arrived
+        return self._emit((self.n_in * self.up - 1) // self.down + 1)
+
+    def flush(self):
+        if self.up == self.down == 1:
+            return np.zeros(0)
+        n_out = -(-self.n_in * self.up // self.down)
+        return self._emit(self.n_pre_remove + n_out)
+
+
+class FeatureAccumulator:
+    """ Running sums of per-frame coefficients, deltas and delta-deltas """
+
+    def __init__(self, sr=SAMPLE_RATE):
+        self.sr = sr
+        self.leftover = np.zeros(0)
+        self.num_frames = 0
+        self.sums = None
+        self.states = None
+
+    def _accumulate(self, gtcc, mfcc):
+        if self.states is None:
+            zeros = [np.zeros((DELTA_WINDOW_LENGTH - 1, c.shape[1])) for c in (gtcc, mfcc)]
+            self.states = [[z, z.copy()] for z in zeros]
+            self.sums = [np.zeros(c.shape[1]) for c in (gtcc, mfcc) for _ in range(3)]
+
+        for i, coeffs in enumerate((gtcc, mfcc)):
+            delta, self.states[i][0] = audio_delta(coeffs, zi=self.states[i][0])
+            delta_delta, self.states[i][1] = audio_delta(delta, zi=self.states[i][1])
+            for j, values in enumerate((coeffs, delta, delta_delta)):
+                self.sums[3 * i + j] += values.sum(axis=0)
+
+    def update(self, y):
+        buffer = np.concatenate([self.leftover, y])
+        frames = frame_signal(buffer)
+        if len(frames):
+            self._accumulate(*features_of_frames(frames, self.sr))
+            self.num_frames += len(frames)
+            buffer = buffer[len(frames) * HOP_LENGTH:]
+        self.leftover = buffer
+
+    def result(self):
+        """ Returns the 1 x 81 hybrid feature row of everything seen so far """
+        if not self.num_frames:
+            raise ValueError(f"Audio is shorter than one {WINDOW_LENGTH}-sample analysis frame.")
+        return (np.concatenate(self.sums) / self.num_frames)[None, :]
+
+
+# Function to extract the hybrid features of a file of any length in bounded memory
+def stream_features_from_file(path, block_size=BLOCK_SIZE, sr=SAMPLE_RATE):
+    accumulator = FeatureAccumulator(sr)
+    with sf.SoundFile(path) as f:
+        resampler = StreamingResampler(f.samplerate, sr)
+        for block in f.blocks(blocksize=block_size, always_2d=True):
+            accumulator.update(resampler.process(block[:, 0]))
+    accumulator.update(resampler.flush())
+    return accumulator.result()
+
+
+def is_long_recording(path, threshold=STREAMING_THRESHOLD_SECONDS):
+    info = sf.info(path)
+    return info.frames > threshold * info.samplerate
+
+
+# Function to load short files whole and stream long ones
+def extract_features_bounded(path, threshold=STREAMING_THRESHOLD_SECONDS):
+    if is_long_recording(path, threshold):
+        return stream_features_from_file(path)
+    return extract_features_from_file(path)
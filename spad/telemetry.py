@@ -0,0 +1,213 @@
+"""Per-request timing spans and counters for the detection pipeline.
+
+Every stage of a detection runs inside :func:`span`. Spans and counters are
+recorded in one process-wide :class:`MetricsRegistry`, so the latency
+distribution covers every Streamlit session served by the process. They are
+exported in two ways:
+
+- Prometheus text format at ``http://127.0.0.1:$SPAD_METRICS_PORT/metrics``
+  (default port 9464), served by :func:`start_metrics_server`. The inference
+  service also answers ``GET /metrics`` on its own port.
+- one JSON log line per span and counter increment on the ``spad.telemetry``
+  logger, tagged with the request id. Lines go to stderr, or are appended to
+  ``$SPAD_TELEMETRY_LOG`` when it is set.
+
+Stage latencies are histograms (``spad_stage_seconds{stage, status}``).
+Cache lookups, extraction timeouts and failures are counters
+(``spad_<name>_total``).
+"""
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_HOST = os.environ.get("SPAD_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("SPAD_METRICS_PORT", 9464))
+LOG_PATH = os.environ.get("SPAD_TELEMETRY_LOG")
+
+# Upper bounds (seconds) of the stage latency histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_METRIC = "spad_stage_seconds"
+HELP = {
+    STAGE_METRIC: "Time spent in each detection stage",
+    "spad_requests_total": "Detection requests",
+    "spad_result_cache_total": "Result cache lookups by outcome",
+    "spad_extraction_timeouts_total": "Feature extractions that hit the extraction time limit",
+    "spad_extraction_failures_total": "Feature extractions that failed",
+    "spad_service_errors_total": "Requests to the inference service that failed",
+    "spad_screen_total": "Clips seen by the cascade screen, answered or escalated",
+    "spad_detection_jobs_total": "Background detection jobs by outcome",
+    "spad_detection_jobs_abandoned_total": "Detection jobs cancelled because their session stopped polling",
+}
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = logging.getLogger("spad.telemetry")
+_request_id = contextvars.ContextVar("spad_request_id", default=None)
+
+
+def _labels_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class MetricsRegistry:
+    """ Thread-safe counters and histograms keyed by metric name and label set """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}     # name -> {labels: value}
+        self._histograms = {}   # name -> {labels: [bucket counts..., sum, count]}
+
+    def inc(self, name, amount=1, **labels):
+        key = _labels_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = _labels_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            state = series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def value(self, name, **labels):
+        with self._lock:
+            return self._counters.get(name, {}).get(_labels_key(labels), 0)
+
+    def render(self):
+        """ Returns every metric in the Prometheus text exposition format """
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter"]
+                lines += [f"{name}{_format_labels(key)} {value}" for key, value in sorted(series.items())]
+            for name, series in sorted(self._histograms.items()):
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+                for key, state in sorted(series.items()):
+                    for bound, count in zip(self.buckets, state):
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', f'{bound:g}')])} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {state[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {state[-2]:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {state[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+metrics = MetricsRegistry()
+
+
+# Function to start a new request: later spans and counters on this thread/task carry its id
+def new_request(**fields):
+    request_id = uuid.uuid4().hex[:12]
+    _request_id.set(request_id)
+    count("requests", **fields)
+    return request_id
+
+
+# Function to continue an earlier request (e.g. on a Streamlit rerun) without counting it again
+def resume_request(request_id):
+    _request_id.set(request_id)
+
+
+def log_event(event, **fields):
+    if logger.isEnabledFor(logging.INFO):
+        record = {"ts": round(time.time(), 6), "event": event, "request_id": _request_id.get()}
+        record.update(fields)
+        logger.info(json.dumps(record, default=str))
+
+
+# Function to add to a counter and log it
+def count(name, amount=1, **labels):
+    metrics.inc(f"spad_{name}_total", amount, **labels)
+    log_event("count", counter=name, amount=amount, **labels)
+
+
+# Context manager timing one stage; exceptions are recorded with status="error" and re-raised
+@contextmanager
+def span(stage, **fields):
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        metrics.observe(STAGE_METRIC, seconds, stage=stage, status=status)
+        log_event("span", stage=stage, seconds=round(seconds, 6), status=status, **fields)
+
+
+# Function to send the JSON log lines to stderr or $SPAD_TELEMETRY_LOG (once per process)
+def configure_logging(path=LOG_PATH):
+    if logger.handlers:
+        return logger
+    handler = logging.FileHandler(path) if path else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+# Function to serve /metrics from a background thread, once per process
+def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    global _server
+    with _server_lock:
+        if _server is None:
+            configure_logging()
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                # Another process (e.g. a second Streamlit server) already serves this port
+                log_event("metrics_server_unavailable", port=port, error=str(e))
+                _server = False
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="spad-metrics", daemon=True).start()
+        return _server or None
@@ -0,0 +1,252 @@
+"""Parallel, resumable extraction of the GTCC, MFCC and GTCC-MFCC training sets.
+
+Usage::
+
+    python -m spad.trainset PartialSpoof/database/train --split train --output features/ --workers 8
+    python -m spad.trainset --output features/ --split train --merge
+
+Python counterpart of ``model/FeatureExtraction.m``. As in the MATLAB
+script, the label of every file is the name of the folder it sits in (``0``
+spoof, ``1`` bona fide). Files are extracted on a pool of worker processes,
+once each: the GTCC and MFCC sets are slices of the 81-value hybrid vector.
+The column layout is the one of the CSVs the model was trained on.
+``FeatureExtraction.m`` asks for 20 coefficients without log energy, but the
+shipped ``GTCC_*``, ``MFCC_*`` and ``GTCC-MFCC_*`` files hold log energy + 13
+GTCC, log energy + 13 MFCC and log energy + 13 GTCC + 13 MFCC, each with
+deltas and delta-deltas.
+
+Rows are appended to numbered shard files as they arrive. Each completed
+file then gets a line in ``manifest.jsonl`` naming its shard. On restart,
+files in the manifest are skipped and shard rows without a manifest line are
+dropped, so a crash costs at most the files in flight. ``--merge``
+concatenates the shards into ``<set>_<split>.csv`` for ``spad.store``
+and the notebook.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from spad.features import NUM_COEFFS
+from spad.pipeline import find_audio_files
+from spad.streaming import extract_features_bounded
+
+SHARD_SIZE = 5000
+MANIFEST_NAME = "manifest.jsonl"
+FEATURE_SETS = ("GTCC", "MFCC", "GTCC-MFCC")
+
+# Positions of each set's columns in the hybrid vector: [GTCC (logE + 13) x 3 | MFCC (13) x 3]
+_GTCC_WIDTH = NUM_COEFFS + 1
+_GTCC_COLUMNS = np.arange(3 * _GTCC_WIDTH)
+_MFCC_COLUMNS = np.concatenate([
+    [block * _GTCC_WIDTH] + list(3 * _GTCC_WIDTH + block * NUM_COEFFS + np.arange(NUM_COEFFS))
+    for block in range(3)
+])
+
+
+# Function to cut the GTCC, MFCC and GTCC-MFCC rows out of one hybrid vector
+def feature_set_rows(hybrid):
+    hybrid = np.asarray(hybrid).ravel()
+    return {"GTCC": hybrid[_GTCC_COLUMNS], "MFCC": hybrid[_MFCC_COLUMNS], "GTCC-MFCC": hybrid}
+
+
+# Function to read a file's label from its folder name, as audioDatastore 'LabelSource','foldernames' does
+def folder_label(path):
+    folder = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    if folder not in ("0", "1"):
+        raise ValueError(f"Expected {path} to sit in a folder named 0 (spoof) or 1 (bona fide).")
+    return int(folder)
+
+
+def _extract(path, label=None):
+    try:
+        label = folder_label(path) if label is None else label
+        return {"path": path, "label": label, "rows": feature_set_rows(extract_features_bounded(path))}
+    except Exception as e:
+        return {"path": path, "error": f"{type(e).__name__}: {e}"}
+
+
+def shard_path(output, feature_set, split, shard):
+    return os.path.join(output, f"{feature_set}_{split}.{shard:05d}.csv")
+
+
+def _format_row(values, label):
+    return ",".join(f"{value:.15g}" for value in values) + f",{label}\n"
+
+
+def _keep_lines(path, count):
+    """ Truncates a file after its first count complete lines """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        end = 0
+        for _ in range(count):
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                break
+            end += len(line)
+        f.truncate(end)
+
+
+class ShardWriter:
+    """ Appends rows of the three feature sets to the current shard and records them in the manifest """
+
+    def __init__(self, output, split, shard_size=SHARD_SIZE):
+        self.output = output
+        self.split = split
+        self.shard_size = shard_size
+        os.makedirs(output, exist_ok=True)
+        self.completed, self.shard, self.rows = reconcile_shards(output, split)
+        self.manifest = open(os.path.join(output, MANIFEST_NAME), "a")
+        self.files = None
+        self._open_shard()
+
+    def _open_shard(self):
+        if self.files:
+            for f in self.files.values():
+                f.close()
+        self.files = {feature_set: open(shard_path(self.output, feature_set, self.split, self.shard), "a")
+                      for feature_set in FEATURE_SETS}
+
+    def write(self, result):
+        if "error" not in result:
+            if self.rows >= self.shard_size:
+                self.shard += 1
+                self.rows = 0
+                self._open_shard()
+            for feature_set, f in self.files.items():
+                f.write(_format_row(result["rows"][feature_set], result["label"]))
+                f.flush()
+            self.rows += 1
+            entry = {"path": result["path"], "split": self.split, "shard": self.shard, "label": result["label"]}
+        else:
+            entry = {"path": result["path"], "split": self.split, "error": result["error"]}
+        # The manifest line goes last: a row without one is dropped and redone on resume
+        self.manifest.write(json.dumps(entry) + "\n")
+        self.manifest.flush()
+        self.completed.add(result["path"])
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.manifest.close()
+
+
+# Function to read the finished files and the number of rows in each (split, shard) from a manifest
+def read_manifest(path):
+    completed, rows_per_shard = set(), {}
+    if not os.path.exists(path):
+        return completed, rows_per_shard
+
+    _keep_lines(path, sys.maxsize)
+    with open(path) as f:
+        for line in f:
+            entry = json.loads(line)
+            # Failed files are retried on the next run
+            if "error" in entry:
+                continue
+            completed.add(entry["path"])
+            key = (entry["split"], entry["shard"])
+            rows_per_shard[key] = rows_per_shard.get(key, 0) + 1
+    return completed, rows_per_shard
+
+
+# Function to drop shard rows written after the last manifest line; returns (completed files, newest shard, its rows)
+def reconcile_shards(output, split):
+    completed, rows_per_shard = read_manifest(os.path.join(output, MANIFEST_NAME))
+    for (split_name, shard), count in rows_per_shard.items():
+        if split_name == split:
+            for feature_set in FEATURE_SETS:
+                _keep_lines(shard_path(output, feature_set, split, shard), count)
+
+    # The newest shard may have no manifest lines yet (a crash before the first one): cut it back too
+    newest = max((shard for split_name, shard in rows_per_shard if split_name == split), default=0)
+    for feature_set in FEATURE_SETS:
+        _keep_lines(shard_path(output, feature_set, split, newest), rows_per_shard.get((split, newest), 0))
+    for path in glob.glob(os.path.join(output, f"*_{split}.*.csv")):
+        if int(path.rsplit(".", 2)[1]) > newest:
+            os.remove(path)
+    return completed, newest, rows_per_shard.get((split, newest), 0)
+
+
+def run(paths, output, split, workers, shard_size=SHARD_SIZE, label=None, max_pending=None):
+    writer = ShardWriter(output, split, shard_size)
+    todo = [path for path in find_audio_files(paths) if path not in writer.completed]
+    if writer.completed:
+        print(f"Resuming: {len(writer.completed)} files already extracted, {len(todo)} to go", file=sys.stderr)
+
+    max_pending = max_pending or 4 * workers
+    done = failed = 0
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for path in todo:
+                pending.add(pool.submit(_extract, path, label))
+                if len(pending) < max_pending:
+                    continue
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    result = future.result()
+                    writer.write(result)
+                    done += 1
+                    failed += "error" in result
+
+            for future in wait(pending).done:
+                result = future.result()
+                writer.write(result)
+                done += 1
+                failed += "error" in result
+    finally:
+        writer.close()
+        elapsed = time.perf_counter() - start
+        print(f"Extracted {done - failed} files ({failed} failed) in {elapsed:.1f} s "
+              f"- {done / elapsed if elapsed else 0:.2f} files/sec", file=sys.stderr)
+    return done, failed
+
+
+# Function to concatenate the shards of each feature set into <set>_<split>.csv
+def merge_shards(output, split):
+    reconcile_shards(output, split)
+    merged = []
+    for feature_set in FEATURE_SETS:
+        target = os.path.join(output, f"{feature_set}_{split}.csv")
+        tmp_path = f"{target}.tmp-{os.getpid()}"
+        with open(tmp_path, "wb") as out:
+            for path in sorted(glob.glob(os.path.join(output, f"{feature_set}_{split}.*.csv"))):
+                with open(path, "rb") as f:
+                    out.write(f.read())
+        os.replace(tmp_path, target)
+        merged.append(target)
+    return merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract the GTCC, MFCC and GTCC-MFCC training sets.")
+    parser.add_argument("paths", nargs="*", help="corpus folders (labels come from the 0/1 folder names)")
+    parser.add_argument("-o", "--output", required=True, help="directory for shards and the manifest")
+    parser.add_argument("--split", default="train", help="split name used in the output file names")
+    parser.add_argument("--label", type=int, choices=[0, 1], help="label every file with this class instead")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="rows per shard file")
+    parser.add_argument("--merge", action="store_true", help="concatenate the shards once extraction is done")
+    args = parser.parse_args(argv)
+
+    if not args.paths and not args.merge:
+        parser.error("give corpus folders to extract, --merge, or both")
+    failed = 0
+    if args.paths:
+        _, failed = run(args.paths, args.output, args.split, args.workers, args.shard_size, args.label)
+    if args.merge:
+        for path in merge_shards(args.output, args.split):
+            print(path)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,391 @@
+"""Incremental model updates from newly labelled clips, without retraining from scratch.
+
+Usage::
+
+    python -m spad.update confirmed/ --trees 20         # audio in folders named 0 (spoof) / 1 (bona fide)
+    python -m spad.update new_rows.csv                  # GTCC-MFCC rows: 81 features then the label
+    python -m spad.update --rollback base               # serve an earlier version again
+
+One update:
+
+1. extracts (or reads) the new labelled vectors, skipping input files whose
+   digest an earlier version's manifest already records;
+2. updates the scaler with running moments (``StandardScaler.partial_fit``)
+   and moves the split thresholds of the existing trees to the new scaling, so
+   they keep making the same decisions on raw features;
+3. grows the forest with ``--trees`` new trees (``warm_start``), fit on the new
+   rows plus ``--replay`` rows sampled from the existing training set, with
+   the minority class oversampled (or SMOTE, ``--smote``, as in the notebook),
+   and retires the oldest trees beyond ``--max-trees`` (by default twice the
+   base forest), so single-row latency stays bounded;
+4. compares accuracy on ``GTCC-MFCC_val`` before and after, and refuses to
+   publish when it drops by more than ``--max-drop``;
+5. saves the new version under ``model/versions/<version>`` with the input
+   digests and the new rows, and publishes it to the served paths with
+   :func:`spad.models.publish_artifact`. Model and scaler are tagged with the
+   version, so the registry only ever serves them as a pair. Running sessions
+   pick it up on their next lookup. The compiled, compact and cascade
+   artifacts that exist are rebuilt for the new model;
+6. only then appends the new rows to ``GTCC-MFCC_train`` (CSV and column
+   store), so a rejected update leaves the training set as it was. Until the
+   append succeeds the manifest marks the rows as pending, and the next run
+   appends them before it does anything else.
+
+The artifacts served before the first update are kept as ``versions/base``.
+"""
+import argparse
+import copy
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from spad.features import FEATURE_NAMES, NUM_FEATURES
+from spad.models import (CASCADE_PATH, COMPACT_PATH, COMPILED_PATH, MODEL_DIR, MODEL_PATH, PAIR_TAG, SCALER_PATH,
+                         publish_artifact, registry)
+
+VERSIONS_DIR = os.path.join(MODEL_DIR, "versions")
+BASE_VERSION = "base"
+MANIFEST_NAME = "manifest.json"
+# New rows of a version, kept until they are appended to the training set
+ROWS_NAME = "rows.npz"
+TREES = 20
+# Default tree cap, as a multiple of the base forest's size
+MAX_TREES_FACTOR = 2
+REPLAY_ROWS = 20000
+MAX_DROP = 0.01
+
+
+# Function to expand the given paths into CSV and audio files
+def input_files(paths):
+    from spad.pipeline import find_audio_files
+
+    csv_paths = [path for path in paths if path.lower().endswith(".csv")]
+    return csv_paths + list(find_audio_files([path for path in paths if path not in csv_paths]))
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Function to collect the input digests recorded by every published version
+def applied_digests():
+    digests = set()
+    for path in glob.glob(os.path.join(VERSIONS_DIR, "*", MANIFEST_NAME)):
+        with open(path) as f:
+            digests.update(json.load(f).get("digests", {}).values())
+    return digests
+
+
+# Function to read new labelled vectors from GTCC-MFCC CSVs and audio files; returns (features, labels, files read)
+def load_new_rows(files, label=None, workers=None):
+    from concurrent.futures import ProcessPoolExecutor
+
+    from spad.trainset import _extract
+
+    features, labels, loaded = [], [], []
+    csv_paths = [path for path in files if path.lower().endswith(".csv")]
+    for path in csv_paths:
+        rows = np.loadtxt(path, delimiter=",", ndmin=2)
+        if rows.shape[1] != NUM_FEATURES + 1:
+            raise ValueError(f"{path}: expected {NUM_FEATURES} features and a label per row, got {rows.shape[1]} columns.")
+        features.append(rows[:, :-1])
+        labels.append(rows[:, -1].astype(int))
+        loaded.append(path)
+
+    audio = [path for path in files if path not in csv_paths]
+    if audio:
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(_extract, audio, [label] * len(audio)))
+        for result in results:
+            if "error" in result:
+                print(f"{result['path']}: {result['error']}", file=sys.stderr)
+                continue
+            features.append(result["rows"]["GTCC-MFCC"][None, :])
+            labels.append([result["label"]])
+            loaded.append(result["path"])
+
+    if not features:
+        raise ValueError("No labelled rows to add.")
+    return np.concatenate(features), np.concatenate(labels).astype(int), loaded
+
+
+# Function to update a copy of the scaler with the running moments of the new rows
+def updated_scaler(scaler, features):
+    import pandas as pd
+
+    scaler = copy.deepcopy(scaler)
+    return scaler.partial_fit(pd.DataFrame(features, columns=FEATURE_NAMES))
+
+
+# Function to move every split threshold from the old scaler's space to the new one's
+def rescale_thresholds(model, old_scaler, new_scaler):
+    # x_old <= t  <=>  x_raw <= t * s + m  <=>  x_new <= (t * s + m - m') / s'  (scales are positive)
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        split = tree.feature >= 0
+        feature = tree.feature[split]
+        raw = tree.threshold[split] * old_scaler.scale_[feature] + old_scaler.mean_[feature]
+        tree.threshold[split] = (raw - new_scaler.mean_[feature]) / new_scaler.scale_[feature]
+    return model
+
+
+# Function to balance the classes: SMOTE like the notebook, or random oversampling of the minority class
+def rebalance(X, y, rng, smote=False):
+    if smote:
+        from imblearn.over_sampling import SMOTE
+        return SMOTE(random_state=int(rng.integers(2**31)), sampling_strategy='minority').fit_resample(X, y)
+    classes, counts = np.unique(y, return_counts=True)
+    extra = [rng.choice(np.flatnonzero(y == c), counts.max() - n) for c, n in zip(classes, counts) if n < counts.max()]
+    index = np.concatenate([np.arange(len(y))] + extra)
+    return X[index], y[index]
+
+
+# Function to add trees fit on (X, y) to a fitted forest, keeping the existing ones
+def grow_forest(model, X, y, trees, seed):
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + trees, random_state=seed)
+    model.fit(X, y)
+    return model.set_params(warm_start=False)
+
+
+# Function to drop the oldest trees beyond max_trees; new trees are appended, so the oldest come first
+def retire_trees(model, max_trees):
+    retired = max(len(model.estimators_) - max_trees, 0)
+    if retired:
+        model.estimators_ = model.estimators_[retired:]
+        model.set_params(n_estimators=len(model.estimators_))
+    return retired
+
+
+def _accuracy(model, scaler, store):
+    import pandas as pd
+
+    X = scaler.transform(pd.DataFrame(store.matrix(FEATURE_NAMES), columns=FEATURE_NAMES))
+    return float(np.mean(model.predict(X) == store.column('label')))
+
+
+def _version_paths(version):
+    directory = os.path.join(VERSIONS_DIR, version)
+    return directory, os.path.join(directory, os.path.basename(MODEL_PATH)), \
+        os.path.join(directory, os.path.basename(SCALER_PATH))
+
+
+# Function to keep the artifacts served before the first update as versions/base
+def _keep_base(model):
+    directory, model_path, scaler_path = _version_paths(BASE_VERSION)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+        shutil.copy2(MODEL_PATH, model_path)
+        shutil.copy2(SCALER_PATH, scaler_path)
+        with open(os.path.join(directory, MANIFEST_NAME), "w") as f:
+            json.dump({"version": BASE_VERSION, "trees": len(model.estimators_)}, f, indent=1)
+
+
+# Function to get the default tree cap: MAX_TREES_FACTOR times the base forest
+def default_max_trees(model):
+    path = os.path.join(VERSIONS_DIR, BASE_VERSION, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path) as f:
+            return MAX_TREES_FACTOR * json.load(f)["trees"]
+    return MAX_TREES_FACTOR * len(model.estimators_)
+
+
+# Function to rebuild the derived artifacts that exist, so they match the newly published model
+def rebuild_derived(out=sys.stdout):
+    registry.clear()
+    if os.path.exists(COMPILED_PATH):
+        from spad.forest import export_compiled
+        export_compiled()
+        print(f"Rebuilt {COMPILED_PATH}", file=out)
+    if os.path.exists(COMPACT_PATH):
+        from spad.compact import export_compact
+        export_compact()
+        print(f"Rebuilt {COMPACT_PATH}", file=out)
+    if os.path.exists(CASCADE_PATH):
+        import joblib
+
+        from spad.cascade import TARGET_LOSS, tune
+        target_loss = joblib.load(CASCADE_PATH).tuning.get("target_loss", TARGET_LOSS)
+        tune(target_loss, out=out)
+
+
+def _write_manifest(directory, manifest):
+    tmp_path = os.path.join(directory, f"{MANIFEST_NAME}.tmp-{os.getpid()}")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, os.path.join(directory, MANIFEST_NAME))
+
+
+# Function to serve a model and scaler pair; the registry holds on to the old pair until both files are replaced
+def _serve_pair(model, scaler):
+    publish_artifact(model, MODEL_PATH)
+    publish_artifact(scaler, SCALER_PATH)
+
+
+# Function to publish model and scaler as a new version and serve it; rows are kept until append_pending adds them
+def publish_version(model, scaler, manifest, version=None, rows=None):
+    version = version or time.strftime("%Y%m%d-%H%M%S")
+    directory, model_path, scaler_path = _version_paths(version)
+    os.makedirs(directory, exist_ok=True)
+    setattr(model, PAIR_TAG, version)
+    setattr(scaler, PAIR_TAG, version)
+    publish_artifact(model, model_path)
+    publish_artifact(scaler, scaler_path)
+    manifest = dict(manifest, version=version)
+    if rows is not None:
+        np.savez(os.path.join(directory, ROWS_NAME), features=rows[0], labels=rows[1])
+        manifest["appended"] = False
+    _write_manifest(directory, manifest)
+
+    _serve_pair(model, scaler)
+    return version
+
+
+# Function to append the rows of published versions that are not in the training set yet; returns the rows added
+def append_pending(out=sys.stdout):
+    from spad.store import append_rows
+
+    added = 0
+    for path in sorted(glob.glob(os.path.join(VERSIONS_DIR, "*", MANIFEST_NAME))):
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest.get("appended", True):
+            continue
+        directory = os.path.dirname(path)
+        with np.load(os.path.join(directory, ROWS_NAME)) as rows:
+            features, labels = rows["features"], rows["labels"]
+        append_rows("train", features, labels)
+        manifest["appended"] = True
+        _write_manifest(directory, manifest)
+        os.remove(os.path.join(directory, ROWS_NAME))
+        print(f"Appended the {len(labels)} rows of version {manifest['version']} to the training set", file=out)
+        added += len(labels)
+    return added
+
+
+# Function to serve an earlier version again
+def rollback(version, out=sys.stdout):
+    import joblib
+
+    _, model_path, scaler_path = _version_paths(version)
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"No model version {version!r} in {VERSIONS_DIR}.")
+    _serve_pair(joblib.load(model_path), joblib.load(scaler_path))
+    print(f"Serving version {version}", file=out)
+    rebuild_derived(out)
+
+
+# Function to run one incremental update and publish it; returns the new version, or None when it was rejected
+def update(paths, label=None, trees=TREES, replay=REPLAY_ROWS, smote=False, max_drop=MAX_DROP, max_trees=None,
+           seed=None, workers=None, out=sys.stdout):
+    import joblib
+    import pandas as pd
+
+    from spad.store import open_split
+
+    # A crash after an earlier publish may have left its rows out of the training set
+    append_pending(out)
+
+    timings, start = {}, time.perf_counter()
+    applied, digests = applied_digests(), {}
+    for path in input_files(paths):
+        digest = file_digest(path)
+        if digest in applied or digest in digests.values():
+            print(f"Skipping {path}: already added", file=out)
+            continue
+        digests[path] = digest
+    if not digests:
+        print("Nothing to add: every input was added by an earlier version.", file=out)
+        return None
+    features, labels, loaded = load_new_rows(list(digests), label, workers)
+    timings["load"] = time.perf_counter() - start
+    print(f"{len(labels)} new rows: {int(np.sum(labels == 0))} spoof, {int(np.sum(labels == 1))} bona fide", file=out)
+
+    step = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    train = open_split("train")
+    replayed = rng.choice(train.num_rows, min(replay, train.num_rows), replace=False)
+    replay_X = train.matrix(FEATURE_NAMES)[np.sort(replayed)].astype(np.float64)
+    replay_y = train.column('label')[np.sort(replayed)].astype(int)
+    timings["replay"] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    old_model, old_scaler = joblib.load(MODEL_PATH), joblib.load(SCALER_PATH)
+    _keep_base(old_model)
+    max_trees = max_trees or default_max_trees(old_model)
+    val = open_split("val")
+    before = _accuracy(old_model, old_scaler, val)
+
+    scaler = updated_scaler(old_scaler, features)
+    model = rescale_thresholds(copy.deepcopy(old_model), old_scaler, scaler)
+    X = np.concatenate([replay_X, features])
+    y = np.concatenate([replay_y, labels])
+    X = scaler.transform(pd.DataFrame(X, columns=FEATURE_NAMES))
+    X, y = rebalance(X, y, rng, smote)
+    grow_forest(model, X, y, trees, int(rng.integers(2**31)))
+    retired = retire_trees(model, max_trees)
+    timings["fit"] = time.perf_counter() - step
+
+    after = _accuracy(model, scaler, val)
+    print(f"Validation accuracy: {before:.4f} -> {after:.4f} with {len(model.estimators_)} trees "
+          f"({trees} new, {retired} oldest retired, fit on {len(y)} rebalanced rows)", file=out)
+    if after < before - max_drop:
+        print(f"Not published: accuracy dropped by more than {max_drop}. Nothing was added to the training set.",
+              file=out)
+        return None
+
+    step = time.perf_counter()
+    manifest = {"new_rows": int(len(labels)), "trees": len(model.estimators_), "added_trees": trees,
+                "retired_trees": retired, "scaler_samples": int(scaler.n_samples_seen_),
+                "val_accuracy_before": before, "val_accuracy_after": after,
+                "digests": {os.path.abspath(path): digests[path] for path in loaded}}
+    version = publish_version(model, scaler, manifest, rows=(features, labels))
+    rebuild_derived(out)
+    timings["publish"] = time.perf_counter() - step
+
+    # Only a published update adds its rows; if this fails they stay pending and the next run appends them
+    step = time.perf_counter()
+    append_pending(out)
+    timings["append"] = time.perf_counter() - step
+
+    print(f"Published version {version} in {time.perf_counter() - start:.1f} s ("
+          + ", ".join(f"{name} {seconds:.1f} s" for name, seconds in timings.items()) + ")", file=out)
+    return version
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Add newly labelled clips to the model without a full retrain.")
+    parser.add_argument("paths", nargs="*", help="GTCC-MFCC CSV files, audio files, or folders named 0/1")
+    parser.add_argument("--label", type=int, choices=[0, 1], help="label every audio file with this class instead")
+    parser.add_argument("--trees", type=int, default=TREES, help="trees to add to the forest")
+    parser.add_argument("--replay", type=int, default=REPLAY_ROWS, help="existing training rows the new trees also see")
+    parser.add_argument("--smote", action="store_true", help="oversample the minority class with SMOTE (needs imblearn)")
+    parser.add_argument("--max-drop", type=float, default=MAX_DROP, help="largest validation accuracy drop to publish")
+    parser.add_argument("--max-trees", type=int,
+                        help=f"retire the oldest trees beyond this many (default {MAX_TREES_FACTOR}x the base forest)")
+    parser.add_argument("--seed", type=int, help="random seed for the replay sample and the new trees")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--rollback", metavar="VERSION", help=f"serve a version from {VERSIONS_DIR} again")
+    args = parser.parse_args(argv)
+
+    if args.rollback:
+        rollback(args.rollback)
+        return 0
+    if not args.paths:
+        parser.error("give labelled CSV files or audio to add, or --rollback VERSION")
+    version = update(args.paths, args.label, args.trees, args.replay, args.smote, args.max_drop, args.max_trees,
+                     args.seed, args.workers)
+    return 0 if version else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
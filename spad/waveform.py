@@ -0,0 +1,114 @@
+"""Min/max envelope decimation of waveforms for plotting.
+
+Plot cost should not grow with duration, so the page never sends raw samples
+for long clips. A :class:`WaveformPyramid` keeps per-bucket minima and maxima
+at several resolutions (each level 4x coarser than the one below, built with
+vectorised reshapes), and :meth:`WaveformPyramid.view` returns the finest
+level that fits in a few thousand points for whatever time range is shown.
+Long clips do not keep a one-sample level, so a view narrow enough to show
+single samples reads them through an optional ``read_window`` callback
+(the page decodes that window of the upload again).
+"""
+import numpy as np
+
+MAX_POINTS = 4000
+LEVEL_FACTOR = 4
+# The finest stored level never holds more buckets than this
+MAX_BASE_BUCKETS = 1 << 20
+
+
+def _pad_to_multiple(values, size):
+    remainder = -len(values) % size
+    return np.pad(values, (0, remainder), mode="edge") if remainder else values
+
+
+# Function to reduce a signal to per-bucket minima and maxima
+def minmax_envelope(y, bucket):
+    blocks = _pad_to_multiple(np.asarray(y, dtype=np.float32), bucket).reshape(-1, bucket)
+    return blocks.min(axis=1), blocks.max(axis=1)
+
+
+class WaveformPyramid:
+    """ Multi-resolution min/max envelopes of one signal """
+
+    def __init__(self, y, sample_rate, max_points=MAX_POINTS):
+        y = np.asarray(y, dtype=np.float32)
+        self.sample_rate = sample_rate
+        self.num_samples = len(y)
+        self.max_points = max_points
+        self.raw = y if len(y) <= max_points else None
+
+        # Finest level: buckets of base_bucket samples, a power of LEVEL_FACTOR
+        self.base_bucket = 1
+        while len(y) / self.base_bucket > MAX_BASE_BUCKETS:
+            self.base_bucket *= LEVEL_FACTOR
+
+        self.levels = []
+        mins, maxs = minmax_envelope(y, self.base_bucket) if len(y) else (y, y)
+        bucket = self.base_bucket
+        while True:
+            self.levels.append((bucket, mins, maxs))
+            if len(mins) <= max_points // 2:
+                break
+            mins = _pad_to_multiple(mins, LEVEL_FACTOR).reshape(-1, LEVEL_FACTOR).min(axis=1)
+            maxs = _pad_to_multiple(maxs, LEVEL_FACTOR).reshape(-1, LEVEL_FACTOR).max(axis=1)
+            bucket *= LEVEL_FACTOR
+
+    @property
+    def duration(self):
+        return self.num_samples / self.sample_rate
+
+    def view(self, start=0.0, end=None, max_points=None, read_window=None):
+        """ Returns (time, amplitude) for [start, end) seconds in at most max_points points
+
+        read_window(first, last), if given, returns samples [first, last) when no stored level is fine enough
+        """
+        max_points = max_points or self.max_points
+        end = self.duration if end is None else min(end, self.duration)
+        first = max(0, int(start * self.sample_rate))
+        last = max(first, int(np.ceil(end * self.sample_rate)))
+
+        if self.raw is not None:
+            values = self.raw[first:last]
+            return np.arange(first, first + len(values)) / self.sample_rate, values
+        if read_window is not None and self.base_bucket > 1 and (last - first) // self.base_bucket < max_points // 2:
+            # The finest stored level under-resolves this range: decode it and use finer buckets
+            values = np.asarray(read_window(first, last), dtype=np.float32)[:last - first]
+            if len(values) <= max_points:
+                return np.arange(first, first + len(values)) / self.sample_rate, values
+            bucket = 1
+            while len(values) / bucket > max_points // 2:
+                bucket *= LEVEL_FACTOR
+            mins, maxs = minmax_envelope(values, bucket)
+            times = np.repeat(first / self.sample_rate + np.arange(len(mins)) * bucket / self.sample_rate, 2)
+            return times, np.column_stack([mins, maxs]).ravel()
+
+        # Finest level that fits; level 0 with one-sample buckets holds the samples themselves
+        for bucket, mins, maxs in self.levels:
+            lo, hi = first // bucket, min(len(mins), -(-last // bucket))
+            if bucket == 1 and hi - lo <= max_points:
+                return np.arange(lo, hi) / self.sample_rate, mins[lo:hi]
+            if hi - lo <= max_points // 2:
+                break
+
+        times = np.repeat(np.arange(lo, hi) * bucket / self.sample_rate, 2)
+        amplitude = np.column_stack([mins[lo:hi], maxs[lo:hi]]).ravel()
+        return times, amplitude
+
+    def nbytes(self):
+        size = sum(mins.nbytes + maxs.nbytes for _, mins, maxs in self.levels)
+        return size + (self.raw.nbytes if self.raw is not None else 0)
+
+
+# Function to summarise a decoded waveform for plotting and caching
+def summarize_waveform(audio_data, sample_rate, max_points=MAX_POINTS):
+    audio_data = np.asarray(audio_data, dtype=np.float32)
+    has_audio = len(audio_data) > 0
+    return {
+        "sample_rate": sample_rate,
+        "num_samples": len(audio_data),
+        "duration": len(audio_data) / sample_rate,
+        "peak": float(np.max(np.abs(audio_data))) if has_audio else 0.0,
+        "rms": float(np.sqrt(np.mean(np.square(audio_data)))) if has_audio else 0.0,
+        "pyramid": WaveformPyramid(audio_data, sample_rate, max_points),
+    }
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from spad.forest import fold_thresholds
+
+
+# Fixture: a small forest and scaler fit on synthetic data, and raw rows that sit exactly on its split boundaries
+@pytest.fixture(scope="session")
+def small_forest():
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(loc=[0, 5, -3, 100, 0.01, 1e4], scale=[1, 2, 0.5, 30, 0.001, 5e3], size=(600, 6))
+    y = (X[:, 0] + (X[:, 1] - 5) / 2 + rng.normal(scale=0.5, size=len(X)) > 0).astype(int)
+    scaler = StandardScaler().fit(X)
+    model = RandomForestClassifier(n_estimators=15, max_depth=8, random_state=0).fit(scaler.transform(X), y)
+
+    # For a sample of split nodes: the largest raw value sent left and the smallest sent right
+    rows = []
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        split = np.flatnonzero(tree.children_left != -1)
+        for node in rng.choice(split, min(10, len(split)), replace=False):
+            feature = tree.feature[node]
+            cut = fold_thresholds(tree.threshold[node:node + 1], scaler.mean_[feature], scaler.scale_[feature])[0]
+            for value in (cut, np.nextafter(cut, np.inf)):
+                row = X[rng.integers(len(X))].copy()
+                row[feature] = value
+                rows.append(row)
+    return model, scaler, np.concatenate([X, np.array(rows)])
@@ -0,0 +1,25 @@
+import os
+
+import spad.cache
+from spad.cache import result_key
+
+
+def test_result_key_follows_the_cascade_only_when_screening(tmp_path, monkeypatch):
+    cascade_path = tmp_path / "Cascade"
+    cascade_path.write_bytes(b"band 0.2-0.8")
+    monkeypatch.setattr(spad.cache, "CASCADE_PATH", str(cascade_path))
+
+    monkeypatch.delenv("SPAD_CASCADE", raising=False)
+    unscreened = result_key(b"audio")
+    monkeypatch.setenv("SPAD_CASCADE", "1")
+    screened = result_key(b"audio")
+    assert screened != unscreened
+
+    # A retuned band is a new file
+    cascade_path.write_bytes(b"band 0.3-0.7")
+    stat = os.stat(cascade_path)
+    os.utime(cascade_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert result_key(b"audio") != screened
+
+    monkeypatch.delenv("SPAD_CASCADE")
+    assert result_key(b"audio") == unscreened
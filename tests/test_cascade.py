@@ -0,0 +1,22 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from spad.cascade import complete_features, screen_frames
+from spad.features import SAMPLE_RATE, extract_hybrid_features, load_audio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES = sorted(glob.glob(os.path.join(ROOT, "audio_sample", "*.wav")))
+
+
+@pytest.mark.parametrize("path", SAMPLES, ids=os.path.basename)
+def test_escalated_features_equal_the_full_extraction(path):
+    y, sr = load_audio(path)
+    np.testing.assert_array_equal(complete_features(*screen_frames(y, sr), sr), extract_hybrid_features(y, sr))
+
+
+def test_escalated_features_equal_the_full_extraction_on_noise():
+    y = np.random.default_rng(0).standard_normal(SAMPLE_RATE // 2) * 0.1
+    np.testing.assert_array_equal(complete_features(*screen_frames(y)), extract_hybrid_features(y))
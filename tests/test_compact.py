@@ -0,0 +1,35 @@
+import copy
+
+import numpy as np
+import pytest
+
+from spad.compact import compact_forest
+
+
+# Function to give both leaves under some splits the same values, so pruning has subtrees to drop
+def _with_uniform_subtrees(model):
+    model = copy.deepcopy(model)
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        left, right = tree.children_left, tree.children_right
+        for node in np.flatnonzero(left != -1)[::2]:
+            if left[left[node]] == -1 and left[right[node]] == -1:
+                tree.value[right[node]] = tree.value[left[node]]
+    return model
+
+
+@pytest.mark.parametrize("prune", [False, True], ids=["full", "pruned"])
+def test_compact_forest_matches_sklearn_bit_for_bit(small_forest, prune):
+    model, scaler, X = small_forest
+    model = _with_uniform_subtrees(model)
+    compact = compact_forest(model, scaler, prune=prune)
+
+    expected = model.predict_proba(scaler.transform(X))
+    np.testing.assert_array_equal(compact.predict_proba(X), expected)
+    np.testing.assert_array_equal(compact.predict(X), model.predict(scaler.transform(X)))
+
+
+def test_pruning_drops_uniform_subtrees(small_forest):
+    model, scaler, _ = small_forest
+    model = _with_uniform_subtrees(model)
+    assert len(compact_forest(model, scaler, prune=True).feature) < len(compact_forest(model, scaler).feature)
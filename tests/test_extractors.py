@@ -0,0 +1,28 @@
+import time
+
+import numpy as np
+
+from spad.extractors import ExtractorPool
+
+
+def _wait_until_running(pool, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not pool._running:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_worker_start_up_does_not_count_against_the_job_timeout(tmp_path):
+    audio_path = str(tmp_path / "clip.wav")
+    pool = ExtractorPool("stub", size=1, job_timeout=0.5, timeout_per_audio_second=0, delay=0.2, start_delay=1.5)
+    try:
+        assert np.asarray(pool.submit(audio_path).result(timeout=30)).shape == (1, 81)
+
+        # Cancelling a running job replaces its worker, which warms up again before the next job
+        future = pool.submit(audio_path)
+        _wait_until_running(pool)
+        assert pool.cancel(future)
+        assert np.asarray(pool.submit(audio_path).result(timeout=30)).shape == (1, 81)
+        assert pool.restarts == 1
+    finally:
+        pool.close()
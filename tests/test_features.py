@@ -0,0 +1,59 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from spad.features import NUM_FEATURES, PINNED_PATH, REFERENCE_PATH, extract_features_from_file
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REFERENCE = os.path.join(ROOT, REFERENCE_PATH)
+PINNED = os.path.join(ROOT, PINNED_PATH)
+SAMPLES = sorted(glob.glob(os.path.join(ROOT, "audio_sample", "*.wav")))
+# Allows for FFT and BLAS rounding across platforms; any change to the extractor itself is far larger
+PINNED_RTOL, PINNED_ATOL = 1e-7, 1e-10
+
+
+def _rows(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [line.strip().split(",") for line in f if line.strip()]
+
+
+def _reference_rows():
+    return _rows(REFERENCE)
+
+
+@pytest.mark.skipif(not os.path.exists(REFERENCE),
+                    reason=f"{REFERENCE_PATH} not found; generate it with --write-reference on a MATLAB host")
+@pytest.mark.parametrize("row", _reference_rows(), ids=lambda row: row[0])
+def test_matches_matlab_reference(row):
+    name, *values = row
+    expected = np.array(values, dtype=np.float64)
+    actual = extract_features_from_file(os.path.join(os.path.dirname(REFERENCE), name)).ravel()
+    np.testing.assert_allclose(actual, expected, rtol=1e-3, atol=1e-4)
+
+
+# Until MATLAB reference vectors are committed, the native output is pinned (python -m spad.features --write-pinned)
+@pytest.mark.parametrize("row", _rows(PINNED), ids=lambda row: row[0])
+def test_matches_pinned_native_vectors(row):
+    name, *values = row
+    expected = np.array(values, dtype=np.float64)
+    actual = extract_features_from_file(os.path.join(ROOT, "audio_sample", name)).ravel()
+    np.testing.assert_allclose(actual, expected, rtol=PINNED_RTOL, atol=PINNED_ATOL)
+
+
+def test_every_sample_is_pinned():
+    assert sorted(row[0] for row in _rows(PINNED)) == [os.path.basename(path) for path in SAMPLES]
+
+
+@pytest.mark.parametrize("path", SAMPLES, ids=os.path.basename)
+def test_samples_fall_in_the_scaler_range(path):
+    joblib = pytest.importorskip("joblib")
+    scaler = joblib.load(os.path.join(ROOT, "model", "Scaler"))
+    features = extract_features_from_file(path)
+    assert features.shape == (1, NUM_FEATURES)
+    assert np.all(np.isfinite(features))
+    # Far outside the training distribution would mean the model no longer applies
+    assert np.all(np.abs(scaler.transform(features)) < 10)
@@ -0,0 +1,35 @@
+import os
+
+import numpy as np
+
+import spad.forest
+from spad.forest import compile_forest, get_compiled_forest
+from spad.models import publish_artifact
+
+
+def test_compiled_forest_matches_sklearn(small_forest):
+    model, scaler, X = small_forest
+    compiled = compile_forest(model, scaler)
+
+    expected = model.predict_proba(scaler.transform(X))
+    np.testing.assert_array_equal(compiled.predict_proba(X), expected)
+    np.testing.assert_array_equal(compiled.predict(X), model.predict(scaler.transform(X)))
+
+
+def test_compiled_forest_is_ignored_once_the_model_changes(small_forest, tmp_path, monkeypatch):
+    model, scaler, _ = small_forest
+    model_path, scaler_path = str(tmp_path / "RandomForestClassifier"), str(tmp_path / "Scaler")
+    compiled_path = str(tmp_path / "CompiledForest")
+    monkeypatch.setattr(spad.forest, "MODEL_PATH", model_path)
+    monkeypatch.setattr(spad.forest, "SCALER_PATH", scaler_path)
+    publish_artifact(model, model_path)
+    publish_artifact(scaler, scaler_path)
+    publish_artifact(compile_forest(model, scaler, source=spad.forest._source_versions()), compiled_path)
+
+    assert get_compiled_forest(compiled_path) is not None
+
+    publish_artifact(model, model_path)
+    stat = os.stat(model_path)
+    os.utime(model_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert get_compiled_forest(compiled_path) is None
+    assert get_compiled_forest(str(tmp_path / "missing")) is None
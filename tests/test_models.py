@@ -0,0 +1,48 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import spad.models
+from spad.models import PAIR_TAG, ModelRegistry, publish_artifact
+
+
+def _tagged(name, version):
+    obj = SimpleNamespace(name=name)
+    setattr(obj, PAIR_TAG, version)
+    return obj
+
+
+def _bump_mtime(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def test_pair_keeps_the_old_pair_until_both_files_are_replaced(tmp_path):
+    scaler_path, model_path = str(tmp_path / "Scaler"), str(tmp_path / "RandomForestClassifier")
+    publish_artifact(_tagged("scaler", "v1"), scaler_path)
+    publish_artifact(_tagged("model", "v1"), model_path)
+    registry = ModelRegistry(check_interval=0)
+    scaler, model = registry.get_pair(scaler_path, model_path)
+    assert (getattr(scaler, PAIR_TAG), getattr(model, PAIR_TAG)) == ("v1", "v1")
+
+    # The model is published first; the scaler has not followed yet
+    publish_artifact(_tagged("model", "v2"), model_path)
+    _bump_mtime(model_path)
+    scaler, model = registry.get_pair(scaler_path, model_path)
+    assert (getattr(scaler, PAIR_TAG), getattr(model, PAIR_TAG)) == ("v1", "v1")
+
+    publish_artifact(_tagged("scaler", "v2"), scaler_path)
+    _bump_mtime(scaler_path)
+    scaler, model = registry.get_pair(scaler_path, model_path)
+    assert (getattr(scaler, PAIR_TAG), getattr(model, PAIR_TAG)) == ("v2", "v2")
+
+
+def test_pair_without_a_matching_pair_raises(tmp_path, monkeypatch):
+    monkeypatch.setattr(spad.models, "PAIR_RETRY_WAIT", 0)
+    scaler_path, model_path = str(tmp_path / "Scaler"), str(tmp_path / "RandomForestClassifier")
+    publish_artifact(_tagged("scaler", "v1"), scaler_path)
+    publish_artifact(_tagged("model", "v2"), model_path)
+
+    with pytest.raises(RuntimeError):
+        ModelRegistry(check_interval=0).get_pair(scaler_path, model_path)
@@ -0,0 +1,55 @@
+import json
+import os
+
+from spad.trainset import FEATURE_SETS, MANIFEST_NAME, ShardWriter, reconcile_shards, shard_path
+
+
+def _write(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_reconcile_without_manifest_drops_unrecorded_rows(tmp_path):
+    output = str(tmp_path)
+    for feature_set in FEATURE_SETS:
+        _write(shard_path(output, feature_set, "train", 0), "1,2,3,0\n4,5")
+    _write(shard_path(output, "GTCC", "train", 1), "6,7,8,1\n")
+
+    completed, shard, rows = reconcile_shards(output, "train")
+
+    assert (completed, shard, rows) == (set(), 0, 0)
+    for feature_set in FEATURE_SETS:
+        assert _read(shard_path(output, feature_set, "train", 0)) == ""
+    assert not os.path.exists(shard_path(output, "GTCC", "train", 1))
+
+
+def test_reconcile_keeps_recorded_rows_and_cuts_partial_ones(tmp_path):
+    output = str(tmp_path)
+    _write(os.path.join(output, MANIFEST_NAME),
+           json.dumps({"path": "a.wav", "split": "train", "shard": 0, "label": 0}) + "\n")
+    for feature_set in FEATURE_SETS:
+        _write(shard_path(output, feature_set, "train", 0), "1,2,3,0\n4,5")
+
+    completed, shard, rows = reconcile_shards(output, "train")
+
+    assert (completed, shard, rows) == ({"a.wav"}, 0, 1)
+    for feature_set in FEATURE_SETS:
+        assert _read(shard_path(output, feature_set, "train", 0)) == "1,2,3,0\n"
+
+
+def test_writer_resumes_after_crash_before_first_manifest_line(tmp_path):
+    output = str(tmp_path)
+    for feature_set in FEATURE_SETS:
+        _write(shard_path(output, feature_set, "train", 0), "4,5")
+
+    writer = ShardWriter(output, "train")
+    writer.write({"path": "a.wav", "label": 1, "rows": {feature_set: [0.5, 1.5] for feature_set in FEATURE_SETS}})
+    writer.close()
+
+    for feature_set in FEATURE_SETS:
+        assert _read(shard_path(output, feature_set, "train", 0)) == "0.5,1.5,1\n"